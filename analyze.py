@@ -1,13 +1,22 @@
 import os
-import google.generativeai as genai
+import sys
+import argparse
+import functools
 import time
+import telemetry
+from backends import get_backend
+from upload_cache import UploadCache, file_sha256
+from report_cache import ReportCache, report_fingerprint
+from pipeline import upload_one, upload_many
+from poller import StatusPoller
+from preprocess import PROXY_PROFILE, collect_media, preprocess_video
+from batch import format_metrics, format_summary, load_batch_items, run_batch
+from reel_fetch import FETCH_SOURCE, fetch_reels, make_source, parse_reel_refs
 
 # --- Configuration ---
-# IMPORTANT: Store your API key securely.
-# For this script, we'll get it from an environment variable.
-# In your terminal, run: export GOOGLE_API_KEY="YOUR_API_KEY_HERE"
-# On Windows, use: set GOOGLE_API_KEY="YOUR_API_KEY_HERE"
-genai.configure(api_key=os.environ["GOOGLE_API_KEY"])
+ANALYSIS_MODEL = "gemini-1.5-flash" # Using 1.5-flash for speed and cost-effectiveness
+# Bump whenever create_analysis_prompt changes, so cached analyses built from the old prompt are not reused.
+ANALYSIS_PROMPT_VERSION = "1"
 
 # --- Helper Function to Create the Prompt ---
 def create_analysis_prompt(metrics):
@@ -47,40 +56,133 @@ def create_analysis_prompt(metrics):
     """
 
 # --- Main Analysis Function ---
-def analyze_reel(video_path, metrics):
-    """Uploads the video and gets the analysis from Gemini."""
-    print("Uploading file...")
-    # The Gemini API requires you to upload the file first.
-    video_file = genai.upload_file(path=video_path)
-    print(f"Completed upload: {video_file.name}")
+# Each analysis is its own telemetry run, so its stages are grouped in the JSONL log.
+@telemetry.timed("analyze_reel", new_run=True)
+def analyze_reel(video_path, metrics, force_refresh=False, preprocess=False, hook_clip=False):
+    """
+    Uploads the video and gets the analysis from Gemini. Reuses a cached analysis of the same inputs unless `force_refresh`.
+    With `preprocess`, a small ffmpeg proxy is uploaded instead of the original; `hook_clip` also sends the first 3 seconds.
+    """
+    with telemetry.span("hash", file=os.path.basename(video_path)):
+        digest = file_sha256(video_path)
+    media = (PROXY_PROFILE + ("+hook" if hook_clip else "")) if preprocess else "original"
+    report_cache = ReportCache()
+    report_key = report_fingerprint(video=digest, media=media, metrics=metrics.strip(), model=ANALYSIS_MODEL, prompt_version=ANALYSIS_PROMPT_VERSION)
+    if not force_refresh:
+        cached_analysis = report_cache.get(report_key)
+        if cached_analysis is not None:
+            print("Found a cached analysis for this video and metrics.")
+            return cached_analysis
+
+    # Optionally shrink the upload first: a 720p proxy (and hook clip) instead of the full-resolution master.
+    uploads = [(video_path, digest)]
+    if preprocess:
+        prepared = preprocess_video(video_path, digest, make_hook=hook_clip)
+        uploads = [(prepared["proxy_path"], prepared["proxy_key"])]
+        if prepared["hook_path"]:
+            uploads.append((prepared["hook_path"], prepared["hook_key"]))
+        print(f"Preprocessing saved {prepared['bytes_saved'] / 1e6:,.1f} MB ({prepared['original_bytes'] / 1e6:,.1f} MB -> {prepared['proxy_bytes'] / 1e6:,.1f} MB).")
 
-    # Wait for the file to be processed
-    while video_file.state.name == "PROCESSING":
+    print("Uploading file...")
+    # The Gemini API requires you to upload the file first. The upload cache reuses a
+    # still-live remote copy when this exact video was uploaded before.
+    upload_cache = UploadCache()
+    upload_cache.collect_garbage()
+    outcomes = upload_many(uploads, lambda upload: upload_one(upload[0], upload_cache, digest=upload[1]))
+    if outcomes[0]["error"]:
+        raise outcomes[0]["error"]
+    remote_files = [outcome["result"]["remote_file"] for outcome in outcomes if outcome["error"] is None]
+    print(f"Completed upload: {remote_files[0].name} ({outcomes[0]['elapsed']:.1f}s)")
+
+    # Wait for the file to be processed. The poller starts with a short, size-based interval
+    # and backs off exponentially, so short clips don't sit through a fixed 10 second sleep.
+    if any(f.state.name == "PROCESSING" for f in remote_files):
         print("Waiting for video processing...")
-        time.sleep(10)
-        video_file = genai.get_file(video_file.name)
-
+        with telemetry.span("remote_processing", files=len(remote_files)) as record:
+            poller = StatusPoller({f.name: {"size": getattr(f, "size_bytes", 0), "state": f.state.name} for f in remote_files})
+            states = poller.wait()
+            record["polls"] = poller.api_calls
+        if states[remote_files[0].name] != "ACTIVE":
+            upload_cache.invalidate(uploads[0][1])
+            raise ValueError("Video processing failed.")
+        # A hook clip that failed (or vanished) is simply left out.
+        remote_files = [get_backend().get_file(name=f.name) for f in remote_files if states[f.name] == "ACTIVE"]
+
+    video_file = remote_files[0]
     if video_file.state.name == "FAILED":
+        upload_cache.invalidate(uploads[0][1])
         raise ValueError("Video processing failed.")
 
     print("Making API call to Gemini...")
     # Select the vision model
-    model = genai.GenerativeModel(model_name="gemini-1.5-flash") # Using 1.5-flash for speed and cost-effectiveness
+    model = get_backend().model(ANALYSIS_MODEL)
 
     # Create the prompt
     prompt = create_analysis_prompt(metrics)
 
-    # Send the prompt and video to the model
-    response = model.generate_content([prompt, video_file])
+    # Send the prompt and video to the model (plus the hook clip, if there is a usable one)
+    prompt_parts = [prompt, video_file]
+    if len(remote_files) > 1 and remote_files[1].state.name == "ACTIVE":
+        prompt_parts += ["**Hook clip (the video's first 3 seconds, for the Hook Analysis):**", remote_files[1]]
+    with telemetry.span("generate", model=ANALYSIS_MODEL):
+        response = model.generate_content(prompt_parts)
+        telemetry.add_usage(response, ANALYSIS_MODEL)
 
-    # Clean up the uploaded file
-    genai.delete_file(video_file.name)
-    print("Cleaned up uploaded file.")
+    report_cache.put(report_key, response.text, meta={"video_path": video_path, "model": ANALYSIS_MODEL})
 
+    # The uploaded file is kept in the upload cache for the next run; expired copies are
+    # cleaned up by the cache's garbage collector.
     return response.text
 
 # --- How to run the script ---
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Analyze Instagram Reels with Gemini.")
+    parser.add_argument("--batch", metavar="SOURCE", help="Batch mode: a folder of videos, or a CSV/JSONL manifest of (video path, metrics).")
+    parser.add_argument("--reels", nargs="+", metavar="REF", help="Batch mode: download these reels first (shortcodes, reel URLs, @profiles, or text files listing them) and use their views, likes and comments as metrics.")
+    parser.add_argument("--reel-source", default=FETCH_SOURCE, help="With --reels: 'instagram', or the base URL of a JSON stand-in.")
+    parser.add_argument("--output", default="results.jsonl", help="Batch mode: JSONL results file. Re-running skips reels already in it.")
+    parser.add_argument("--workers", type=int, default=4, help="Batch mode: number of reels analyzed at once.")
+    parser.add_argument("--rpm", type=float, default=30, help="Batch mode: maximum analyses started per minute, across all workers.")
+    parser.add_argument("--force-refresh", action="store_true", help="Ignore cached analyses.")
+    parser.add_argument("--proxy", action="store_true", help="Transcode to a small 720p proxy with ffmpeg before uploading.")
+    parser.add_argument("--hook-clip", action="store_true", help="With --proxy, also upload the first 3 seconds as a separate hook clip.")
+    args = parser.parse_args()
+
+    # IMPORTANT: Store your API key securely.
+    # For this script, we'll get it from an environment variable.
+    # In your terminal, run: export GOOGLE_API_KEY="YOUR_API_KEY_HERE"
+    # On Windows, use: set GOOGLE_API_KEY="YOUR_API_KEY_HERE"
+    # (Configured here, after the arguments are parsed, so app.py can import the prompt helpers and --help works without a key.)
+    # (Not needed with REEL_BACKEND=fake, which runs everything locally.)
+    if get_backend().requires_api_key:
+        if not os.environ.get("GOOGLE_API_KEY"):
+            parser.error("GOOGLE_API_KEY is not set (or run with REEL_BACKEND=fake).")
+        get_backend().configure(api_key=os.environ["GOOGLE_API_KEY"])
+    telemetry.start_metrics_server()  # Only when REEL_METRICS_PORT is set.
+    if args.proxy:
+        collect_media()  # Without a worker's maintenance loop, old proxies are pruned here.
+
+    # Batch mode: score a whole folder, manifest or list of reels, resumably, then print a throughput summary.
+    if args.batch or args.reels:
+        items = load_batch_items(args.batch) if args.batch else []
+        if args.reels:
+            print("Fetching reels...")
+            outcomes = fetch_reels(parse_reel_refs(args.reels, allow_files=True), make_source(args.reel_source),
+                                   on_progress=lambda done, total, outcome: print(f"[{done}/{total}] {outcome['item']}: " + (f"error: {outcome['error']}" if outcome["error"] else "cached" if outcome["result"].from_cache else "downloaded")))
+            for outcome in outcomes:
+                if outcome["item"].startswith("@"):
+                    print(f"{outcome['item']}: error: {outcome['error']}")
+            fetched = [outcome["result"] for outcome in outcomes if outcome["error"] is None]
+            items += [{"id": f"instagram:{reel.shortcode}", "video_path": reel.path, "metrics": format_metrics(reel.kpis)} for reel in fetched]
+        print(f"Analyzing {len(items)} reels with {args.workers} workers (max {args.rpm:g}/min)...")
+        summary = run_batch(
+            items, functools.partial(analyze_reel, preprocess=args.proxy, hook_clip=args.hook_clip), args.output, workers=args.workers, rate_per_minute=args.rpm, force_refresh=args.force_refresh,
+            on_result=lambda done, total, entry: print(f"[{done}/{total}] {entry['status']}: {entry['video_path']} ({entry['latency_s']:.1f}s)"),
+        )
+        print("\n--- BATCH SUMMARY ---")
+        print(format_summary(summary))
+        sys.exit(1 if summary["failed"] else 0)
+
     # 1. Place your video file in the same folder and update the name here.
     video_file_name = "your_reel.mp4" 
     
@@ -98,7 +200,7 @@ if __name__ == "__main__":
         print("Please place the video in the same folder as the script and update the 'video_file_name' variable.")
     else:
         try:
-            analysis_result = analyze_reel(video_file_name, video_metrics)
+            analysis_result = analyze_reel(video_file_name, video_metrics, force_refresh=args.force_refresh, preprocess=args.proxy, hook_clip=args.hook_clip)
             print("\n--- REEL ANALYSIS RESULT ---")
             print(analysis_result)
         except Exception as e:
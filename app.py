@@ -5,13 +5,24 @@
 # ===================================================================================
 import os
 import io
-import re
-import json
-import google.generativeai as genai
 import streamlit as st
 import pandas as pd
-import tempfile
 import time
+import uuid
+import altair as alt
+import telemetry
+from backends import get_backend
+from pipeline import fileobj_sha256, spool_to_dir
+from report_cache import ReportCache
+from report_stream import IncrementalReportParser
+from report_model import extract_scorecard_structured, parse_report
+from kpi_engine import kpi_frame_from_dict, kpi_records, load_kpi_csv
+from chat_session import ReportChat
+from preprocess import PROXY_PROFILE, ffmpeg_available
+from campaign_analysis import MAP_MODEL, MAP_REDUCE_THRESHOLD, campaign_report_key, use_map_reduce
+from jobs import SPOOL_DIR, JobStore
+from worker import Worker
+from reel_fetch import FetchedReel, fetch_reels, make_source, parse_reel_refs
 
 # --- 1. PAGE CONFIG & STYLING (MUST BE FIRST) ---
 st.set_page_config(
@@ -47,68 +58,101 @@ st.title("🎬 AI Campaign Strategist")
 st.markdown("##### Upload your campaign videos and metrics to get an expert-level report on what creative works... and *why*.")
 
 # --- Secret & API Configuration ---
-try:
-    genai.configure(api_key=st.secrets["GOOGLE_API_KEY"])
-except (TypeError, KeyError):
-    st.error("🚨 A required GOOGLE_API_KEY secret is missing!", icon="❗")
-    st.stop()
-
-# --- AI PROMPT ENGINEERING 5.0 (Scaling Logic) ---
-def create_comprehensive_analysis_prompt(all_kpi_data, funnel_stage):
-    priority_metrics = {
-        "Awareness": "impressions, high Video View Rate, and low CPM",
-        "Traffic": "high Click-Through Rate (CTR) and low Cost Per Click (CPC)",
-        "Conversion": "high Return On Ad Spend (ROAS), high number of Purchases/Leads, and low Cost Per Acquisition (CPA)"
-    }
-    video_data_string = ""
-    for filename, kpis in all_kpi_data.items():
-        kpi_string = ", ".join([f"{k}: {v}" for k, v in kpis.items()])
-        video_data_string += f"- **Video File:** `{filename}`\n  - **Performance Metrics:** {kpi_string}\n\n"
-
-    return f"""
-    You are a world-class digital marketing and creative strategist. Your analysis must be nuanced and reflect real-world performance marketing principles.
-
-    **Primary Goal:** Analyze the provided video files and performance metrics for a '{funnel_stage}' campaign to identify winning creative strategies.
-
-    **Nuanced Performance Analysis (VERY IMPORTANT):**
-    You must understand the concept of **"scaling."** A video that achieves a high spend and high volume of desired actions (like clicks or purchases) has proven its ability to scale.
-    - **Do not automatically penalize a video for a slightly higher efficiency metric (like CPC or CPA) if it has significantly higher spend and volume.**
-    - For example, a video with $5,000 spend and a $1.50 CPC is often **more valuable** than a video with $50 spend and a $1.00 CPC, because the former has proven it works with a large budget.
-    - Mention this "ability to scale" in your ranking justification when relevant.
-
-    **Campaign Data:**
-    ---
-    {video_data_string}
-    ---
+# (REEL_BACKEND=fake runs everything against a local simulation and needs no key.)
+if get_backend().requires_api_key:
+    try:
+        get_backend().configure(api_key=st.secrets["GOOGLE_API_KEY"])
+    except (TypeError, KeyError):
+        st.error("🚨 A required GOOGLE_API_KEY secret is missing!", icon="❗")
+        st.stop()
+
+# How often the processing status view re-runs itself to pick up the job's progress.
+STATUS_REFRESH_SECONDS = 2
 
-    **Your Comprehensive Task:**
-    Generate a final strategic report with FIVE sections.
+# Whether this server process also runs queued jobs itself: "auto" (only when no dedicated
+# `python worker.py` is alive), "1" (always) or "0" (never; jobs wait for external workers).
+EMBEDDED_WORKER = os.environ.get("REEL_EMBEDDED_WORKER", "auto")
+
+# --- KPI Ingestion ---
+def load_campaign_kpis(session_state_key, kpi_csv_file, filenames):
+    """
+    Parses the metrics CSV once per (file, uploaded videos) pair and keeps the result in session state,
+    so reruns don't re-read a 100k+ row export. Returns {filename: {kpi: display value}}.
+    """
+    cache_key = (getattr(kpi_csv_file, "file_id", kpi_csv_file.name), kpi_csv_file.size, tuple(sorted(filenames)))
+    cached = st.session_state[session_state_key].get("kpi_csv_cache")
+    if cached is None or cached[0] != cache_key:
+        cached = (cache_key, kpi_records(load_kpi_csv(kpi_csv_file, filenames)))
+        st.session_state[session_state_key]["kpi_csv_cache"] = cached
+    return cached[1]
 
-    **IMPORTANT FORMATTING INSTRUCTION:**
-    For Section 1, "Campaign Performance Scorecard," you MUST provide the output as a single, valid JSON array of objects. Each object needs three keys: "rank" (integer), "video_name" (string), and "justification" (string). Enclose the entire JSON block in ```json ... ```.
+# --- Reel Ingestion ---
+@st.cache_resource
+def get_reel_source():
+    # One instaloader context (and its login session) per server process.
+    return make_source()
 
-    For all other sections, use standard H3 markdown headers (e.g., ### 2. Section Name).
+def fetch_campaign_reels(session_state_key, refs_text):
+    """Downloads the reels (or profiles' reels) listed in `refs_text` and adds them to the session's videos."""
+    refs = parse_reel_refs([refs_text])
+    progress = st.progress(0.0, text=f"Fetching {len(refs)} reels and profiles...")
+    outcomes = fetch_reels(refs, get_reel_source(), on_progress=lambda done, total, outcome: progress.progress(done / total, text=f"Fetched {done} of {total} reels"))
+    fetched = {reel.name: reel for reel in st.session_state[session_state_key]["fetched_reels"]}
+    fetched.update({outcome["result"].name: outcome["result"] for outcome in outcomes if outcome["error"] is None})
+    st.session_state[session_state_key]["fetched_reels"] = list(fetched.values())
+    return [f"{outcome['item']}: {outcome['error']}" for outcome in outcomes if outcome["error"] is not None]
 
-    **SECTION 1: CAMPAIGN PERFORMANCE SCORECARD (JSON ARRAY)**
-    ```json
-    [
-      {{"rank": 1, "video_name": "example_video_1.mp4", "justification": "This video ranked first due to its outstanding ROAS of 7.2, directly aligning with the conversion goal. The clear product shot in the first 3 seconds likely drove this performance."}},
-      {{"rank": 2, "video_name": "example_video_2.mp4", "justification": "While having a slightly higher CPA, this ad proved its ability to scale by handling over $5,000 in spend while maintaining a strong 4.5 ROAS. This makes it a highly valuable creative."}}
-    ]
-    ```
+# --- Shared Report Cache ---
+@st.cache_resource
+def get_report_cache():
+    return ReportCache()
 
-    ### 2. Common Themes in Top Performers
-    (Your analysis here...)
+# --- Job Queue ---
+# Uploads, processing and report generation run as jobs outside the script thread, so a browser
+# refresh or a rerun never loses an analysis and any app process on this host can serve any job's result.
+@st.cache_resource
+def get_job_store():
+    return JobStore()
 
-    ### 3. Actionable Recommendations
-    (Your analysis here...)
+@st.cache_resource
+def start_embedded_worker():
+    return Worker(get_job_store()).start()
 
-    ### 4. New Creative Ideas (Ad Scripts)
-    (Your analysis here...)
+def get_job_worker():
+    # Decided on every render rather than cached: if the dedicated workers die, the next render starts
+    # the embedded one instead of leaving jobs queued forever. Once started, it runs for the process's life.
+    if EMBEDDED_WORKER == "0" or (EMBEDDED_WORKER == "auto" and get_job_store().live_workers()):
+        return None
+    return start_embedded_worker()
 
-    ### 5. Suggested Ad Copy
-    (Your analysis here...)
+def submit_campaign_job(session_state_key, funnel_stage, files, kpis, **options):
     """
+    Spools the videos where workers can read them, queues the analysis and remembers the job id in the
+    session and the URL. `options` (map_reduce, force_refresh, preprocess, hook_clip, media, ...) go into the payload.
+    """
+    # The job id is also the telemetry run id, so spooling here and the worker's stages share one waterfall.
+    with telemetry.run(uuid.uuid4().hex) as job_id:
+        spooled = []
+        for file in files:
+            if isinstance(file, FetchedReel):
+                # Downloaded reels already sit, content-addressed, in the shared cache folder.
+                spooled.append({"name": file.name, "path": file.path, "digest": file.digest, "size": file.size})
+                continue
+            with telemetry.span("spool", file=file.name) as record:
+                spooled.append(dict(spool_to_dir(file, SPOOL_DIR, suffix=os.path.splitext(file.name)[1]), name=file.name))
+                record["bytes"] = spooled[-1]["size"]
+        get_job_store().submit("campaign", {
+            "funnel_stage": funnel_stage, "files": [{"name": s["name"], "path": os.path.abspath(s["path"]), "digest": s["digest"]} for s in spooled],
+            "kpis": {file.name: kpis[file.name] for file in files}, **options,
+        }, job_id=job_id)
+    st.session_state[session_state_key]["job_id"] = job_id
+    st.query_params[f"job_{funnel_stage.lower()}"] = job_id
+    return job_id
+
+@st.cache_resource
+def get_metrics_server():
+    # Only when REEL_METRICS_PORT is set; one endpoint per server process.
+    return telemetry.start_metrics_server()
 
 def create_chatbot_prompt(report_text):
     return f"""You are a helpful AI assistant. Your ONLY job is to answer questions about the following marketing report. Do not answer questions outside the scope of this report. Be concise and helpful.
@@ -119,50 +163,112 @@ def create_chatbot_prompt(report_text):
     """
 
 # --- UI HELPER FUNCTIONS ---
-def parse_report_and_display(report_text, all_kpis):
-    # This robust JSON-based parser is unchanged
+def display_report(report, all_kpis):
+    """Renders a ParsedReport. No regex or JSON work happens here, so reruns stay cheap however long the report is."""
     st.subheader("🏆 Strategic Campaign Report", anchor=False)
-    try:
-        json_match = re.search(r"```json\s*\n([\s\S]*?)\n```", report_text)
-        if json_match:
-            json_string = json_match.group(1)
-            scorecard_data = json.loads(json_string)
-            scorecard_df = pd.DataFrame(scorecard_data)
-            scorecard_df.rename(columns={'rank': 'Rank', 'video_name': 'Video Name', 'justification': 'Ranking Justification'}, inplace=True)
-            
-            top_video_name = scorecard_df['Video Name'].iloc[0]
-            top_kpis = all_kpis.get(top_video_name, {})
-            
-            st.subheader(f"🥇 Top Performer: {top_video_name}")
-            if top_kpis:
-                 with st.container(border=True):
-                    cols = st.columns(len(top_kpis) if len(top_kpis) <= 4 else 4)
-                    for i, (k, v) in enumerate(top_kpis.items()):
-                        if i < 4: cols[i].metric(label=k, value=v)
+    if report.scorecard:
+        top_video_name = report.top_performer
+        top_kpis = all_kpis.get(top_video_name, {})
+
+        st.subheader(f"🥇 Top Performer: {top_video_name}")
+        if top_kpis:
+             with st.container(border=True):
+                cols = st.columns(len(top_kpis) if len(top_kpis) <= 4 else 4)
+                for i, (k, v) in enumerate(top_kpis.items()):
+                    if i < 4: cols[i].metric(label=k, value=v)
 
+        with st.expander("**Campaign Performance Scorecard**", expanded=True):
+            st.dataframe(report.scorecard_records(), use_container_width=True, hide_index=True)
+    else:
+        st.error(f"Could not parse top performer data or scorecard. Error: {report.scorecard_error}", icon="🚨")
+        if report.scorecard_raw:
+            st.text(report.scorecard_raw)
+
+    for section in report.sections:
+        with st.expander(f"**{section.number}. {section.title}**"):
+            st.markdown(section.content)
+
+def render_partial_report(report_text):
+    """Renders a report that is still being written: the scorecard once its JSON block closes, finished sections, then the live one."""
+    st.subheader("🏆 Strategic Campaign Report (writing...)", anchor=False)
+    parser = IncrementalReportParser()
+    for event in parser.feed(report_text):
+        if event["type"] == "scorecard":
             with st.expander("**Campaign Performance Scorecard**", expanded=True):
-                st.dataframe(scorecard_df, use_container_width=True, hide_index=True)
+                st.dataframe(pd.DataFrame(event["rows"]).rename(columns={'rank': 'Rank', 'video_name': 'Video Name', 'justification': 'Ranking Justification'}), use_container_width=True, hide_index=True)
+        elif event["type"] == "section":
+            with st.expander(f"**{event['number']}. {event['title']}**", expanded=True):
+                st.markdown(event["content"])
         else:
-            raise ValueError("No JSON block found for the scorecard.")
-    except Exception as e:
-        st.error(f"Could not parse top performer data or scorecard. Error: {e}", icon="🚨")
-        scorecard_raw_match = re.search(r"### 1\..*Scorecard\s*\n*(.*?)(\n###|$)", report_text, re.DOTALL | re.IGNORECASE)
-        if scorecard_raw_match:
-            st.text(scorecard_raw_match.group(1).strip())
-
-    report_sections = re.findall(r"### (2|3|4|5)\. (.*?)\n(.*?)(?=\n### |\Z)", report_text, re.DOTALL)
-    for num, title, content in report_sections:
-        with st.expander(f"**{num}. {title.strip()}**"):
-            st.markdown(content.strip())
+            st.markdown(f"**{event['number']}. {event['title']}**\n\n{event['content']}")
+
+JOB_STAGE_MESSAGES = {
+    "queued": "🕒 Waiting for a free worker...",
+    "uploading": "📤 Uploading videos to secure storage...",
+    "processing": "🔄 Videos are being processed... The report starts automatically once they are ready.",
+    "writing": "✍️ All files ready! The AI is writing the comprehensive analysis... Sections appear below as they are written.",
+}
+
+def show_job_progress(job):
+    progress = job["progress"] or {}
+    stage = progress.get("stage", "queued") if job["status"] == "running" else "queued"
+    st.info(JOB_STAGE_MESSAGES[stage], icon="⏳")
+    if progress.get("bytes_saved"): st.caption(f"Local preprocessing saved {progress['bytes_saved'] / 1e6:,.1f} MB of uploads.")
+    for name, status in progress.get("files", {}).items():
+        if status == "ready": st.success(f"✅ '{name}' is ready.")
+        elif status == "failed": st.error(f"❌ Processing failed for '{name}'.")
+        elif status == "processing": st.info(f"⏳ '{name}' is still processing...")
+    if job["partial_report"]:
+        render_partial_report(job["partial_report"])
+
+@st.fragment(run_every=STATUS_REFRESH_SECONDS)
+def render_job_status(job_id):
+    # Only this fragment re-renders while the job runs; once it finishes the whole tab reruns into the next state.
+    job = get_job_store().get(job_id)
+    if job is None or job["status"] in ("complete", "failed"): st.rerun()
+    show_job_progress(job)
+    show_run_diagnostics(job_id)
+
+def show_run_diagnostics(run_id):
+    """Waterfall of every recorded stage of one analysis (app and worker side), with bytes, tokens, retries and cache hits."""
+    spans = telemetry.read_spans(run_id) if run_id else []
+    with st.expander("🔬 Run diagnostics"):
+        if not spans:
+            st.caption("No timings recorded for this analysis yet.")
+            return
+        origin = min(record["start"] for record in spans)
+        rows = []
+        for record in spans:
+            detail = record.get("file") or record.get("model") or ""
+            rows.append({
+                "step": f"{record['stage']} · {detail}" if detail else record["stage"], "stage": record["stage"],
+                "start_s": record["start"] - origin, "end_s": record["start"] - origin + record["duration_s"], "duration_s": record["duration_s"],
+                "bytes": record.get("bytes_uploaded", record.get("bytes", 0)), "prompt_tokens": record.get("prompt_tokens", 0), "response_tokens": record.get("response_tokens", 0),
+                "retries": record.get("retries", 0), "cache_hits": record.get("cache_hits", 0), "error": record.get("error", ""),
+            })
+        frame = pd.DataFrame(rows)
+        chart = alt.Chart(frame).mark_bar().encode(
+            x=alt.X("start_s:Q", title="Seconds since start"), x2="end_s:Q",
+            y=alt.Y("step:N", sort=list(frame["step"]), title=None), color=alt.Color("stage:N", legend=None),
+            tooltip=["step", alt.Tooltip("duration_s:Q", format=".2f"), "bytes", "prompt_tokens", "response_tokens", "retries", "cache_hits", "error"],
+        )
+        st.altair_chart(chart, use_container_width=True)
+        st.dataframe(frame.drop(columns=["stage", "end_s"]).round(2), use_container_width=True, hide_index=True)
+
+def new_analysis_state():
+    return {"status": "not_started", "kpis": {}, "manual_kpis": {}, "fetched_reels": [], "chat_messages": []}
 
 # --- MAIN APP LOGIC ---
 def render_campaign_tab(funnel_stage):
     session_state_key = f"analysis_state_{funnel_stage}"
     if session_state_key not in st.session_state:
-        st.session_state[session_state_key] = {
-            "status": "not_started", "files": [], "kpis": {}, "manual_kpis": {}, "chat_messages": []
-        }
-    
+        st.session_state[session_state_key] = new_analysis_state()
+        # A refreshed page (or another app process) picks the analysis back up from the job id in the URL.
+        job_id = st.query_params.get(f"job_{funnel_stage.lower()}")
+        job = get_job_store().get(job_id) if job_id else None
+        if job is not None:
+            st.session_state[session_state_key].update(status="processing", job_id=job_id, kpis=job["payload"]["kpis"], structured_scorecard=job["payload"].get("structured_scorecard", False))
+
     # State 1: Upload
     if st.session_state[session_state_key]["status"] == "not_started":
         with st.container(border=True):
@@ -170,26 +276,33 @@ def render_campaign_tab(funnel_stage):
             col1, col2 = st.columns(2)
             with col1: uploaded_files = st.file_uploader("Upload campaign videos", type=["mp4", "mov", "avi", "m4v"], accept_multiple_files=True, key=f"uploader_{funnel_stage.lower()}")
             with col2: kpi_csv_file = st.file_uploader("Upload a CSV with metrics (Optional)", type="csv", key=f"csv_uploader_{funnel_stage.lower()}", help="Must have a 'filename' column.")
-        if uploaded_files:
+            with st.expander("...or fetch reels from Instagram"):
+                refs_text = st.text_area("Reels or profiles", key=f"reel_refs_{funnel_stage.lower()}", placeholder="C9xYz123AbC\nhttps://www.instagram.com/reel/C8aBc456DeF/\n@yourbrand",
+                                         help="Shortcodes, reel URLs or @profiles, one per line. Views, likes and comments are filled in as metrics; shares are not public.")
+                if st.button("Fetch Reels", key=f"fetch_reels_{funnel_stage.lower()}", disabled=not refs_text.strip()):
+                    try:
+                        for error in fetch_campaign_reels(session_state_key, refs_text): st.warning(f"Could not fetch {error}", icon="⚠️")
+                    except Exception as e: st.error(f"Error fetching reels: {e}", icon="❌")
+        videos = list(uploaded_files or []) + st.session_state[session_state_key]["fetched_reels"]
+        if videos:
             parsed_kpis_from_csv = {}
             if kpi_csv_file:
                 try:
-                    df = pd.read_csv(kpi_csv_file).astype(str)
-                    if 'filename' not in df.columns: st.error("CSV Error: Missing 'filename' column.", icon="❌")
-                    else: parsed_kpis_from_csv = df.set_index('filename').to_dict('index'); st.success("✅ Metrics CSV loaded!", icon="🎉")
+                    parsed_kpis_from_csv = load_campaign_kpis(session_state_key, kpi_csv_file, [f.name for f in videos]); st.success("✅ Metrics CSV loaded!", icon="🎉")
+                except ValueError as e: st.error(f"CSV Error: {e}", icon="❌")
                 except Exception as e: st.error(f"Error reading CSV file: {e}", icon="❌")
             
             with st.container(border=True):
                 st.subheader("Step 2: Verify Metrics & Preview Videos", anchor=False)
                 kpi_input_data = {}
-                for file in uploaded_files:
+                for file in videos:
                     with st.expander(f"Metrics for: **{file.name}**"):
                         # --- NEW: VIDEO PREVIEW PANE ---
-                        st.video(file)
+                        st.video(file.path if isinstance(file, FetchedReel) else file)
                         st.markdown("---") # Visual separator
                         
-                        basename, _ = os.path.splitext(file.name)
-                        file_kpis_from_csv = parsed_kpis_from_csv.get(file.name) or parsed_kpis_from_csv.get(basename)
+                        # A fetched reel starts with its engagement metrics; CSV columns are added on top.
+                        file_kpis_from_csv = {**(file.kpis if isinstance(file, FetchedReel) else {}), **parsed_kpis_from_csv.get(file.name, {})}
                         if file_kpis_from_csv:
                             temp_kpis = {}
                             cols = st.columns(3)
@@ -211,63 +324,79 @@ def render_campaign_tab(funnel_stage):
                             if st.button("Add Metric", key=f"add_kpi_{file.name}_{funnel_stage}"):
                                 st.session_state[session_state_key]["manual_kpis"][file.name].append({"name": "", "value": ""}); st.rerun()
 
+            cache_stats = get_report_cache().stats()
+            if any(any(kpis.values()) for kpis in kpi_input_data.values()):
+                with st.expander("Derived metrics & Scale Score (what the AI will see)"):
+                    st.dataframe(kpi_frame_from_dict(kpi_input_data, funnel_stage), use_container_width=True)
+            analysis_mode = st.radio("Analysis mode", ["Auto", "Single pass", "Map-reduce"], horizontal=True, key=f"analysis_mode_{funnel_stage.lower()}", help=f"Map-reduce analyzes each video separately with {MAP_MODEL}, then synthesizes one report from the summaries. Auto uses it for campaigns with more than {MAP_REDUCE_THRESHOLD} videos.")
+            structured_scorecard = st.checkbox("Structured scorecard (JSON mode)", key=f"structured_scorecard_{funnel_stage.lower()}", help="Asks the model for the scorecard as strict JSON instead of relying only on parsing the report text.")
+            preprocess = st.checkbox("Preprocess videos locally (720p proxy)", disabled=not ffmpeg_available(), key=f"preprocess_{funnel_stage.lower()}", help="Transcodes each video to a small proxy with ffmpeg before uploading. Much faster uploads and remote processing for 4K/ProRes masters." if ffmpeg_available() else "ffmpeg was not found on this server.")
+            # Only the map step looks at hook clips, so they are offered (and cut) for map-reduce runs only.
+            may_map_reduce = use_map_reduce(analysis_mode, len(videos))
+            hook_clip = st.checkbox("Add 3-second hook clips (map-reduce mode)", key=f"hook_clip_{funnel_stage.lower()}", disabled=not (preprocess and may_map_reduce), help="Also uploads each video's first 3 seconds so the per-video analysis can focus on the hook.") and preprocess and may_map_reduce
+            force_refresh = st.checkbox("Force refresh (ignore cached reports)", key=f"force_refresh_{funnel_stage.lower()}", help=f"Report cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses, {cache_stats['entries']} stored reports.")
             if st.button(f"🚀 Analyze {funnel_stage} Campaign", type="primary", use_container_width=True, key=f"start_button_{funnel_stage.lower()}"):
                 # ... This logic is unchanged and robust for paid tier ...
                 st.session_state[session_state_key]["kpis"] = kpi_input_data
-                files_to_process = [f for f in uploaded_files if any(kpi_input_data.get(f.name, {}).values())]
+                files_to_process = [f for f in videos if any(kpi_input_data.get(f.name, {}).values())]
                 if not files_to_process:
                     st.error("No videos with KPIs found to analyze.")
                 else:
-                    with st.spinner("Uploading videos to secure storage..."):
-                        for file in files_to_process:
-                            try:
-                                with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(file.name)[1]) as tmp:
-                                    tmp.write(file.getvalue())
-                                video_file_for_api = genai.upload_file(path=tmp.name)
-                                st.session_state[session_state_key]["files"].append({"original_filename": file.name, "api_file_name": video_file_for_api.name, "status": "processing"})
-                                os.remove(tmp.name)
-                            except Exception as e: st.error(f"Failed to upload '{file.name}': {e}")
+                    # Same videos + KPIs + stage + model + prompt version as an earlier run? Serve that report.
+                    map_reduce = use_map_reduce(analysis_mode, len(files_to_process))
+                    hook_clip = hook_clip and map_reduce
+                    st.session_state[session_state_key]["structured_scorecard"] = structured_scorecard
+                    media = (PROXY_PROFILE + ("+hook" if hook_clip else "")) if preprocess else "original"
+                    report_key = campaign_report_key({f.name: f.digest if isinstance(f, FetchedReel) else fileobj_sha256(f) for f in files_to_process}, kpi_input_data, funnel_stage, map_reduce, media)
+                    cached_report = None if force_refresh else get_report_cache().get(report_key)
+                    if cached_report is not None:
+                        st.session_state[session_state_key]["final_report"] = cached_report
+                        st.session_state[session_state_key]["status"] = "complete"; st.rerun()
+                    with st.spinner("Queueing the analysis..."):
+                        submit_campaign_job(session_state_key, funnel_stage, files_to_process, kpi_input_data, map_reduce=map_reduce, force_refresh=force_refresh,
+                                            preprocess=preprocess, hook_clip=hook_clip, media=media, structured_scorecard=structured_scorecard)
                     st.session_state[session_state_key]["status"] = "processing"; st.rerun()
 
-    # State 2: Processing
+    # State 2: Processing (the job runs on a worker; this view only reads its progress)
     elif st.session_state[session_state_key]["status"] == "processing":
-        # ... This logic is unchanged and robust for paid tier ...
-        st.info("🔄 Videos are being processed... Click below when ready.", icon="⏳")
-        if st.button("Check Status & Generate Report", use_container_width=True, key=f"check_button_{funnel_stage.lower()}"):
-            all_files_ready = True
-            with st.spinner("Checking file statuses..."):
-                for file_info in st.session_state[session_state_key]["files"]:
-                    if file_info["status"] == "processing":
-                        api_file = genai.get_file(name=file_info["api_file_name"])
-                        if api_file.state.name == "ACTIVE": file_info["status"] = "active"; st.success(f"✅ '{file_info['original_filename']}' is ready.")
-                        elif api_file.state.name == "FAILED": file_info["status"] = "failed"; st.error(f"❌ Processing failed for '{file_info['original_filename']}'.")
-                        else: all_files_ready = False; st.info(f"⏳ '{file_info['original_filename']}' is still processing...")
-            if all_files_ready:
-                with st.spinner("All files ready! Sending campaign to AI for comprehensive analysis... This may take several minutes."):
-                    try:
-                        active_files_info = [f for f in st.session_state[session_state_key]["files"] if f["status"] == 'active']
-                        kpis_for_prompt = {info['original_filename']: st.session_state[session_state_key]['kpis'][info['original_filename']] for info in active_files_info}
-                        synthesis_prompt = create_comprehensive_analysis_prompt(kpis_for_prompt, funnel_stage)
-                        prompt_parts = [synthesis_prompt]
-                        for file_info in active_files_info:
-                            prompt_parts.append(genai.get_file(name=file_info["api_file_name"]))
-                        model = genai.GenerativeModel(model_name="gemini-1.5-pro")
-                        final_response = model.generate_content(prompt_parts)
-                        st.session_state[session_state_key]["final_report"] = final_response.text
-                        st.session_state[session_state_key]["status"] = "complete"
-                        for file_info in st.session_state[session_state_key]["files"]:
-                            try: genai.delete_file(name=file_info["api_file_name"])
-                            except Exception: pass
-                        st.rerun()
-                    except Exception as e:
-                        st.error(f"An error occurred during analysis: {e}")
-                        st.session_state[session_state_key]["status"] = "processing"
+        state = st.session_state[session_state_key]
+        get_job_worker(); get_metrics_server()
+        job = get_job_store().get(state["job_id"])
+        if job is None:
+            st.error("This analysis is no longer available. Please start a new one.")
+            if st.button("↩️ Start New Analysis", use_container_width=True, key=f"lost_job_reset_{funnel_stage.lower()}"):
+                st.query_params.pop(f"job_{funnel_stage.lower()}", None)
+                st.session_state[session_state_key] = new_analysis_state(); st.rerun()
+        elif job["status"] == "complete":
+            state.update(status="complete", final_report=job["result"]["report"], warnings=job["result"]["warnings"]); st.rerun()
+        elif job["status"] == "failed":
+            show_job_progress(job)
+            st.error(f"An error occurred during analysis: {job['error']}")
+            if st.button("Retry Report Generation", use_container_width=True, key=f"retry_button_{funnel_stage.lower()}"):
+                get_job_store().retry(job["id"]); st.rerun()
+            show_run_diagnostics(job["id"])
+        else:
+            render_job_status(job["id"])
 
     # State 3: Complete (Report & Chatbot)
     elif st.session_state[session_state_key]["status"] == "complete":
+        for warning in st.session_state[session_state_key].get("warnings", []):
+            st.warning(warning, icon="⚠️")
+        # App-side stages (parsing, chat) are recorded under the job's run id; a report served from the cache gets a run of its own.
+        run_id = st.session_state[session_state_key].get("job_id") or st.session_state[session_state_key].setdefault("run_id", uuid.uuid4().hex)
         main_col, chat_col = st.columns([2, 1])
         with main_col:
-            parse_report_and_display(st.session_state[session_state_key].get("final_report", ""), st.session_state[session_state_key].get("kpis", {}))
+            # Parse once per analysis; every later rerun (chat messages, widget clicks) renders the stored structure.
+            if st.session_state[session_state_key].get("parsed_report") is None:
+                final_report = st.session_state[session_state_key].get("final_report", "")
+                structured_scorecard = None
+                with telemetry.run(run_id):
+                    if st.session_state[session_state_key].get("structured_scorecard"):
+                        with st.spinner("Extracting the scorecard as structured JSON..."):
+                            structured_scorecard = extract_scorecard_structured(final_report)
+                    with telemetry.span("parse_report", bytes=len(final_report.encode("utf-8"))):
+                        st.session_state[session_state_key]["parsed_report"] = parse_report(final_report, structured_scorecard)
+            display_report(st.session_state[session_state_key]["parsed_report"], st.session_state[session_state_key].get("kpis", {}))
         with chat_col:
             with st.container(border=True):
                 st.subheader("💬 Chat with your Report")
@@ -278,19 +407,20 @@ def render_campaign_tab(funnel_stage):
                     st.session_state[session_state_key]["chat_messages"].append({"role": "user", "content": prompt})
                     with st.chat_message("user"): st.markdown(prompt)
                     with st.chat_message("assistant"):
-                        with st.spinner("Thinking..."):
-                            try:
-                                chatbot_model = genai.GenerativeModel(model_name="gemini-1.5-pro")
-                                chat = chatbot_model.start_chat(history=[
-                                    {'role': 'user', 'parts': [create_chatbot_prompt(st.session_state[session_state_key]["final_report"])]},
-                                    {'role': 'model', 'parts': ["Understood. I will only answer questions about the provided report."]}
-                                ])
-                                response = chat.send_message(prompt)
-                                st.markdown(response.text)
-                                st.session_state[session_state_key]["chat_messages"].append({"role": "assistant", "content": response.text})
-                            except Exception as e: st.error(f"Sorry, I couldn't process that. Error: {e}")
+                        try:
+                            # One session per analysis: the report context is attached once and the history stays bounded.
+                            if st.session_state[session_state_key].get("chat_session") is None:
+                                with st.spinner("Loading the report into the chat..."):
+                                    st.session_state[session_state_key]["chat_session"] = ReportChat(create_chatbot_prompt(st.session_state[session_state_key]["final_report"]))
+                            with telemetry.run(run_id):
+                                reply = st.write_stream(st.session_state[session_state_key]["chat_session"].stream_reply(prompt))
+                            st.session_state[session_state_key]["chat_messages"].append({"role": "assistant", "content": reply})
+                        except Exception as e: st.error(f"Sorry, I couldn't process that. Error: {e}")
+        show_run_diagnostics(run_id)
         if st.button("↩️ Start New Analysis", use_container_width=True, key=f"reset_button_{funnel_stage.lower()}"):
-            st.session_state[session_state_key] = {"status": "not_started", "files": [], "kpis": {}, "manual_kpis": {}, "chat_messages": []}; st.rerun()
+            if st.session_state[session_state_key].get("chat_session") is not None: st.session_state[session_state_key]["chat_session"].close()
+            st.query_params.pop(f"job_{funnel_stage.lower()}", None)
+            st.session_state[session_state_key] = new_analysis_state(); st.rerun()
 
 # --- Create the Main App Layout ---
 tab1, tab2, tab3 = st.tabs(["**Awareness**", "**Traffic**", "**Conversion**"])
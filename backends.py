@@ -0,0 +1,305 @@
+import os
+import re
+import json
+import time
+import random
+import datetime
+import threading
+from types import SimpleNamespace
+import google.generativeai as genai
+from google.generativeai import caching
+from google.api_core import exceptions as api_exceptions
+
+# --- Configuration ---
+# "gemini" (the live API) or "fake" (a local simulation for load tests and offline development).
+BACKEND = os.environ.get("REEL_BACKEND", "gemini")
+
+
+class GeminiBackend:
+    """The live google.generativeai API. Every other module talks to Gemini through this interface."""
+
+    requires_api_key = True
+
+    def configure(self, api_key):
+        genai.configure(api_key=api_key)
+
+    def upload_file(self, path, display_name=None):
+        return genai.upload_file(path=path, display_name=display_name)
+
+    def get_file(self, name):
+        return genai.get_file(name=name)
+
+    def delete_file(self, name):
+        genai.delete_file(name=name)
+
+    def list_files(self):
+        return genai.list_files()
+
+    def model(self, model_name, **kwargs):
+        """A model exposing generate_content(contents, stream=False) and count_tokens(contents)."""
+        return genai.GenerativeModel(model_name=model_name, **kwargs)
+
+    def create_cached_content(self, model, system_instruction, ttl):
+        """Server-side cached context (deleted with `.delete()`), for model_from_cached_content."""
+        return caching.CachedContent.create(model=model, system_instruction=system_instruction, ttl=ttl)
+
+    def model_from_cached_content(self, cached_content):
+        return genai.GenerativeModel.from_cached_content(cached_content=cached_content)
+
+
+# --- Fake Backend ---
+FAKE_UPLOAD_MBPS = float(os.environ.get("REEL_FAKE_UPLOAD_MBPS", "200"))
+FAKE_PROCESSING_SECONDS_PER_MB = float(os.environ.get("REEL_FAKE_PROCESSING_SECONDS_PER_MB", "0.05"))
+FAKE_GENERATE_SECONDS = float(os.environ.get("REEL_FAKE_GENERATE_SECONDS", "1.0"))
+FAKE_FAILURE_RATE = float(os.environ.get("REEL_FAKE_FAILURE_RATE", "0"))
+FAKE_PROCESSING_FAILURE_RATE = float(os.environ.get("REEL_FAKE_PROCESSING_FAILURE_RATE", "0"))
+
+VIDEO_NAME_PATTERN = re.compile(r"[\w\-.]+\.(?:mp4|mov|avi|m4v)\b", re.IGNORECASE)
+
+
+def _canned_report(video_names):
+    rows = [{"rank": i + 1, "video_name": name, "justification": f"Simulated ranking for {name}: strong hook, proven ability to scale."} for i, name in enumerate(video_names)]
+    return f"""### 1. Campaign Performance Scorecard
+```json
+{json.dumps(rows, indent=2)}
+```
+
+### 2. Common Themes in Top Performers
+- Simulated theme: a clear product shot in the first 3 seconds.
+- Simulated theme: fast cuts and on-screen captions.
+
+### 3. Actionable Recommendations
+- Shift budget towards {video_names[0]}.
+
+### 4. New Creative Ideas (Ad Scripts)
+- Simulated script: open on the problem, show the product, close on the offer.
+
+### 5. Suggested Ad Copy
+- "Simulated copy for load testing."
+"""
+
+
+def _canned_summary():
+    return """**Hook Analysis (First 3 Seconds):**
+- Simulated: product in frame within 1s. Effectiveness 7/10.
+
+**Video Structure and Pacing:**
+- Simulated: fast cuts, clear CTA at the end.
+
+**Overall "Virality" Score:**
+- Score 6/10.
+"""
+
+
+class FakeFile:
+    def __init__(self, name, display_name, size_bytes, ready_at, fails):
+        self.name = name
+        self.display_name = display_name
+        self.size_bytes = size_bytes
+        self.create_time = datetime.datetime.now(datetime.timezone.utc)
+        self.expiration_time = self.create_time + datetime.timedelta(hours=48)
+        self._ready_at = ready_at
+        self._fails = fails
+
+    @property
+    def state(self):
+        if time.monotonic() < self._ready_at:
+            return SimpleNamespace(name="PROCESSING")
+        return SimpleNamespace(name="FAILED" if self._fails else "ACTIVE")
+
+
+class FakeResponse:
+    def __init__(self, text, prompt_tokens):
+        self.text = text
+        self.usage_metadata = SimpleNamespace(prompt_token_count=prompt_tokens, candidates_token_count=len(text) // 4)
+
+
+class FakeModel:
+    def __init__(self, backend, model_name, system_instruction=None, generation_config=None, cached_content=None, **kwargs):
+        self.backend = backend
+        self.model_name = model_name
+        self.system_instruction = system_instruction or ""
+        self.cached_content = cached_content
+        self.json_mode = (generation_config or {}).get("response_mime_type") == "application/json"
+
+    def _texts(self, contents):
+        if isinstance(contents, (str, dict, FakeFile)):
+            contents = [contents]
+        texts, files = [], 0
+        for part in contents:
+            if isinstance(part, str):
+                texts.append(part)
+            elif isinstance(part, FakeFile):
+                files += 1
+            elif isinstance(part, dict):
+                texts.extend(p for p in part.get("parts", []) if isinstance(p, str))
+        return "\n".join(texts), files
+
+    def count_tokens(self, contents):
+        text, files = self._texts(contents)
+        return SimpleNamespace(total_tokens=len(text) // 4 + files * self.backend.tokens_per_video)
+
+    def generate_content(self, contents, stream=False):
+        text, files = self._texts(contents)
+        if self.cached_content is not None:
+            # Like Gemini, a model built on a cached context stops working once it expires or is deleted.
+            self.backend.get_cached_content(self.cached_content)
+        self.backend.maybe_fail()
+        if self.json_mode:
+            reply = json.dumps([{"rank": i + 1, "video_name": name, "justification": "Simulated."} for i, name in enumerate(self.backend.video_names(text))])
+        elif "Campaign Performance Scorecard" in text or "SECTION 1" in text:
+            reply = _canned_report(self.backend.video_names(text))
+        elif "Hook Analysis" in text:
+            reply = _canned_summary()
+        else:
+            reply = "This is a simulated answer about the report."
+        prompt_tokens = (len(text) + len(self.system_instruction)) // 4 + files * self.backend.tokens_per_video
+        if not stream:
+            time.sleep(self.backend.generate_seconds)
+            return FakeResponse(reply, prompt_tokens)
+        return self._stream(reply, prompt_tokens)
+
+    def _stream(self, reply, prompt_tokens):
+        pieces = [reply[i:i + 200] for i in range(0, len(reply), 200)] or [""]
+        for piece in pieces:
+            time.sleep(self.backend.generate_seconds / len(pieces))
+            yield SimpleNamespace(text=piece, usage_metadata=None)
+        yield FakeResponse("", prompt_tokens)
+
+
+class FakeCachedContent:
+    def __init__(self, backend, name, model, system_instruction, ttl):
+        self.name = name
+        self.model = model
+        self.system_instruction = system_instruction
+        self.create_time = datetime.datetime.now(datetime.timezone.utc)
+        self.expire_time = self.create_time + ttl
+        self._backend = backend
+
+    def delete(self):
+        self._backend.delete_cached_content(self.name)
+
+
+class FakeBackend:
+    """
+    In-process stand-in for Gemini. Uploads take size / bandwidth, files stay PROCESSING for a
+    size-proportional delay, calls fail with a transient error at `failure_rate`, and models return
+    canned reports naming the videos found in the prompt. Cached contents live until deleted or
+    expired. Lets the whole pipeline run without network.
+    """
+
+    requires_api_key = False
+
+    def __init__(self, upload_mbps=FAKE_UPLOAD_MBPS, processing_seconds_per_mb=FAKE_PROCESSING_SECONDS_PER_MB, generate_seconds=FAKE_GENERATE_SECONDS,
+                 failure_rate=FAKE_FAILURE_RATE, processing_failure_rate=FAKE_PROCESSING_FAILURE_RATE, tokens_per_video=1000, seed=None):
+        self.upload_mbps = upload_mbps
+        self.processing_seconds_per_mb = processing_seconds_per_mb
+        self.generate_seconds = generate_seconds
+        self.failure_rate = failure_rate
+        self.processing_failure_rate = processing_failure_rate
+        self.tokens_per_video = tokens_per_video
+        self._random = random.Random(seed)
+        self._files = {}
+        self._cached_contents = {}
+        self._lock = threading.Lock()
+        self._counter = 0
+
+    def maybe_fail(self):
+        with self._lock:
+            fail = self._random.random() < self.failure_rate
+        if fail:
+            raise api_exceptions.ServiceUnavailable("Simulated transient failure.")
+
+    def video_names(self, text):
+        names = list(dict.fromkeys(name.strip() for name in VIDEO_NAME_PATTERN.findall(text)))
+        return [name for name in names if not name.startswith("example_video")] or ["video.mp4"]
+
+    def configure(self, api_key=None):
+        pass
+
+    def upload_file(self, path, display_name=None):
+        size = os.path.getsize(path)
+        if self.upload_mbps > 0:
+            time.sleep(size * 8 / (self.upload_mbps * 1e6))
+        self.maybe_fail()
+        with self._lock:
+            self._counter += 1
+            name = f"files/fake-{self._counter:06d}"
+            fails = self._random.random() < self.processing_failure_rate
+            remote_file = FakeFile(name, display_name, size, time.monotonic() + size / 1e6 * self.processing_seconds_per_mb, fails)
+            self._files[name] = remote_file
+        return remote_file
+
+    def get_file(self, name):
+        with self._lock:
+            remote_file = self._files.get(name)
+        if remote_file is None:
+            raise api_exceptions.NotFound(f"File {name} not found.")
+        return remote_file
+
+    def delete_file(self, name):
+        with self._lock:
+            self._files.pop(name, None)
+
+    def list_files(self):
+        with self._lock:
+            return list(self._files.values())
+
+    def model(self, model_name, **kwargs):
+        return FakeModel(self, model_name, **kwargs)
+
+    def create_cached_content(self, model, system_instruction, ttl):
+        self.maybe_fail()
+        with self._lock:
+            self._counter += 1
+            cached_content = FakeCachedContent(self, f"cachedContents/fake-{self._counter:06d}", model, system_instruction, ttl)
+            self._cached_contents[cached_content.name] = cached_content
+        return cached_content
+
+    def get_cached_content(self, name):
+        with self._lock:
+            stored = self._cached_contents.get(name)
+        if stored is None or stored.expire_time <= datetime.datetime.now(datetime.timezone.utc):
+            raise api_exceptions.NotFound(f"Cached content {name} not found.")
+        return stored
+
+    def model_from_cached_content(self, cached_content):
+        stored = self.get_cached_content(cached_content.name)
+        return FakeModel(self, stored.model, system_instruction=stored.system_instruction, cached_content=stored.name)
+
+    def delete_cached_content(self, name):
+        with self._lock:
+            self._cached_contents.pop(name, None)
+
+    def list_cached_contents(self):
+        """Cached contents not deleted yet (a leak check for callers that should clean up)."""
+        with self._lock:
+            return list(self._cached_contents.values())
+
+
+BACKENDS = {
+    "gemini": GeminiBackend,
+    "fake": FakeBackend,
+}
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """The process-wide backend, chosen by REEL_BACKEND on first use."""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            if BACKEND not in BACKENDS:
+                raise ValueError(f"Unknown REEL_BACKEND '{BACKEND}' (expected one of: {', '.join(BACKENDS)}).")
+            _backend = BACKENDS[BACKEND]()
+        return _backend
+
+
+def set_backend(backend):
+    """Installs `backend` (e.g. a FakeBackend with custom settings) for this process."""
+    global _backend
+    with _backend_lock:
+        _backend = backend
+    return backend
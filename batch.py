@@ -0,0 +1,156 @@
+import os
+import csv
+import json
+import math
+import time
+from pipeline import RateLimiter, run_many
+
+# --- Configuration ---
+VIDEO_EXTENSIONS = (".mp4", ".mov", ".avi", ".m4v")
+PATH_COLUMNS = ("video_path", "path", "filename", "video")
+
+
+def format_metrics(metrics):
+    """Turns a metrics dict into the bullet list create_analysis_prompt expects; strings pass through."""
+    if isinstance(metrics, dict):
+        return "\n".join(f"    - {k}: {v}" for k, v in metrics.items() if v not in (None, ""))
+    return str(metrics or "")
+
+
+# --- Loading Work Items ---
+def _sidecar_metrics(video_path):
+    """Metrics for a video in a directory batch: `<name>.json` or `<name>.txt` next to it, if present."""
+    stem = os.path.splitext(video_path)[0]
+    if os.path.exists(stem + ".json"):
+        with open(stem + ".json", "r", encoding="utf-8") as f:
+            return format_metrics(json.load(f))
+    if os.path.exists(stem + ".txt"):
+        with open(stem + ".txt", "r", encoding="utf-8") as f:
+            return f.read()
+    return ""
+
+
+def load_batch_items(source):
+    """
+    Loads batch work items from a directory of videos, a CSV manifest or a JSONL manifest.
+
+    CSV manifests need a video path column (video_path/path/filename/video) and either a `metrics`
+    column or one column per metric. JSONL lines look like {"video_path": ..., "metrics": str | dict}.
+    Relative paths are resolved against the manifest's folder. Returns [{"id", "video_path", "metrics"}].
+    """
+    items = []
+    if os.path.isdir(source):
+        for name in sorted(os.listdir(source)):
+            if name.lower().endswith(VIDEO_EXTENSIONS):
+                path = os.path.abspath(os.path.join(source, name))
+                items.append({"video_path": path, "metrics": _sidecar_metrics(path)})
+    else:
+        base_dir = os.path.dirname(os.path.abspath(source))
+        with open(source, "r", encoding="utf-8", newline="") as f:
+            if source.lower().endswith((".jsonl", ".ndjson")):
+                rows = [json.loads(line) for line in f if line.strip()]
+            else:
+                rows = list(csv.DictReader(f))
+        for row in rows:
+            path_column = next((c for c in PATH_COLUMNS if row.get(c)), None)
+            if path_column is None:
+                raise ValueError(f"Manifest row has no video path column ({', '.join(PATH_COLUMNS)}): {row}")
+            path = row[path_column]
+            metrics = row.get("metrics")
+            if metrics is None:
+                metrics = {k: v for k, v in row.items() if k != path_column}
+            items.append({"video_path": os.path.join(base_dir, path) if not os.path.isabs(path) else path, "metrics": format_metrics(metrics)})
+    for item in items:
+        item["id"] = os.path.abspath(item["video_path"])
+    return items
+
+
+def completed_ids(output_path):
+    """Ids already analyzed successfully in an existing results file (a truncated last line is ignored)."""
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if record.get("status") == "ok":
+                done.add(record["id"])
+    return done
+
+
+# --- Running ---
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers (None for an empty list)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def run_batch(items, analyze_fn, output_path, workers=4, rate_per_minute=30, force_refresh=False, on_result=None):
+    """
+    Runs `analyze_fn(video_path, metrics, force_refresh=...)` over `items` on a worker pool, with a global
+    rate limit on how often analyses may start. Each result is appended to `output_path` (JSONL) as soon
+    as it finishes, so a crashed run can simply be restarted: items already recorded as "ok" are skipped.
+    Returns a summary dict.
+    """
+    done = completed_ids(output_path)
+    pending = [item for item in items if item["id"] not in done]
+    limiter = RateLimiter(rate_per_minute, burst=workers)
+
+    def analyze(item):
+        limiter.acquire()
+        started = time.perf_counter()
+        analysis = analyze_fn(item["video_path"], item["metrics"], force_refresh=force_refresh)
+        return {"analysis": analysis, "latency_s": time.perf_counter() - started}
+
+    latencies, failures = [], 0
+    started = time.perf_counter()
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    with open(output_path, "a", encoding="utf-8") as out:
+        def record(done_count, total, outcome):
+            nonlocal failures
+            item = outcome["item"]
+            entry = {"id": item["id"], "video_path": item["video_path"], "finished_at": time.time()}
+            if outcome["error"] is None:
+                entry.update(status="ok", **outcome["result"])
+                latencies.append(outcome["result"]["latency_s"])
+            else:
+                failures += 1
+                entry.update(status="error", error=f"{type(outcome['error']).__name__}: {outcome['error']}", latency_s=outcome["elapsed"])
+            out.write(json.dumps(entry) + "\n")
+            out.flush()
+            os.fsync(out.fileno())
+            if on_result:
+                on_result(done_count, total, entry)
+
+        run_many(pending, analyze, max_workers=workers, on_progress=record)
+
+    elapsed = time.perf_counter() - started
+    return {
+        "total": len(items),
+        "skipped": len(items) - len(pending),
+        "processed": len(pending),
+        "succeeded": len(latencies),
+        "failed": failures,
+        "elapsed_s": elapsed,
+        "reels_per_min": (len(latencies) / elapsed * 60) if elapsed > 0 else 0.0,
+        "p50_latency_s": percentile(latencies, 50),
+        "p95_latency_s": percentile(latencies, 95),
+    }
+
+
+def format_summary(summary):
+    def seconds(value):
+        return "n/a" if value is None else f"{value:.1f}s"
+    return (
+        f"Processed {summary['processed']} of {summary['total']} reels ({summary['skipped']} already done) "
+        f"in {summary['elapsed_s']:.1f}s\n"
+        f"  Throughput: {summary['reels_per_min']:.2f} reels/min\n"
+        f"  Latency:    p50 {seconds(summary['p50_latency_s'])}, p95 {seconds(summary['p95_latency_s'])}\n"
+        f"  Failures:   {summary['failed']}"
+    )
@@ -0,0 +1,268 @@
+import io
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import tempfile
+import resource
+import threading
+import multiprocessing
+from contextlib import redirect_stdout
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Benchmarks for the analyze.py flow and the app's campaign flow, run end to end against the fake
+# backend (backends.FakeBackend), and for reel ingestion against a local HTTP stand-in for
+# Instagram, so pipeline regressions show up without network access:
+#
+#   python benchmarks.py --videos 8 --jobs 4 --video-mb 20
+#   python benchmarks.py --flow campaign --map-reduce --failure-rate 0.05
+#   python benchmarks.py --flow ingest --videos 300 --jobs 16
+#
+# Each flow runs in a fresh process with its own empty REEL_CACHE_DIR, so caches start cold and
+# peak RSS is measured per flow.
+
+FLOWS = ("analyze", "campaign", "ingest")
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS.
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def make_videos(directory, count, size_mb, prefix):
+    """Writes `count` distinct synthetic "videos" (random bytes) so no two hash alike."""
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for i in range(count):
+        path = os.path.join(directory, f"{prefix}_{i:03d}.mp4")
+        with open(path, "wb") as f:
+            remaining = int(size_mb * 1024 * 1024)
+            while remaining > 0:
+                chunk = min(remaining, 1024 * 1024)
+                f.write(os.urandom(chunk))
+                remaining -= chunk
+        paths.append(path)
+    return paths
+
+
+def fake_kpis(i):
+    spend = 100 * (i + 1)
+    return {"Spend": f"${spend:,}", "Impressions": f"{spend * 120:,}", "Clicks": f"{spend * 2:,}", "Conversions": str(i + 3), "Revenue": f"${spend * 3:,}"}
+
+
+def run_analyze_flow(options, workdir):
+    """N reels through analyze.py's batch mode on M workers."""
+    from analyze import analyze_reel
+    from batch import format_metrics, run_batch
+
+    paths = make_videos(os.path.join(workdir, "videos"), options["videos"], options["video_mb"], "reel")
+    items = [{"id": path, "video_path": path, "metrics": format_metrics(fake_kpis(i))} for i, path in enumerate(paths)]
+    with redirect_stdout(io.StringIO()):  # analyze_reel narrates every step
+        summary = run_batch(items, analyze_reel, os.path.join(workdir, "results.jsonl"), workers=options["jobs"], rate_per_minute=0)
+    return {
+        "flow": "analyze", "units": "reels", "completed": summary["succeeded"], "failed": summary["failed"], "elapsed_s": summary["elapsed_s"],
+        "per_min": summary["reels_per_min"], "p50_latency_s": summary["p50_latency_s"], "p95_latency_s": summary["p95_latency_s"],
+    }
+
+
+def run_campaign_flow(options, workdir):
+    """M concurrent campaign jobs of N videos each, through the job queue and an in-process worker."""
+    from batch import percentile
+    from jobs import SPOOL_DIR, JobStore
+    from pipeline import spool_to_dir
+    from worker import Worker
+
+    store = JobStore()
+    worker = Worker(store, concurrency=options["jobs"]).start()
+    started = time.perf_counter()
+    job_ids = []
+    for job in range(options["jobs"]):
+        paths = make_videos(os.path.join(workdir, f"campaign_{job}"), options["videos"], options["video_mb"], f"c{job}")
+        files = []
+        for path in paths:
+            with open(path, "rb") as f:
+                spooled = spool_to_dir(f, SPOOL_DIR, suffix=".mp4")
+            files.append({"name": os.path.basename(path), "path": os.path.abspath(spooled["path"]), "digest": spooled["digest"]})
+        job_ids.append(store.submit("campaign", {
+            "funnel_stage": "Conversion", "files": files, "kpis": {f["name"]: fake_kpis(i) for i, f in enumerate(files)},
+            "map_reduce": options["map_reduce"], "force_refresh": False, "preprocess": False, "hook_clip": False, "media": "original",
+        }))
+
+    while True:
+        jobs = [store.get(job_id) for job_id in job_ids]
+        if all(job["status"] in ("complete", "failed") for job in jobs):
+            break
+        time.sleep(0.2)
+    elapsed = time.perf_counter() - started
+    worker.stop()
+
+    completed = [job for job in jobs if job["status"] == "complete"]
+    latencies = [job["finished_at"] - job["created_at"] for job in completed]
+    chat = run_chat(completed, options["chat_turns"]) if options["chat_turns"] else {}
+    return {**chat,
+        "flow": "campaign", "units": "campaigns", "completed": len(completed), "failed": len(jobs) - len(completed), "elapsed_s": elapsed,
+        "per_min": len(completed) / elapsed * 60 if elapsed > 0 else 0.0, "videos_per_min": len(completed) * options["videos"] / elapsed * 60 if elapsed > 0 else 0.0,
+        "p50_latency_s": percentile(latencies, 50), "p95_latency_s": percentile(latencies, 95),
+        "errors": sorted({job["error"] for job in jobs if job["error"]}),
+    }
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Serves reel_fetch.HTTPSource's endpoints for synthetic reels named reel_000, reel_001, ..."""
+
+    protocol_version = "HTTP/1.1"  # keep-alive, so the fetcher's connection pool is exercised
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, body, content_type):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _reel(self, shortcode):
+        i = int(shortcode.rsplit("_", 1)[1])
+        return {"shortcode": shortcode, "video_url": f"videos/{shortcode}.mp4", "owner": "benchmark", "posted_at": "2024-01-01T00:00:00",
+                "caption": f"Synthetic reel {i}", "metrics": {"Views": 1000 * (i + 1), "Likes": 50 * (i + 1), "Comments": 5 * (i + 1)}}
+
+    def do_GET(self):
+        time.sleep(self.server.latency_s)
+        path = self.path.split("?")[0].strip("/").split("/")
+        if len(path) == 2 and path[0] == "reels" and path[1] in self.server.shortcodes:
+            self._send(json.dumps(self._reel(path[1])).encode("utf-8"), "application/json")
+        elif len(path) == 2 and path[0] == "profiles":
+            self._send(json.dumps({"reels": [self._reel(code) for code in self.server.shortcodes]}).encode("utf-8"), "application/json")
+        elif len(path) == 2 and path[0] == "videos" and path[1][:-len(".mp4")] in self.server.shortcodes:
+            # Distinct, deterministic bytes per reel, without holding every video in memory.
+            block = hashlib.sha256(path[1].encode("utf-8")).digest() * (64 * 1024 // 32)
+            size = int(self.server.video_mb * 1024 * 1024)
+            self.send_response(200)
+            self.send_header("Content-Type", "video/mp4")
+            self.send_header("Content-Length", str(size))
+            self.end_headers()
+            while size > 0:
+                self.wfile.write(block[:min(size, len(block))])
+                size -= len(block)
+        else:
+            self.send_error(404)
+
+
+def run_ingest_flow(options, workdir):
+    """N reels fetched by shortcode from a local stand-in on M threads, then fetched again from the download cache."""
+    from batch import percentile
+    from reel_fetch import HTTPSource, fetch_reels, parse_reel_refs
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    server.daemon_threads = True
+    server.shortcodes = {f"reel_{i:03d}" for i in range(options["videos"])}
+    server.latency_s, server.video_mb = options["fetch_latency"], options["video_mb"]
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        source = HTTPSource(f"http://127.0.0.1:{server.server_address[1]}")
+        refs = parse_reel_refs(sorted(server.shortcodes))
+        started = time.perf_counter()
+        outcomes = fetch_reels(refs, source, workers=options["jobs"], rate_per_minute=0)
+        elapsed = time.perf_counter() - started
+        started = time.perf_counter()
+        fetch_reels(refs, source, workers=options["jobs"], rate_per_minute=0)
+        cached_elapsed = time.perf_counter() - started
+    finally:
+        server.shutdown()
+    latencies = [outcome["elapsed"] for outcome in outcomes if outcome["error"] is None]
+    return {
+        "flow": "ingest", "units": "reels", "completed": len(latencies), "failed": len(outcomes) - len(latencies), "elapsed_s": elapsed,
+        "per_min": len(latencies) / elapsed * 60 if elapsed > 0 else 0.0, "p50_latency_s": percentile(latencies, 50), "p95_latency_s": percentile(latencies, 95),
+        "cached_elapsed_s": cached_elapsed, "errors": sorted({str(outcome["error"]) for outcome in outcomes if outcome["error"]}),
+    }
+
+
+CHAT_QUESTIONS = ("Which video should get more budget?", "Why did the top video win?", "Write one more ad hook.")
+
+
+def run_chat(completed_jobs, turns):
+    """A chat of `turns` questions on each finished report, through the cached-context path, then closed."""
+    from backends import get_backend
+    from batch import percentile
+    from chat_session import ReportChat
+
+    latencies, cached = [], 0
+    for job in completed_jobs:
+        # The fake reports are far below Gemini's caching minimum; caching is forced so that path is measured.
+        chat = ReportChat(f"Answer questions about this marketing report:\n{job['result']['report']}", cache_min_tokens=0)
+        cached += chat.cached_content is not None
+        for turn in range(turns):
+            started = time.perf_counter()
+            "".join(chat.stream_reply(CHAT_QUESTIONS[turn % len(CHAT_QUESTIONS)]))
+            latencies.append(time.perf_counter() - started)
+        chat.close()
+    return {"chat_sessions": len(completed_jobs), "chat_cached_sessions": cached, "chat_leaked_caches": len(get_backend().list_cached_contents()),
+            "chat_p50_latency_s": percentile(latencies, 50), "chat_p95_latency_s": percentile(latencies, 95)}
+
+
+def run_flow(flow, options):
+    """Runs one flow in this (fresh) process against a FakeBackend configured from `options`."""
+    with tempfile.TemporaryDirectory(prefix=f"reel-bench-{flow}-") as workdir:
+        # Must happen before the pipeline modules are imported: they read REEL_CACHE_DIR at import time.
+        os.environ["REEL_CACHE_DIR"] = os.path.join(workdir, "cache")
+        from backends import FakeBackend, set_backend
+        set_backend(FakeBackend(
+            upload_mbps=options["upload_mbps"], processing_seconds_per_mb=options["processing_seconds_per_mb"], generate_seconds=options["generate_seconds"],
+            failure_rate=options["failure_rate"], processing_failure_rate=options["processing_failure_rate"], seed=options["seed"],
+        ))
+        result = {"analyze": run_analyze_flow, "campaign": run_campaign_flow, "ingest": run_ingest_flow}[flow](options, workdir)
+    result["peak_rss_mb"] = peak_rss_mb()
+    return result
+
+
+def format_result(result, options):
+    def seconds(value):
+        return "n/a" if value is None else f"{value:.2f}s"
+    lines = [
+        f"[{result['flow']}] {options['jobs']} concurrent x {options['videos']} videos of {options['video_mb']:g} MB"
+        + (" (map-reduce)" if result["flow"] == "campaign" and options["map_reduce"] else ""),
+        f"  Completed:  {result['completed']} {result['units']} ({result['failed']} failed) in {result['elapsed_s']:.1f}s",
+        f"  Throughput: {result['per_min']:.2f} {result['units']}/min" + (f", {result['videos_per_min']:.1f} videos/min" if "videos_per_min" in result else ""),
+        f"  Latency:    p50 {seconds(result['p50_latency_s'])}, p95 {seconds(result['p95_latency_s'])}",
+        f"  Peak RSS:   {result['peak_rss_mb']:.1f} MB",
+    ]
+    if result.get("chat_sessions"):
+        lines.insert(-1, f"  Chat:       p50 {seconds(result['chat_p50_latency_s'])}, p95 {seconds(result['chat_p95_latency_s'])} per reply; "
+                         f"{result['chat_cached_sessions']}/{result['chat_sessions']} sessions on a cached context, {result['chat_leaked_caches']} caches left undeleted")
+    if "cached_elapsed_s" in result:
+        lines.insert(-1, f"  Re-fetch:   {result['cached_elapsed_s']:.1f}s with every video in the download cache")
+    for error in result.get("errors", []):
+        lines.append(f"  Error:      {error}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the analysis pipeline against a local fake Gemini backend.")
+    parser.add_argument("--flow", choices=FLOWS + ("all",), default="all")
+    parser.add_argument("--videos", type=int, default=8, help="Videos per run (analyze, ingest) or per campaign (campaign).")
+    parser.add_argument("--jobs", type=int, default=4, help="Concurrent analyses (analyze), campaign jobs (campaign) or downloads (ingest).")
+    parser.add_argument("--video-mb", type=float, default=5, help="Size of each synthetic video.")
+    parser.add_argument("--map-reduce", action="store_true", help="Campaign flow: per-video map step, then a text-only synthesis.")
+    parser.add_argument("--upload-mbps", type=float, default=200, help="Simulated upload bandwidth per upload, in Mbit/s.")
+    parser.add_argument("--processing-seconds-per-mb", type=float, default=0.05, help="Simulated remote processing time.")
+    parser.add_argument("--generate-seconds", type=float, default=1.0, help="Simulated time per generate_content call.")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Share of API calls that fail with a transient error.")
+    parser.add_argument("--processing-failure-rate", type=float, default=0.0, help="Share of uploads whose processing FAILs.")
+    parser.add_argument("--chat-turns", type=int, default=3, help="Campaign flow: chat questions asked about each finished report.")
+    parser.add_argument("--fetch-latency", type=float, default=0.05, help="Ingest flow: simulated latency of each stand-in request, in seconds.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="Print one JSON object per flow instead of text.")
+    args = parser.parse_args()
+
+    options = vars(args)
+    flows = FLOWS if args.flow == "all" else (args.flow,)
+    for flow in flows:
+        # One fresh process per flow: clean caches, and peak RSS that belongs to this flow alone.
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+            result = pool.submit(run_flow, flow, options).result()
+        print(json.dumps(result) if args.json else format_result(result, options))
@@ -0,0 +1,223 @@
+import os
+import time
+import telemetry
+from backends import get_backend
+from analyze import ANALYSIS_PROMPT_VERSION, create_analysis_prompt
+from kpi_engine import kpi_frame_from_dict, kpi_table_for_prompt
+from pipeline import call_with_retries, run_many
+from report_cache import normalize_kpis, report_fingerprint
+
+# --- Configuration ---
+REPORT_MODEL = "gemini-1.5-pro"
+# Bump whenever create_comprehensive_analysis_prompt changes, so cached reports built from the old prompt are not reused.
+COMPREHENSIVE_PROMPT_VERSION = "5.1"
+
+# The "map" stage looks at one video at a time, so the fast model is good enough there.
+# Only the text-only "reduce" synthesis runs on the large model.
+MAP_MODEL = "gemini-1.5-flash"
+MAX_CONCURRENT_MAP_CALLS = int(os.environ.get("REEL_MAX_CONCURRENT_MAP_CALLS", "6"))
+# Bump whenever create_video_summary_prompt changes.
+MAP_PROMPT_VERSION = "1"
+
+# Campaigns with more active videos than this are analyzed map-reduce style in "Auto" mode.
+MAP_REDUCE_THRESHOLD = int(os.environ.get("REEL_MAP_REDUCE_THRESHOLD", "8"))
+
+
+def create_video_summary_prompt(filename, kpis):
+    """Per-video "map" prompt: the single-reel analysis from analyze.py, asked for in compact form."""
+    metrics = "\n".join(f"    - {k}: {v}" for k, v in kpis.items()) or "    - (no metrics provided)"
+    return create_analysis_prompt(metrics) + f"""
+    **Output Constraints (IMPORTANT):**
+    This analysis of `{filename}` will be combined with analyses of other videos from the same campaign.
+    Keep it compact: at most 250 words, terse bullet points under each heading, no preamble.
+    """
+
+
+def map_cache_key(digest, kpis, media="original"):
+    """Cache key for one video's summary: content hash, media variant, normalized KPIs, model and prompt versions."""
+    return report_fingerprint(
+        video=digest,
+        media=media,
+        kpis=normalize_kpis(kpis),
+        model=MAP_MODEL,
+        prompt_version=f"{ANALYSIS_PROMPT_VERSION}.{MAP_PROMPT_VERSION}",
+    )
+
+
+def summarize_video(file_info, kpis, report_cache=None, force_refresh=False):
+    """
+    Runs the "map" analysis for one active video. `file_info` needs "original_filename",
+    "api_file_name" and "digest"; an optional "hook_api_file_name" adds the first-seconds hook clip.
+    Cached summaries are reused unless `force_refresh`.
+    """
+    key = map_cache_key(file_info["digest"], kpis, file_info.get("media", "original"))
+    if report_cache is not None and not force_refresh:
+        cached_summary = report_cache.get(key)
+        if cached_summary is not None:
+            return cached_summary
+
+    prompt = create_video_summary_prompt(file_info["original_filename"], kpis)
+    model = get_backend().model(MAP_MODEL)
+    with telemetry.span("map", file=file_info["original_filename"], model=MAP_MODEL):
+        prompt_parts = [prompt, get_backend().get_file(name=file_info["api_file_name"])]
+        if file_info.get("hook_api_file_name"):
+            hook_file = get_backend().get_file(name=file_info["hook_api_file_name"])
+            if hook_file.state.name == "ACTIVE":
+                prompt_parts += ["**Hook clip (the video's first 3 seconds, for the Hook Analysis):**", hook_file]
+        response = call_with_retries(lambda: model.generate_content(prompt_parts))
+        telemetry.add_usage(response, MAP_MODEL)
+        summary = response.text
+
+    if report_cache is not None:
+        report_cache.put(key, summary, meta={"video": file_info["original_filename"], "model": MAP_MODEL, "stage": "map"})
+    return summary
+
+
+def summarize_videos(files_info, all_kpis, report_cache=None, force_refresh=False, on_progress=None):
+    """
+    Runs the "map" stage for every video in parallel. Returns ({filename: summary}, {filename: error});
+    a failed video is left out of the synthesis rather than failing the whole campaign.
+    """
+    outcomes = run_many(
+        files_info,
+        lambda info: summarize_video(info, all_kpis.get(info["original_filename"], {}), report_cache, force_refresh),
+        max_workers=MAX_CONCURRENT_MAP_CALLS,
+        on_progress=on_progress,
+    )
+    summaries, errors = {}, {}
+    for outcome in outcomes:
+        filename = outcome["item"]["original_filename"]
+        if outcome["error"] is None:
+            summaries[filename] = outcome["result"]
+        else:
+            errors[filename] = outcome["error"]
+    return summaries, errors
+
+
+def use_map_reduce(mode, video_count):
+    """Resolves the UI's analysis mode ("Auto", "Single pass", "Map-reduce") for a campaign of `video_count` videos."""
+    if mode == "Auto":
+        return video_count > MAP_REDUCE_THRESHOLD
+    return mode == "Map-reduce"
+
+
+# --- AI PROMPT ENGINEERING 5.0 (Scaling Logic) ---
+def create_comprehensive_analysis_prompt(all_kpi_data, funnel_stage, video_summaries=None):
+    # With `video_summaries` (map-reduce mode) the prompt is text-only: each video's compact
+    # "map" analysis stands in for the video itself.
+    priority_metrics = {
+        "Awareness": "impressions, high Video View Rate, and low CPM",
+        "Traffic": "high Click-Through Rate (CTR) and low Cost Per Click (CPC)",
+        "Conversion": "high Return On Ad Spend (ROAS), high number of Purchases/Leads, and low Cost Per Acquisition (CPA)"
+    }
+    # The numbers are parsed, aggregated and scored up front (CTR/CPC/CPA/ROAS/CPM, spend share and a
+    # spend-weighted Scale Score), so the model gets one compact numeric table instead of raw strings.
+    kpi_table = kpi_table_for_prompt(kpi_frame_from_dict(all_kpi_data, funnel_stage))
+    video_data_string = f"**Performance Table (CSV, one row per video):**\n```csv\n{kpi_table}\n```\n"
+    if video_summaries:
+        video_data_string += "\n**Creative Analyses:**\n"
+        for filename in all_kpi_data:
+            if filename in video_summaries:
+                summary = video_summaries[filename].strip().replace("\n", "\n      ")
+                video_data_string += f"- **Video File:** `{filename}`\n      {summary}\n\n"
+    creative_note = ""
+    if video_summaries:
+        creative_note = " The videos themselves are not attached; rely on the **Creative Analysis** written for each video by an analyst who watched it."
+
+    return f"""
+    You are a world-class digital marketing and creative strategist. Your analysis must be nuanced and reflect real-world performance marketing principles.
+
+    **Primary Goal:** Analyze the provided video files and performance metrics for a '{funnel_stage}' campaign to identify winning creative strategies.{creative_note}
+
+    **Nuanced Performance Analysis (VERY IMPORTANT):**
+    You must understand the concept of **"scaling."** A video that achieves a high spend and high volume of desired actions (like clicks or purchases) has proven its ability to scale.
+    - **Do not automatically penalize a video for a slightly higher efficiency metric (like CPC or CPA) if it has significantly higher spend and volume.**
+    - For example, a video with $5,000 spend and a $1.50 CPC is often **more valuable** than a video with $50 spend and a $1.00 CPC, because the former has proven it works with a large budget.
+    - Mention this "ability to scale" in your ranking justification when relevant.
+    - The table's **Scale Score** (0-100) already combines each video's share of spend with its efficiency on the key metric for this stage ({priority_metrics.get(funnel_stage, "the campaign goal")}). Use it as your starting point for the ranking, and explain any place where you deviate from it.
+
+    **Campaign Data:**
+    ---
+    {video_data_string}
+    ---
+
+    **Your Comprehensive Task:**
+    Generate a final strategic report with FIVE sections.
+
+    **IMPORTANT FORMATTING INSTRUCTION:**
+    For Section 1, "Campaign Performance Scorecard," you MUST provide the output as a single, valid JSON array of objects. Each object needs three keys: "rank" (integer), "video_name" (string), and "justification" (string). Enclose the entire JSON block in ```json ... ```.
+
+    For all other sections, use standard H3 markdown headers (e.g., ### 2. Section Name).
+
+    **SECTION 1: CAMPAIGN PERFORMANCE SCORECARD (JSON ARRAY)**
+    ```json
+    [
+      {{"rank": 1, "video_name": "example_video_1.mp4", "justification": "This video ranked first due to its outstanding ROAS of 7.2, directly aligning with the conversion goal. The clear product shot in the first 3 seconds likely drove this performance."}},
+      {{"rank": 2, "video_name": "example_video_2.mp4", "justification": "While having a slightly higher CPA, this ad proved its ability to scale by handling over $5,000 in spend while maintaining a strong 4.5 ROAS. This makes it a highly valuable creative."}}
+    ]
+    ```
+
+    ### 2. Common Themes in Top Performers
+    (Your analysis here...)
+
+    ### 3. Actionable Recommendations
+    (Your analysis here...)
+
+    ### 4. New Creative Ideas (Ad Scripts)
+    (Your analysis here...)
+
+    ### 5. Suggested Ad Copy
+    (Your analysis here...)
+    """
+
+
+def campaign_report_key(file_digests, kpis, funnel_stage, map_reduce=False, media="original"):
+    """Cache key for a campaign report: video content hashes, normalized KPIs, stage, model and prompt version."""
+    return report_fingerprint(
+        videos=file_digests,
+        media=media,
+        kpis=normalize_kpis({name: kpis.get(name, {}) for name in file_digests}),
+        funnel_stage=funnel_stage,
+        model=REPORT_MODEL,
+        prompt_version=COMPREHENSIVE_PROMPT_VERSION,
+        analysis_mode=f"map_reduce:{MAP_MODEL}:{MAP_PROMPT_VERSION}" if map_reduce else "single_pass",
+    )
+
+
+def generate_campaign_report(files_info, all_kpis, funnel_stage, map_reduce=False, report_cache=None, force_refresh=False, on_text=None):
+    """
+    Writes the comprehensive report for the active videos in `files_info`, either in one pass over every
+    video or map-reduce style over per-video summaries. The report is streamed; `on_text(text_so_far)` is
+    called after every chunk. Returns (report_text, files_info actually covered, warnings).
+    """
+    kpis_for_prompt = {info["original_filename"]: all_kpis.get(info["original_filename"], {}) for info in files_info}
+    warnings = []
+    if map_reduce:
+        # Map: one compact analysis per video, in parallel and cached per video.
+        summaries, map_errors = summarize_videos(files_info, kpis_for_prompt, report_cache, force_refresh)
+        warnings = [f"'{name}' was left out of the report: {error}" for name, error in map_errors.items()]
+        if not summaries:
+            raise ValueError("Every per-video analysis failed.")
+        files_info = [info for info in files_info if info["original_filename"] in summaries]
+        kpis_for_prompt = {name: kpis for name, kpis in kpis_for_prompt.items() if name in summaries}
+        # Reduce: a text-only synthesis over the summaries plus KPIs.
+        prompt_parts = [create_comprehensive_analysis_prompt(kpis_for_prompt, funnel_stage, video_summaries=summaries)]
+    else:
+        prompt_parts = [create_comprehensive_analysis_prompt(kpis_for_prompt, funnel_stage)]
+        for info in files_info:
+            prompt_parts.append(get_backend().get_file(name=info["api_file_name"]))
+
+    model = get_backend().model(REPORT_MODEL)
+    report_text = ""
+    with telemetry.span("generate", model=REPORT_MODEL, map_reduce=map_reduce) as record:
+        chunk = None
+        for chunk in call_with_retries(lambda: model.generate_content(prompt_parts, stream=True)):
+            record.setdefault("first_token_s", time.time() - record["start"])
+            try: chunk_text = chunk.text
+            except ValueError: continue  # e.g. a chunk carrying only safety or finish metadata
+            report_text += chunk_text
+            if on_text:
+                on_text(report_text)
+        # A streamed response reports its token usage on the last chunk.
+        telemetry.add_usage(chunk, REPORT_MODEL)
+    return report_text, files_info, warnings
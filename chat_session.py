@@ -0,0 +1,122 @@
+import datetime
+from google.api_core import exceptions as api_exceptions
+import telemetry
+from backends import get_backend
+from pipeline import call_with_retries
+
+# --- Configuration ---
+CHAT_MODEL = "gemini-1.5-pro"
+# Server-side context caching needs an explicitly versioned model and a large enough context.
+CACHED_CHAT_MODEL = "models/gemini-1.5-pro-002"
+CONTEXT_CACHE_MIN_TOKENS = 32_768
+CONTEXT_CACHE_TTL = datetime.timedelta(hours=1)
+# A cached context this close to expiring is not used for another message.
+CONTEXT_CACHE_EXPIRY_MARGIN = datetime.timedelta(minutes=2)
+
+# Most recent exchanges kept verbatim; older ones are folded into a rolling summary.
+MAX_HISTORY_TURNS = 6
+SUMMARY_MODEL = "gemini-1.5-flash"
+
+
+class ReportChat:
+    """
+    One chat session per analysis. The report context is attached once, as a server-side cached
+    context when it is large enough to qualify or as the model's system instruction otherwise,
+    and the history is bounded, so per-message input stays roughly constant over a long conversation.
+    Once the cached context expires (after CONTEXT_CACHE_TTL) the chat carries on with the plain
+    system instruction.
+    """
+
+    def __init__(self, system_prompt, cache_min_tokens=CONTEXT_CACHE_MIN_TOKENS):
+        self.system_prompt = system_prompt
+        self.cached_content = None
+        self.cache_min_tokens = cache_min_tokens
+        self.model = self._build_model(system_prompt)
+        self.summary = ""
+        self.turns = []
+
+    def _build_model(self, system_prompt):
+        try:
+            token_count = get_backend().model(CHAT_MODEL).count_tokens(system_prompt).total_tokens
+            if token_count >= self.cache_min_tokens:
+                self.cached_content = get_backend().create_cached_content(
+                    model=CACHED_CHAT_MODEL, system_instruction=system_prompt, ttl=CONTEXT_CACHE_TTL,
+                )
+                return get_backend().model_from_cached_content(self.cached_content)
+        except Exception:
+            # Context caching is an optimization; fall back to a plain system instruction.
+            self.cached_content = None
+        return get_backend().model(CHAT_MODEL, system_instruction=system_prompt)
+
+    def _use_system_instruction(self):
+        """Drops the cached context and attaches the report as a plain system instruction instead."""
+        self.close()
+        self.model = get_backend().model(CHAT_MODEL, system_instruction=self.system_prompt)
+
+    def _cache_expired(self):
+        expire_time = getattr(self.cached_content, "expire_time", None)
+        return expire_time is not None and expire_time <= datetime.datetime.now(datetime.timezone.utc) + CONTEXT_CACHE_EXPIRY_MARGIN
+
+    def _generate(self, message):
+        if self.cached_content is not None and self._cache_expired():
+            self._use_system_instruction()
+        try:
+            return call_with_retries(lambda: self.model.generate_content(self._contents(message), stream=True))
+        except (api_exceptions.NotFound, api_exceptions.PermissionDenied):
+            if self.cached_content is None:
+                raise
+            # The cached context is gone (expired early or deleted); it can't be used again.
+            self._use_system_instruction()
+            return call_with_retries(lambda: self.model.generate_content(self._contents(message), stream=True))
+
+    def _contents(self, message):
+        contents = []
+        if self.summary:
+            contents.append({"role": "user", "parts": [f"Summary of our conversation so far: {self.summary}"]})
+            contents.append({"role": "model", "parts": ["Noted. I'll keep that context in mind."]})
+        contents.extend(self.turns)
+        contents.append({"role": "user", "parts": [message]})
+        return contents
+
+    def stream_reply(self, message):
+        """Yields the answer to `message` chunk by chunk, then records the exchange in the bounded history."""
+        with telemetry.span("chat", model=CHAT_MODEL, context_cached=self.cached_content is not None):
+            response = self._generate(message)
+            reply, chunk = "", None
+            for chunk in response:
+                try: text = chunk.text
+                except ValueError: continue
+                reply += text
+                yield text
+            telemetry.add_usage(chunk, CHAT_MODEL)
+        self.turns.append({"role": "user", "parts": [message]})
+        self.turns.append({"role": "model", "parts": [reply]})
+        self._trim()
+
+    def _trim(self):
+        """Folds the oldest exchanges into the rolling summary once the history exceeds MAX_HISTORY_TURNS."""
+        overflow = len(self.turns) - 2 * MAX_HISTORY_TURNS
+        if overflow <= 0:
+            return
+        folded, self.turns = self.turns[:overflow], self.turns[overflow:]
+        transcript = "\n".join(f"{turn['role'].upper()}: {turn['parts'][0]}" for turn in folded)
+        prompt = f"""Update this running summary of a conversation about a marketing report with the new exchanges below.
+    Keep every fact, number and decision a follow-up question might refer to. At most 150 words.
+
+    **CURRENT SUMMARY:** {self.summary or "(empty)"}
+
+    **NEW EXCHANGES:**
+    {transcript}
+    """
+        try:
+            self.summary = get_backend().model(SUMMARY_MODEL).generate_content(prompt).text.strip()
+        except Exception:
+            # Losing the oldest turns is better than letting the history grow without bound.
+            pass
+
+    def close(self):
+        """Deletes the server-side cached context, if one was created."""
+        if self.cached_content is not None:
+            try: self.cached_content.delete()
+            except Exception: pass
+            self.cached_content = None
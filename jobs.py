@@ -0,0 +1,222 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+from upload_cache import CACHE_DIR
+
+# --- Configuration ---
+# The job database and the spooled videos jobs read from. The app and every worker must share
+# REEL_CACHE_DIR, which means one host: this database (like the report, upload and download caches)
+# is SQLite in WAL mode, which needs a local filesystem and does not work on NFS/SMB volumes.
+# Scale out with more worker processes on that host (worker.py --processes), not more hosts.
+JOBS_DB_PATH = os.path.join(CACHE_DIR, "jobs.sqlite3")
+SPOOL_DIR = os.path.join(CACHE_DIR, "spool")
+
+# Workers touch their heartbeat this often. A running job whose heartbeat is older than
+# STALE_AFTER belongs to a dead worker and is handed to the next worker that asks for work.
+HEARTBEAT_INTERVAL = 5.0
+STALE_AFTER = 60.0
+MAX_ATTEMPTS = 3
+
+# Finished jobs (and spooled videos) older than this are pruned.
+JOB_RETENTION = 7 * 24 * 3600
+SPOOL_RETENTION = 24 * 3600
+
+JOB_STATUSES = ("queued", "running", "complete", "failed")
+
+
+class JobStore:
+    """
+    Durable, SQLite-backed job queue shared by the app and the workers.
+
+    The app only submits jobs and reads their status, progress and results; workers claim queued
+    jobs, report progress and record the outcome. Like ReportCache, every call opens its own
+    short-lived connection and the database runs in WAL mode, so any number of threads and
+    processes can use the same file.
+    """
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or JOBS_DB_PATH
+        self._init_lock = threading.Lock()
+        self._initialized = False
+
+    def _connect(self):
+        if not self._initialized:
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        if not self._initialized:
+            with self._init_lock:
+                if not self._initialized:
+                    conn.execute("PRAGMA journal_mode=WAL")
+                    conn.execute("""CREATE TABLE IF NOT EXISTS jobs (
+                        id TEXT PRIMARY KEY, kind TEXT NOT NULL, status TEXT NOT NULL, payload TEXT NOT NULL,
+                        progress TEXT, partial_report TEXT, result TEXT, error TEXT,
+                        attempts INTEGER NOT NULL DEFAULT 0, worker_id TEXT,
+                        created_at REAL NOT NULL, started_at REAL, finished_at REAL, heartbeat_at REAL)""")
+                    conn.execute("CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs(status, created_at)")
+                    conn.execute("CREATE TABLE IF NOT EXISTS workers (id TEXT PRIMARY KEY, heartbeat_at REAL NOT NULL)")
+                    conn.commit()
+                    self._initialized = True
+        return conn
+
+    @staticmethod
+    def _job(row):
+        if row is None:
+            return None
+        job = dict(row)
+        for column in ("payload", "progress", "result"):
+            job[column] = json.loads(job[column]) if job[column] else None
+        return job
+
+    # --- App side ---
+    def submit(self, kind, payload, job_id=None):
+        """Queues a job and returns its id (a new one unless `job_id` is given)."""
+        job_id = job_id or uuid.uuid4().hex
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute(
+                    "INSERT INTO jobs (id, kind, status, payload, progress, created_at) VALUES (?, ?, 'queued', ?, '{}', ?)",
+                    (job_id, kind, json.dumps(payload, default=str), time.time()),
+                )
+        finally:
+            conn.close()
+        return job_id
+
+    def get(self, job_id):
+        """Returns the job as a dict (payload, progress and result decoded), or None if it doesn't exist."""
+        conn = self._connect()
+        try:
+            return self._job(conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone())
+        finally:
+            conn.close()
+
+    def retry(self, job_id):
+        """Puts a failed job back in the queue with a fresh attempt budget."""
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute(
+                    "UPDATE jobs SET status = 'queued', error = NULL, attempts = 0, progress = '{}', partial_report = NULL, worker_id = NULL WHERE id = ? AND status = 'failed'",
+                    (job_id,),
+                )
+        finally:
+            conn.close()
+
+    def live_workers(self, within=STALE_AFTER):
+        """Number of workers that sent a heartbeat in the last `within` seconds."""
+        conn = self._connect()
+        try:
+            return conn.execute("SELECT COUNT(*) FROM workers WHERE heartbeat_at >= ?", (time.time() - within,)).fetchone()[0]
+        finally:
+            conn.close()
+
+    def counts(self):
+        """{status: number of jobs} over every status."""
+        conn = self._connect()
+        try:
+            counts = dict(conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+        finally:
+            conn.close()
+        return {status: counts.get(status, 0) for status in JOB_STATUSES}
+
+    # --- Worker side ---
+    def claim(self, worker_id):
+        """
+        Atomically hands the oldest queued job (or a job abandoned by a dead worker) to `worker_id`.
+        Returns the job, or None when there is nothing to do.
+        """
+        now = time.time()
+        conn = self._connect()
+        conn.isolation_level = None
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(
+                    "UPDATE jobs SET status = 'failed', error = 'The worker running this job stopped responding too many times.', finished_at = ? "
+                    "WHERE status = 'running' AND heartbeat_at < ? AND attempts >= ?",
+                    (now, now - STALE_AFTER, MAX_ATTEMPTS),
+                )
+                row = conn.execute(
+                    "SELECT id FROM jobs WHERE status = 'queued' OR (status = 'running' AND heartbeat_at < ?) ORDER BY created_at LIMIT 1",
+                    (now - STALE_AFTER,),
+                ).fetchone()
+                if row is not None:
+                    conn.execute(
+                        "UPDATE jobs SET status = 'running', worker_id = ?, attempts = attempts + 1, started_at = ?, heartbeat_at = ? WHERE id = ?",
+                        (worker_id, now, now, row["id"]),
+                    )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            return self._job(conn.execute("SELECT * FROM jobs WHERE id = ?", (row["id"],)).fetchone()) if row else None
+        finally:
+            conn.close()
+
+    def heartbeat(self, worker_id, job_ids=()):
+        """Marks the worker, and the jobs it is running, as alive."""
+        now = time.time()
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute("INSERT OR REPLACE INTO workers (id, heartbeat_at) VALUES (?, ?)", (worker_id, now))
+                conn.executemany("UPDATE jobs SET heartbeat_at = ? WHERE id = ? AND worker_id = ? AND status = 'running'", [(now, job_id, worker_id) for job_id in job_ids])
+        finally:
+            conn.close()
+
+    def update_progress(self, job_id, progress=None, partial_report=None):
+        """Records a running job's progress dict and/or the report text written so far."""
+        assignments, values = ["heartbeat_at = ?"], [time.time()]
+        if progress is not None:
+            assignments.append("progress = ?"); values.append(json.dumps(progress, default=str))
+        if partial_report is not None:
+            assignments.append("partial_report = ?"); values.append(partial_report)
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute(f"UPDATE jobs SET {', '.join(assignments)} WHERE id = ?", (*values, job_id))
+        finally:
+            conn.close()
+
+    def complete(self, job_id, result):
+        self._finish(job_id, "complete", result=json.dumps(result, default=str))
+
+    def fail(self, job_id, error):
+        self._finish(job_id, "failed", error=str(error))
+
+    def _finish(self, job_id, status, result=None, error=None):
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute("UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? WHERE id = ?", (status, result, error, time.time(), job_id))
+        finally:
+            conn.close()
+
+    def prune(self, older_than=JOB_RETENTION):
+        """Deletes finished jobs and silent workers older than `older_than` seconds."""
+        cutoff = time.time() - older_than
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute("DELETE FROM jobs WHERE status IN ('complete', 'failed') AND finished_at < ?", (cutoff,))
+                conn.execute("DELETE FROM workers WHERE heartbeat_at < ?", (cutoff,))
+        finally:
+            conn.close()
+
+
+def collect_spool(max_age=SPOOL_RETENTION):
+    """Removes spooled videos older than `max_age` seconds; by then their jobs have long finished."""
+    if not os.path.isdir(SPOOL_DIR):
+        return
+    cutoff = time.time() - max_age
+    for name in os.listdir(SPOOL_DIR):
+        path = os.path.join(SPOOL_DIR, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except OSError:
+            pass
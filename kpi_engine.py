@@ -0,0 +1,224 @@
+import os
+import re
+import numpy as np
+import pandas as pd
+
+# --- Configuration ---
+# Rows are read in chunks and filtered to the uploaded creatives right away, so a 100k+ row
+# ad-platform export never has to sit in memory in full.
+CSV_CHUNK_SIZE = 50_000
+
+# Export column names (lowercased) that mean the same thing across Meta, TikTok and Google exports.
+COLUMN_ALIASES = {
+    "Spend": ["spend", "amount spent", "amount spent (usd)", "cost", "total cost"],
+    "Impressions": ["impressions", "impr.", "impr"],
+    "Clicks": ["clicks", "link clicks", "clicks (all)", "clicks (destination)"],
+    "Conversions": ["conversions", "purchases", "results", "leads", "total conversions"],
+    "Revenue": ["revenue", "purchase conversion value", "purchases conversion value", "conversion value", "total complete payment value"],
+    "Video Views": ["video views", "3-second video views", "thruplays", "video plays"],
+}
+
+# Derived metrics replace any export column with one of these names, since ours are computed
+# from aggregated totals and stay consistent with each other.
+DERIVED_ALIASES = {
+    "CTR (%)": ["ctr", "ctr (%)", "ctr (all)", "ctr (link click-through rate)", "click-through rate"],
+    "CPC": ["cpc", "cpc (all)", "cost per click", "cpc (cost per link click)"],
+    "CPA": ["cpa", "cost per result", "cost per purchase", "cost per conversion", "cost / conv."],
+    "ROAS": ["roas", "purchase roas", "purchase roas (return on ad spend)", "return on ad spend"],
+    "CPM": ["cpm", "cpm (cost per 1,000 impressions)", "cost per 1000 impressions"],
+}
+
+# Ratio-like columns are averaged (not summed) when an export has several rows per creative.
+RATIO_KEYWORDS = ("%", "rate", "ctr", "cpc", "cpa", "cpm", "roas", "frequency", "cost per", "average", "avg")
+
+# Identifier columns (Ad ID, campaign_id, ...) look numeric but are labels: they are kept as text,
+# so they are never summed across rows or printed with thousands separators.
+IDENTIFIER_PATTERN = re.compile(r"(?:^|[\s_.-])ids?$", re.IGNORECASE)
+
+# Non-integer values keep this many significant digits (and at least 2 decimals) wherever they
+# are shown or sent to the model, so small rates like 0.0234 survive.
+SIGNIFICANT_DIGITS = 4
+
+# The efficiency metric that matters for each funnel stage, and whether higher is better.
+STAGE_EFFICIENCY_METRIC = {
+    "Awareness": ("CPM", False),
+    "Traffic": ("CPC", False),
+    "Conversion": ("ROAS", True),
+}
+# Weight of spend vs. efficiency in the "ability to scale" score.
+SCALE_SPEND_WEIGHT = 0.6
+
+
+# --- Parsing ---
+def parse_numeric(series):
+    """Vectorized parse of currency, percentage and thousands-separated strings into floats (NaN if unparseable)."""
+    cleaned = (
+        series.astype("string")
+        .str.strip()
+        .str.replace(r"[\$€£¥₹,\s%]", "", regex=True)
+        .str.replace(r"^\((.*)\)$", r"-\1", regex=True)
+    )
+    return pd.to_numeric(cleaned, errors="coerce").astype("float64")
+
+
+def _numeric_columns(frame):
+    """
+    Converts every column whose non-empty values all parse as numbers; leaves the rest (and
+    identifier columns) as strings. A column written as percentages gets a " (%)" suffix, so the
+    unit survives the conversion.
+    """
+    frame = frame.copy()
+    percent_names = {}
+    for column in frame.columns:
+        if IDENTIFIER_PATTERN.search(str(column).strip()):
+            continue
+        values = frame[column]
+        parsed = parse_numeric(values)
+        present = values.notna() & (values.astype("string").str.strip() != "")
+        if present.any() and parsed[present].notna().all():
+            frame[column] = parsed
+            if "%" not in str(column) and values.astype("string").str.contains("%", regex=False).any():
+                percent_names[column] = f"{column} (%)"
+    return frame.rename(columns={column: name for column, name in percent_names.items() if name not in frame.columns})
+
+
+def _canonical_name(column, aliases):
+    lowered = str(column).strip().lower()
+    for canonical, names in aliases.items():
+        if lowered in names:
+            return canonical
+    return None
+
+
+def _aggregate(frame):
+    """Collapses duplicate rows per creative: totals are summed, ratios averaged, text keeps the first value."""
+    rules = {}
+    for column in frame.columns:
+        if pd.api.types.is_numeric_dtype(frame[column]):
+            is_ratio = any(keyword in str(column).lower() for keyword in RATIO_KEYWORDS)
+            rules[column] = "mean" if is_ratio else "sum"
+        else:
+            rules[column] = "first"
+    if not rules:
+        return frame[~frame.index.duplicated()]
+    # A creative with no value at all in a column stays empty rather than summing to 0.
+    return frame.groupby(level=0, sort=False).agg(rules).where(frame.notna().groupby(level=0, sort=False).any())
+
+
+def _merge_duplicate_columns(frame):
+    """Collapses columns that ended up with the same name (two aliases of one metric); the leftmost non-empty value wins."""
+    if not frame.columns.duplicated().any():
+        return frame
+    merged = {}
+    for name in dict.fromkeys(frame.columns):
+        columns = frame.loc[:, frame.columns == name]
+        merged[name] = columns.replace("", np.nan).bfill(axis=1).iloc[:, 0].infer_objects() if columns.shape[1] > 1 else columns.iloc[:, 0]
+    return pd.DataFrame(merged, index=frame.index)
+
+
+# --- Derived Metrics ---
+def add_derived_metrics(frame, funnel_stage=None):
+    """Adds CTR, CPC, CPA, ROAS, CPM and a spend-weighted "Scale Score" (0-100) wherever the inputs exist."""
+    frame = _merge_duplicate_columns(frame.rename(columns={c: _canonical_name(c, COLUMN_ALIASES) or c for c in frame.columns}))
+    base = {name: frame[name] for name in COLUMN_ALIASES if name in frame.columns and pd.api.types.is_numeric_dtype(frame[name])}
+
+    def ratio(numerator, denominator, scale=1.0):
+        return (base[numerator] / base[denominator].replace(0, np.nan)) * scale
+
+    derived = {}
+    if "Clicks" in base and "Impressions" in base: derived["CTR (%)"] = ratio("Clicks", "Impressions", 100)
+    if "Spend" in base and "Clicks" in base: derived["CPC"] = ratio("Spend", "Clicks")
+    if "Spend" in base and "Conversions" in base: derived["CPA"] = ratio("Spend", "Conversions")
+    if "Revenue" in base and "Spend" in base: derived["ROAS"] = ratio("Revenue", "Spend")
+    if "Spend" in base and "Impressions" in base: derived["CPM"] = ratio("Spend", "Impressions", 1000)
+
+    replaced = [c for c in frame.columns if _canonical_name(c, DERIVED_ALIASES) in derived]
+    frame = frame.drop(columns=replaced)
+    for name, values in derived.items():
+        frame[name] = values
+
+    if "Spend" in base:
+        spend_rank = base["Spend"].rank(pct=True)
+        metric, higher_is_better = STAGE_EFFICIENCY_METRIC.get(funnel_stage, (None, True))
+        if metric in frame.columns and pd.api.types.is_numeric_dtype(frame[metric]):
+            efficiency_rank = frame[metric].rank(pct=True, ascending=higher_is_better)
+            score = SCALE_SPEND_WEIGHT * spend_rank + (1 - SCALE_SPEND_WEIGHT) * efficiency_rank.fillna(0)
+        else:
+            score = spend_rank
+        frame["Spend Share (%)"] = base["Spend"] / base["Spend"].sum() * 100 if base["Spend"].sum() else np.nan
+        frame["Scale Score"] = (score * 100).round(0)
+    return frame
+
+
+# --- Public API ---
+def load_kpi_csv(source, filenames, chunksize=CSV_CHUNK_SIZE):
+    """
+    Reads a metrics CSV in chunks, keeping only rows whose 'filename' matches one of `filenames`
+    (with or without extension). Returns a numeric, de-duplicated DataFrame indexed by the uploaded
+    filename. Raises ValueError if the CSV has no 'filename' column.
+    """
+    lookup = {}
+    for name in filenames:
+        lookup[name] = name
+        lookup.setdefault(os.path.splitext(name)[0], name)
+
+    if hasattr(source, "seek"):
+        source.seek(0)
+    kept = []
+    for chunk in pd.read_csv(source, dtype=str, chunksize=chunksize, skipinitialspace=True):
+        if "filename" not in chunk.columns:
+            raise ValueError("Missing 'filename' column.")
+        keys = chunk["filename"].str.strip().map(lookup)
+        matched = chunk[keys.notna()].drop(columns="filename")
+        kept.append(matched.set_axis(keys[keys.notna()].values, axis=0))
+    if not kept:
+        return pd.DataFrame()
+    frame = pd.concat(kept)
+    frame = frame.dropna(axis=1, how="all")
+    return _aggregate(_numeric_columns(frame))
+
+
+def kpi_frame_from_dict(all_kpi_data, funnel_stage=None):
+    """Builds the numeric KPI table (with derived metrics and Scale Score) from the app's {filename: {kpi: value}} dict."""
+    frame = pd.DataFrame.from_dict(all_kpi_data, orient="index", dtype=str).reindex(list(all_kpi_data))
+    if frame.empty or not len(frame.columns):
+        return frame
+    return add_derived_metrics(_aggregate(_numeric_columns(frame)), funnel_stage)
+
+
+def _decimals(value):
+    """Decimal places that keep SIGNIFICANT_DIGITS of `value`, and never fewer than 2."""
+    if not value or not np.isfinite(value):
+        return 2
+    return max(2, SIGNIFICANT_DIGITS - 1 - int(np.floor(np.log10(abs(value)))))
+
+
+def format_kpi_value(value):
+    """Display string for a KPI value (used to pre-fill the editable metric inputs and in cache keys)."""
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return ""
+    if isinstance(value, (int, float, np.number)):
+        if float(value).is_integer():
+            return f"{int(value):,}"
+        return f"{value:,.{_decimals(value)}f}".rstrip("0").rstrip(".")
+    return str(value)
+
+
+def kpi_records(frame):
+    """{filename: {column: display string}} for the non-empty values of a KPI DataFrame."""
+    records = {}
+    for filename, row in frame.iterrows():
+        records[filename] = {str(k): format_kpi_value(v) for k, v in row.items() if format_kpi_value(v) != ""}
+    return records
+
+
+def kpi_table_for_prompt(frame):
+    """Compact CSV rendering of the KPI table (numbers rounded to SIGNIFICANT_DIGITS), ranked by Scale Score when available."""
+    if frame.empty:
+        return "(no metrics provided)"
+    if "Scale Score" in frame.columns:
+        frame = frame.sort_values("Scale Score", ascending=False)
+    frame = frame.copy()
+    for column in frame.select_dtypes("number").columns:
+        frame[column] = frame[column].map(lambda value: round(value, _decimals(value)) if pd.notna(value) else value)
+    return frame.to_csv(index_label="video_file", float_format="%.12g").strip()
@@ -0,0 +1,198 @@
+import os
+import time
+import random
+import hashlib
+import tempfile
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import httplib2
+from google.api_core import exceptions as api_exceptions
+from googleapiclient import errors as googleapiclient_errors
+import telemetry
+from upload_cache import file_sha256
+
+# --- Configuration ---
+# Cap on uploads in flight at once. Each upload holds an HTTP connection and a spooled file,
+# so this is the main knob for trading memory and bandwidth against wall-clock time.
+MAX_CONCURRENT_UPLOADS = int(os.environ.get("REEL_MAX_CONCURRENT_UPLOADS", "4"))
+
+# Uploaded videos are copied to disk in chunks of this size, so peak memory per upload is
+# bounded by the chunk size rather than by the size of the video.
+SPOOL_CHUNK_SIZE = int(os.environ.get("REEL_SPOOL_CHUNK_SIZE", str(1024 * 1024)))
+
+# Errors worth retrying: network hiccups, rate limits and server-side 5xx responses. Uploads go
+# through googleapiclient, which raises HttpError (retried for 429 and 5xx, like http_get in
+# reel_fetch) and httplib2 errors (e.g. DNS failures) instead of google.api_core exceptions.
+TRANSIENT_ERRORS = (
+    ConnectionError,
+    TimeoutError,
+    httplib2.HttpLib2Error,
+    api_exceptions.TooManyRequests,
+    api_exceptions.ResourceExhausted,
+    api_exceptions.InternalServerError,
+    api_exceptions.ServiceUnavailable,
+    api_exceptions.GatewayTimeout,
+    api_exceptions.DeadlineExceeded,
+)
+
+
+def is_transient(error):
+    """True if `error` is worth retrying (see TRANSIENT_ERRORS)."""
+    if isinstance(error, googleapiclient_errors.HttpError):
+        return error.status_code == 429 or (error.status_code or 0) >= 500
+    return isinstance(error, TRANSIENT_ERRORS)
+
+
+# --- Retry Helper ---
+def call_with_retries(fn, retries=4, base_delay=1.0, max_delay=30.0, on_retry=None):
+    """
+    Calls `fn()` and retries transient errors with exponential backoff and full jitter.
+    `on_retry(attempt, error, delay)` is called before each sleep. Non-transient errors
+    and the final transient error are re-raised.
+    """
+    attempt = 0
+    while True:
+        try:
+            return fn()
+        except Exception as e:
+            if not is_transient(e):
+                raise
+            attempt += 1
+            if attempt > retries:
+                raise
+            delay = random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+            telemetry.count("retries", error=type(e).__name__)
+            if on_retry:
+                on_retry(attempt, e, delay)
+            time.sleep(delay)
+
+
+# --- Rate Limiting ---
+class RateLimiter:
+    """Thread-safe token bucket: at most `rate_per_minute` acquisitions per minute, with bursts up to `burst`."""
+
+    def __init__(self, rate_per_minute, burst=1):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = max(1, burst)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Blocks until a token is available."""
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+# --- Ingestion Stage ---
+def _iter_chunks(fileobj, chunk_size=SPOOL_CHUNK_SIZE):
+    """Yields the contents of a file-like object from the start, reusing one fixed-size buffer."""
+    buffer = bytearray(chunk_size)
+    view = memoryview(buffer)
+    # Streams such as an HTTP response body are read from where they are.
+    if hasattr(fileobj, "seek") and getattr(fileobj, "seekable", lambda: True)():
+        fileobj.seek(0)
+    try:
+        while True:
+            if hasattr(fileobj, "readinto"):
+                n = fileobj.readinto(buffer)
+                chunk = view[:n]
+            else:
+                chunk = fileobj.read(chunk_size)
+                n = len(chunk)
+            if not n:
+                break
+            yield chunk
+    finally:
+        view.release()
+
+
+def fileobj_sha256(fileobj, chunk_size=SPOOL_CHUNK_SIZE):
+    """Hex SHA-256 of a file-like object's contents, without copying it anywhere."""
+    digest = hashlib.sha256()
+    for chunk in _iter_chunks(fileobj, chunk_size):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def spool_to_dir(fileobj, directory, suffix="", chunk_size=SPOOL_CHUNK_SIZE):
+    """
+    Streams a file-like object into `directory` under its content hash (`<sha256><suffix>`), so a
+    worker process can pick it up later. A file that is already there is kept (and its mtime
+    refreshed). Returns {"path", "digest", "size"}.
+    """
+    os.makedirs(directory, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(suffix=".part", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as out:
+            for chunk in _iter_chunks(fileobj, chunk_size):
+                digest.update(chunk)
+                out.write(chunk)
+                size += len(chunk)
+        path = os.path.join(directory, digest.hexdigest() + suffix)
+        if os.path.exists(path):
+            os.utime(path)
+        else:
+            os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return {"path": path, "digest": digest.hexdigest(), "size": size}
+
+
+# --- Upload Stage ---
+def upload_one(path, upload_cache, digest=None):
+    """Uploads one video through the upload cache (with retries). Returns {"digest", "remote_file"}."""
+    with telemetry.span("upload", file=os.path.basename(path)):
+        digest = digest or file_sha256(path)
+        remote_file = call_with_retries(lambda: upload_cache.get_or_upload(path, digest))
+    return {"digest": digest, "remote_file": remote_file}
+
+
+def run_many(items, fn, max_workers=MAX_CONCURRENT_UPLOADS, on_progress=None):
+    """
+    Runs `fn(item)` for every item on a bounded thread pool.
+
+    Returns one result dict per item, in input order: {"item", "result", "error", "elapsed"}.
+    A failing item never aborts the others. `on_progress(done, total, outcome)` is called from
+    the calling thread as each item finishes, so it is safe to update Streamlit widgets from it.
+    """
+    items = list(items)
+    outcomes = [None] * len(items)
+    if not items:
+        return outcomes
+
+    def run(item):
+        started = time.perf_counter()
+        try:
+            return {"item": item, "result": fn(item), "error": None, "elapsed": time.perf_counter() - started}
+        except Exception as e:
+            return {"item": item, "result": None, "error": e, "elapsed": time.perf_counter() - started}
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(items)))) as pool:
+        # Each task runs in a copy of the caller's context, so telemetry spans land in the caller's run.
+        futures = {pool.submit(contextvars.copy_context().run, run, item): index for index, item in enumerate(items)}
+        for done, future in enumerate(as_completed(futures), start=1):
+            outcome = future.result()
+            outcomes[futures[future]] = outcome
+            if on_progress:
+                on_progress(done, len(items), outcome)
+    return outcomes
+
+
+def upload_many(items, upload_fn, max_workers=MAX_CONCURRENT_UPLOADS, on_progress=None):
+    """Uploads every item with `upload_fn` on a bounded thread pool (see `run_many`)."""
+    return run_many(items, upload_fn, max_workers=max_workers, on_progress=on_progress)
@@ -0,0 +1,148 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from google.api_core import exceptions as api_exceptions
+import telemetry
+from backends import get_backend
+
+# --- Configuration ---
+# Gemini's video processing time grows roughly with file size, so the first poll of each file
+# is scheduled after SECONDS_PER_MB of its size (clamped), then backs off exponentially.
+SECONDS_PER_MB = 0.05
+MIN_POLL_INTERVAL = 1.0
+MAX_POLL_INTERVAL = 30.0
+BACKOFF_FACTOR = 1.6
+MAX_POLL_WORKERS = 8
+# Files still PROCESSING after this long are given up on and reported as FAILED.
+MAX_PROCESSING_TIME = 30 * 60
+
+TERMINAL_STATES = ("ACTIVE", "FAILED")
+# Errors that mean the file will never become ACTIVE (deleted, expired or not ours), unlike network hiccups.
+PERMANENT_ERRORS = (api_exceptions.NotFound, api_exceptions.PermissionDenied)
+
+
+def initial_poll_interval(size_bytes):
+    """First polling delay for a file of `size_bytes`, clamped to [MIN_POLL_INTERVAL, MAX_POLL_INTERVAL]."""
+    seconds = (size_bytes or 0) / (1024 * 1024) * SECONDS_PER_MB
+    return max(MIN_POLL_INTERVAL, min(MAX_POLL_INTERVAL, seconds))
+
+
+class StatusPoller:
+    """
+    Background poller that tracks every pending remote file of a job.
+
+    Each file has its own adaptive, exponentially growing polling interval. On every tick all
+    files that are due are polled concurrently, and polling stops as soon as every file is
+    ACTIVE or FAILED. `files` maps remote file names to {"size": bytes, "state": current state}.
+    A file that no longer exists, or is still processing after `max_processing_time`, becomes FAILED.
+    `on_change(states)` is called from the polling thread; an exception from it is counted and
+    ignored, and whatever happens the poller ends up done, so `wait()` always returns.
+    """
+
+    def __init__(self, files, max_workers=MAX_POLL_WORKERS, on_change=None, max_processing_time=MAX_PROCESSING_TIME):
+        now = time.monotonic()
+        self._deadline = now + max_processing_time
+        self._lock = threading.Lock()
+        self._files = {}
+        for name, info in files.items():
+            interval = initial_poll_interval(info.get("size"))
+            self._files[name] = {"state": info.get("state") or "PROCESSING", "interval": interval, "next_poll": now + interval, "polls": 0}
+        self._max_workers = max_workers
+        self._on_change = on_change
+        self._stop = threading.Event()
+        self._done = threading.Event()
+        self._thread = None
+        self._check_done()
+
+    # --- Public API ---
+    def start(self):
+        if self._thread is None and not self._done.is_set():
+            self._thread = threading.Thread(target=self._run, name="status-poller", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def wait(self, timeout=None):
+        """Blocks until every file is ACTIVE or FAILED (or `timeout` passes). Returns the final states."""
+        self.start()
+        self._done.wait(timeout)
+        return self.states()
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    def states(self):
+        with self._lock:
+            return {name: info["state"] for name, info in self._files.items()}
+
+    @property
+    def api_calls(self):
+        with self._lock:
+            return sum(info["polls"] for info in self._files.values())
+
+    # --- Internals ---
+    def _check_done(self):
+        with self._lock:
+            finished = all(info["state"] in TERMINAL_STATES for info in self._files.values())
+        if finished:
+            self._done.set()
+        return finished
+
+    def _poll(self, name):
+        try:
+            return name, get_backend().get_file(name=name).state.name
+        except PERMANENT_ERRORS:
+            return name, "FAILED"
+        except Exception:
+            # A transient error just means we try again on the next tick.
+            return name, None
+
+    def _notify(self):
+        if not self._on_change:
+            return
+        try:
+            self._on_change(self.states())
+        except Exception as e:
+            # E.g. a progress write that hit a locked database; the next change reports again.
+            telemetry.count("poller_errors", error=type(e).__name__)
+
+    def _run(self):
+        try:
+            self._poll_until_done()
+        except Exception as e:
+            # Files left PROCESSING are treated as failed by the caller.
+            telemetry.count("poller_errors", error=type(e).__name__)
+        finally:
+            self._done.set()
+
+    def _poll_until_done(self):
+        with ThreadPoolExecutor(max_workers=self._max_workers) as pool:
+            while not self._stop.is_set() and not self._check_done():
+                now = time.monotonic()
+                with self._lock:
+                    due = [n for n, info in self._files.items() if info["state"] not in TERMINAL_STATES and info["next_poll"] <= now]
+                changed = False
+                for name, state in pool.map(self._poll, due):
+                    with self._lock:
+                        info = self._files[name]
+                        info["polls"] += 1
+                        if state and state != info["state"]:
+                            info["state"] = state
+                            changed = True
+                        info["interval"] = min(MAX_POLL_INTERVAL, info["interval"] * BACKOFF_FACTOR)
+                        info["next_poll"] = time.monotonic() + info["interval"]
+                if time.monotonic() >= self._deadline:
+                    with self._lock:
+                        for info in self._files.values():
+                            if info["state"] not in TERMINAL_STATES:
+                                info["state"] = "FAILED"
+                                changed = True
+                if changed:
+                    self._notify()
+                with self._lock:
+                    pending = [info["next_poll"] for info in self._files.values() if info["state"] not in TERMINAL_STATES]
+                if pending:
+                    self._stop.wait(max(0.0, min(min(pending), self._deadline) - time.monotonic()))
@@ -0,0 +1,151 @@
+import os
+import time
+import shutil
+import multiprocessing
+import subprocess
+import threading
+from concurrent.futures import ProcessPoolExecutor
+import telemetry
+from upload_cache import CACHE_DIR
+
+# --- Configuration ---
+FFMPEG = os.environ.get("REEL_FFMPEG") or shutil.which("ffmpeg")
+FFPROBE = os.environ.get("REEL_FFPROBE") or shutil.which("ffprobe")
+MEDIA_DIR = os.path.join(CACHE_DIR, "media")
+# Proxies and hook clips unused for this long are deleted (each reuse refreshes a file's mtime).
+MEDIA_RETENTION = 3 * 24 * 3600
+
+# The analysis gains nothing from 4K 60fps masters: a 720p, 24fps, ~1.5 Mbit/s proxy carries the
+# same creative signal at a fraction of the bytes. Bitrate is lowered further for long videos so a
+# proxy never exceeds PROXY_MAX_BYTES.
+PROXY_MAX_HEIGHT = 720
+PROXY_FPS = 24
+PROXY_VIDEO_BITRATE = 1_500_000
+PROXY_AUDIO_BITRATE = 96_000
+PROXY_MAX_BYTES = 40 * 1024 * 1024
+HOOK_SECONDS = 3
+# Part of every cache key below; bump when the ffmpeg settings change.
+PROXY_PROFILE = f"proxy-v1-{PROXY_MAX_HEIGHT}p{PROXY_FPS}"
+
+MAX_PREPROCESS_WORKERS = int(os.environ.get("REEL_MAX_PREPROCESS_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+
+
+def ffmpeg_available():
+    return FFMPEG is not None
+
+
+def _duration_seconds(path):
+    if FFPROBE is None:
+        return None
+    try:
+        output = subprocess.run(
+            [FFPROBE, "-v", "error", "-show_entries", "format=duration", "-of", "default=noprint_wrappers=1:nokey=1", path],
+            capture_output=True, text=True, check=True, timeout=60,
+        ).stdout.strip()
+        return float(output)
+    except (subprocess.SubprocessError, ValueError):
+        return None
+
+
+def _run_ffmpeg(args, dst):
+    """Runs ffmpeg into a temp file next to `dst` and renames it into place, so a crash never leaves a partial output in the cache."""
+    tmp_dst = f"{dst}.{os.getpid()}.part.mp4"
+    try:
+        subprocess.run([FFMPEG, "-y", "-v", "error", *args, tmp_dst], capture_output=True, check=True)
+        os.replace(tmp_dst, dst)
+    finally:
+        if os.path.exists(tmp_dst):
+            os.remove(tmp_dst)
+
+
+def _make_proxy(src, dst):
+    video_bitrate = PROXY_VIDEO_BITRATE
+    duration = _duration_seconds(src)
+    if duration:
+        budget = PROXY_MAX_BYTES * 8 / duration - PROXY_AUDIO_BITRATE
+        video_bitrate = int(max(200_000, min(video_bitrate, budget * 0.95)))
+    _run_ffmpeg([
+        "-i", src,
+        "-vf", f"scale=-2:'min({PROXY_MAX_HEIGHT},ih)',fps={PROXY_FPS}",
+        "-c:v", "libx264", "-preset", "veryfast", "-b:v", str(video_bitrate), "-maxrate", str(video_bitrate), "-bufsize", str(2 * video_bitrate),
+        "-c:a", "aac", "-b:a", str(PROXY_AUDIO_BITRATE), "-ac", "2",
+        "-movflags", "+faststart",
+    ], dst)
+
+
+def _make_hook_clip(src, dst):
+    _run_ffmpeg([
+        "-i", src, "-t", str(HOOK_SECONDS),
+        "-vf", f"scale=-2:'min({PROXY_MAX_HEIGHT},ih)',fps={PROXY_FPS}",
+        "-c:v", "libx264", "-preset", "veryfast", "-c:a", "aac", "-b:a", str(PROXY_AUDIO_BITRATE),
+        "-movflags", "+faststart",
+    ], dst)
+
+
+def _preprocess_job(src, digest, make_hook):
+    """Process-pool worker: builds (or reuses) the proxy and optional hook clip for one video."""
+    os.makedirs(MEDIA_DIR, exist_ok=True)
+    proxy_path = os.path.join(MEDIA_DIR, f"{digest}-{PROXY_PROFILE}.mp4")
+    if os.path.exists(proxy_path):
+        os.utime(proxy_path)
+    else:
+        _make_proxy(src, proxy_path)
+    hook_path = None
+    if make_hook:
+        hook_path = os.path.join(MEDIA_DIR, f"{digest}-{PROXY_PROFILE}-hook{HOOK_SECONDS}s.mp4")
+        if os.path.exists(hook_path):
+            os.utime(hook_path)
+        else:
+            _make_hook_clip(src, hook_path)
+    return {"proxy_path": proxy_path, "hook_path": hook_path, "proxy_key": f"{digest}-{PROXY_PROFILE}", "hook_key": f"{digest}-{PROXY_PROFILE}-hook{HOOK_SECONDS}s" if make_hook else None}
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # "spawn" rather than fork: the callers (Streamlit, the upload thread pool) are multi-threaded.
+            _pool = ProcessPoolExecutor(max_workers=MAX_PREPROCESS_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def preprocess_video(src, digest, make_hook=False):
+    """
+    Transcodes `src` into a size-capped proxy (and, optionally, a first-HOOK_SECONDS hook clip) on the
+    shared process pool. Outputs are cached under MEDIA_DIR by the source's content hash, so a video is
+    only ever transcoded once. Safe to call from many threads at once.
+
+    Returns {"proxy_path", "proxy_key", "hook_path", "hook_key", "original_bytes", "proxy_bytes", "bytes_saved"},
+    where the keys are the upload-cache keys for each output. Falls back to the original file (keyed by its
+    plain digest, bytes_saved 0) when ffmpeg is missing or the proxy would not be smaller.
+    """
+    original_bytes = os.path.getsize(src)
+    if not ffmpeg_available():
+        return {"proxy_path": src, "proxy_key": digest, "hook_path": None, "hook_key": None, "original_bytes": original_bytes, "proxy_bytes": original_bytes, "bytes_saved": 0}
+    with telemetry.span("preprocess", file=os.path.basename(src)) as record:
+        result = _get_pool().submit(_preprocess_job, src, digest, make_hook).result()
+        proxy_bytes = os.path.getsize(result["proxy_path"])
+        if proxy_bytes >= original_bytes:
+            # Already a small, web-friendly file: the original is the better upload.
+            result["proxy_path"], result["proxy_key"], proxy_bytes = src, digest, original_bytes
+        result.update(original_bytes=original_bytes, proxy_bytes=proxy_bytes, bytes_saved=original_bytes - proxy_bytes)
+        record["bytes_saved"] = result["bytes_saved"]
+    return result
+
+
+def collect_media(max_age=MEDIA_RETENTION):
+    """Removes proxies and hook clips that have not been used for `max_age` seconds."""
+    if not os.path.isdir(MEDIA_DIR):
+        return
+    cutoff = time.time() - max_age
+    for name in os.listdir(MEDIA_DIR):
+        path = os.path.join(MEDIA_DIR, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except OSError:
+            pass
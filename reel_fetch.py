@@ -0,0 +1,373 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import argparse
+import itertools
+import threading
+from urllib.parse import urljoin
+import requests
+from requests.adapters import HTTPAdapter
+import instaloader
+import telemetry
+from upload_cache import CACHE_DIR
+from pipeline import RateLimiter, call_with_retries, run_many, spool_to_dir
+from kpi_engine import format_kpi_value
+
+# --- Configuration ---
+# Downloaded reels are stored under their content hash, next to a small index of shortcode -> hash,
+# so a reel (or a repost of the same video) is only ever downloaded once.
+DOWNLOAD_DIR = os.path.join(CACHE_DIR, "downloads")
+DOWNLOAD_RETENTION = 30 * 24 * 3600
+
+# Where reel metadata comes from: "instagram" (via instaloader) or the base URL of a JSON
+# stand-in with the same shape (see HTTPSource), e.g. http://127.0.0.1:8765 for load tests.
+FETCH_SOURCE = os.environ.get("REEL_FETCH_SOURCE", "instagram")
+# Log instaloader in with a session saved by `instaloader --login USER`; many reels need it.
+INSTAGRAM_LOGIN = os.environ.get("REEL_INSTAGRAM_LOGIN")
+
+# Reels fetched at once, and metadata requests allowed per minute across all of them. Instagram
+# throttles hard, so the default is conservative; a local stand-in can run with 0 (unlimited).
+FETCH_WORKERS = int(os.environ.get("REEL_FETCH_WORKERS", "8"))
+FETCH_RATE_PER_MINUTE = float(os.environ.get("REEL_FETCH_RPM", "60"))
+# Reels taken from each profile, newest first.
+PROFILE_REEL_LIMIT = 50
+# Connections kept open per host by the shared HTTP session.
+HTTP_POOL_SIZE = 32
+FETCH_TIMEOUT = 60
+
+REEL_URL_PATTERN = re.compile(r"instagram\.com/(?:[\w.]+/)?(?:reels?|p|tv)/([\w-]+)", re.IGNORECASE)
+PROFILE_URL_PATTERN = re.compile(r"instagram\.com/([\w.]+)/?(?:(?:reels|videos|tagged)/?)?(?:[?#].*)?$", re.IGNORECASE)
+SHORTCODE_PATTERN = re.compile(r"^[\w-]+$")
+USERNAME_PATTERN = re.compile(r"^[\w.]+$")
+
+
+# --- References ---
+def _parse_reel_ref(token):
+    """("reel", shortcode), ("profile", username), or None if `token` is neither."""
+    reel = REEL_URL_PATTERN.search(token)
+    profile = PROFILE_URL_PATTERN.search(token)
+    if reel:
+        return ("reel", reel.group(1))
+    if profile:
+        return ("profile", profile.group(1))
+    if token.startswith("@") and USERNAME_PATTERN.match(token[1:]):
+        return ("profile", token[1:])
+    if SHORTCODE_PATTERN.match(token):
+        return ("reel", token)
+    return None
+
+
+def parse_reel_refs(values, allow_files=False):
+    """
+    Turns reel references into ("reel", shortcode) and ("profile", username) pairs, in order and
+    without duplicates. Accepts shortcodes, reel/post URLs, "@username", profile URLs and free text
+    with one or more of those per line. With `allow_files` (command line only, never user input
+    from the app), a value naming a text file is read and parsed the same way.
+    """
+    refs = []
+    for value in values:
+        source = None
+        if allow_files and os.path.isfile(value):
+            source = value
+            with open(value, "r", encoding="utf-8") as f:
+                value = f.read()
+        for line_number, line in enumerate(value.splitlines(), start=1):
+            if line.strip().startswith("#"):
+                continue
+            for token in re.split(r"[\s,]+", line):
+                if not token:
+                    continue
+                ref = _parse_reel_ref(token)
+                if ref is None:
+                    # Never echo a file's contents back; it may not be a list of reels at all.
+                    raise ValueError(f"Line {line_number} of {source} is not a reel shortcode, reel URL or @profile." if source else f"Not a reel shortcode, reel URL or @profile: '{token}'")
+                refs.append(ref)
+    return list(dict.fromkeys(refs))
+
+
+# --- HTTP ---
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """The process-wide requests session, with a connection pool sized for concurrent fetches."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+        return _session
+
+
+def http_get(url, stream=False, **kwargs):
+    """GET through the shared session. Network errors, 429s and 5xx responses raise ConnectionError, so call_with_retries retries them."""
+    try:
+        response = get_session().get(url, stream=stream, timeout=FETCH_TIMEOUT, **kwargs)
+    except (requests.ConnectionError, requests.Timeout) as e:
+        raise ConnectionError(f"GET {url} failed: {e}") from e
+    if response.status_code == 429 or response.status_code >= 500:
+        response.close()
+        raise ConnectionError(f"GET {url} returned HTTP {response.status_code}")
+    response.raise_for_status()
+    return response
+
+
+# --- Sources ---
+class InstagramSource:
+    """
+    Reel metadata from Instagram through instaloader. Its context is not thread-safe and paces
+    itself, so metadata requests go through it one at a time; the video downloads (the slow part)
+    run concurrently on the shared session. Shares are not public, so they are not fetched.
+    """
+
+    def __init__(self, login=INSTAGRAM_LOGIN):
+        self.loader = instaloader.Instaloader(quiet=True, download_pictures=False, download_video_thumbnails=False, save_metadata=False, request_timeout=FETCH_TIMEOUT)
+        if login:
+            self.loader.load_session_from_file(login)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _reel(post):
+        if not post.is_video:
+            raise ValueError(f"Post {post.shortcode} is not a video.")
+        return {
+            "shortcode": post.shortcode, "video_url": post.video_url, "owner": post.owner_username, "posted_at": post.date_utc.isoformat(), "caption": post.caption or "",
+            "metrics": {"Views": post.video_play_count or post.video_view_count, "Likes": post.likes, "Comments": post.comments},
+        }
+
+    def reel(self, shortcode):
+        with self._lock:
+            return self._reel(instaloader.Post.from_shortcode(self.loader.context, shortcode))
+
+    def profile_reels(self, username, limit=PROFILE_REEL_LIMIT):
+        with self._lock:
+            profile = instaloader.Profile.from_username(self.loader.context, username)
+            return [self._reel(post) for post in itertools.islice(profile.get_reels(), limit)]
+
+
+class HTTPSource:
+    """
+    Reel metadata from a JSON endpoint, e.g. a local stand-in for load tests (see benchmarks.py):
+
+        GET <base>/reels/<shortcode>               -> {"shortcode", "video_url", "owner", "posted_at", "caption", "metrics": {...}}
+        GET <base>/profiles/<username>?limit=<n>   -> {"reels": [<reel>, ...]}
+
+    Relative video URLs are resolved against the base URL.
+    """
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip("/") + "/"
+
+    def _reel(self, reel):
+        return dict(reel, video_url=urljoin(self.base_url, reel["video_url"]))
+
+    def reel(self, shortcode):
+        return self._reel(http_get(urljoin(self.base_url, f"reels/{shortcode}")).json())
+
+    def profile_reels(self, username, limit=PROFILE_REEL_LIMIT):
+        reels = http_get(urljoin(self.base_url, f"profiles/{username}"), params={"limit": limit}).json()["reels"]
+        return [self._reel(reel) for reel in reels[:limit]]
+
+
+def make_source(source=FETCH_SOURCE):
+    """Builds the reel source named by `source`: "instagram", or the base URL of an HTTPSource."""
+    if source == "instagram":
+        return InstagramSource()
+    if source.startswith(("http://", "https://")):
+        return HTTPSource(source)
+    raise ValueError(f"Unknown reel source '{source}' (expected 'instagram' or an http(s) URL).")
+
+
+# --- Download Cache ---
+class DownloadCache:
+    """
+    Index of downloaded reels: shortcode -> SHA-256 of the video in DOWNLOAD_DIR. Like ReportCache,
+    every call opens its own short-lived connection to a WAL-mode database, so threads and processes
+    sharing CACHE_DIR can use it at once.
+    """
+
+    def __init__(self, db_path=None, directory=None):
+        self.db_path = db_path or os.path.join(CACHE_DIR, "downloads.sqlite3")
+        self.directory = directory or DOWNLOAD_DIR
+        self._init_lock = threading.Lock()
+        self._initialized = False
+
+    def _connect(self):
+        if not self._initialized:
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        if not self._initialized:
+            with self._init_lock:
+                if not self._initialized:
+                    conn.execute("PRAGMA journal_mode=WAL")
+                    conn.execute("""CREATE TABLE IF NOT EXISTS downloads (
+                        shortcode TEXT PRIMARY KEY, digest TEXT NOT NULL, size INTEGER NOT NULL,
+                        created_at REAL NOT NULL, last_used REAL NOT NULL)""")
+                    conn.execute("CREATE INDEX IF NOT EXISTS downloads_digest ON downloads(digest)")
+                    conn.commit()
+                    self._initialized = True
+        return conn
+
+    def path_for(self, digest):
+        return os.path.join(self.directory, digest + ".mp4")
+
+    def lookup(self, shortcode):
+        """Returns {"digest", "path", "size"} for a reel that is already on disk, or None."""
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT digest, size FROM downloads WHERE shortcode = ?", (shortcode,)).fetchone()
+            if row is None or not os.path.exists(self.path_for(row[0])):
+                return None
+            with conn:
+                conn.execute("UPDATE downloads SET last_used = ? WHERE shortcode = ?", (time.time(), shortcode))
+        finally:
+            conn.close()
+        return {"digest": row[0], "path": self.path_for(row[0]), "size": row[1]}
+
+    def download(self, shortcode, video_url):
+        """Streams the video into DOWNLOAD_DIR under its content hash and records it. Returns {"digest", "path", "size"}."""
+        response = http_get(video_url, stream=True)
+        try:
+            response.raw.decode_content = True
+            stored = spool_to_dir(response.raw, self.directory, suffix=".mp4")
+        finally:
+            response.close()
+        now = time.time()
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute("INSERT OR REPLACE INTO downloads (shortcode, digest, size, created_at, last_used) VALUES (?, ?, ?, ?, ?)", (shortcode, stored["digest"], stored["size"], now, now))
+        finally:
+            conn.close()
+        return stored
+
+    def collect_garbage(self, older_than=DOWNLOAD_RETENTION):
+        """Forgets reels unused for `older_than` seconds and deletes videos no remaining reel points at."""
+        conn = self._connect()
+        try:
+            with conn:
+                stale = {row[0] for row in conn.execute("SELECT digest FROM downloads WHERE last_used < ?", (time.time() - older_than,))}
+                conn.execute("DELETE FROM downloads WHERE last_used < ?", (time.time() - older_than,))
+                live = {row[0] for row in conn.execute("SELECT DISTINCT digest FROM downloads")}
+        finally:
+            conn.close()
+        for digest in stale - live:
+            try:
+                os.remove(self.path_for(digest))
+            except OSError:
+                pass
+
+
+# --- Fetching ---
+class FetchedReel:
+    """
+    A downloaded reel and its engagement metrics. It has a `name` like an uploaded file, so the app
+    can list it next to uploads; `kpis` is in the {kpi: display value} shape the KPI dicts use.
+    """
+
+    def __init__(self, shortcode, path, digest, size, metrics, owner=None, posted_at=None, caption="", from_cache=False):
+        self.shortcode = shortcode
+        self.name = f"{shortcode}.mp4"
+        self.path = path
+        self.digest = digest
+        self.size = size
+        self.metrics = metrics
+        self.owner = owner
+        self.posted_at = posted_at
+        self.caption = caption
+        self.from_cache = from_cache
+
+    @property
+    def kpis(self):
+        return {name: format_kpi_value(value) for name, value in self.metrics.items() if value is not None}
+
+    def manifest_row(self):
+        """One line of a JSONL manifest for `analyze.py --batch`."""
+        return {"video_path": os.path.abspath(self.path), "metrics": self.kpis, "shortcode": self.shortcode, "owner": self.owner, "posted_at": self.posted_at}
+
+
+def fetch_reels(refs, source=None, workers=FETCH_WORKERS, rate_per_minute=FETCH_RATE_PER_MINUTE, profile_limit=PROFILE_REEL_LIMIT, cache=None, on_progress=None):
+    """
+    Fetches every reel in `refs` (see parse_reel_refs), expanding profiles to their latest
+    `profile_limit` reels. Metadata requests share one rate limit; videos download on `workers`
+    threads and are skipped when the download cache already has them.
+
+    Returns one outcome per reel, like run_many: {"item": shortcode, "result": FetchedReel, "error", "elapsed"},
+    preceded by one failed outcome ({"item": "@username", "result": None, "error", ...}) per profile
+    that could not be listed. `on_progress(done, total, outcome)` is called from the calling thread
+    as each reel finishes.
+    """
+    source = source or make_source()
+    cache = cache or DownloadCache()
+    cache.collect_garbage()
+    limiter = RateLimiter(rate_per_minute, burst=workers)
+
+    # Profiles are listed up front: their listings already carry each reel's metadata. A profile that
+    # can't be listed (private, renamed, throttled) fails on its own, like a reel that can't be fetched.
+    known, failed_profiles = {}, []
+    for kind, value in refs:
+        if kind == "profile":
+            limiter.acquire()
+            started = time.perf_counter()
+            try:
+                with telemetry.span("fetch_profile", profile=value):
+                    reels = call_with_retries(lambda: source.profile_reels(value, profile_limit))
+            except Exception as e:
+                failed_profiles.append({"item": f"@{value}", "result": None, "error": e, "elapsed": time.perf_counter() - started})
+                continue
+            for reel in reels:
+                known.setdefault(reel["shortcode"], reel)
+        else:
+            known.setdefault(value, None)
+
+    def fetch(shortcode):
+        with telemetry.span("fetch_reel", shortcode=shortcode) as record:
+            reel = known[shortcode]
+            if reel is None:
+                limiter.acquire()
+                reel = call_with_retries(lambda: source.reel(shortcode))
+            stored = cache.lookup(shortcode)
+            from_cache = stored is not None
+            if from_cache:
+                telemetry.count("cache_hits", cache="download")
+            else:
+                telemetry.count("cache_misses", cache="download")
+                stored = call_with_retries(lambda: cache.download(shortcode, reel["video_url"]))
+                telemetry.count("bytes_downloaded", stored["size"])
+            record["bytes"] = stored["size"]
+        return FetchedReel(shortcode, stored["path"], stored["digest"], stored["size"], reel.get("metrics", {}),
+                           owner=reel.get("owner"), posted_at=reel.get("posted_at"), caption=reel.get("caption", ""), from_cache=from_cache)
+
+    return failed_profiles + run_many(list(known), fetch, max_workers=workers, on_progress=on_progress)
+
+
+if __name__ == "__main__":
+    # Downloads reels and writes a manifest that `analyze.py --batch` can score:
+    #   python reel_fetch.py @somebrand C9xYz123AbC https://www.instagram.com/reel/C8aBc456DeF/ --output reels.jsonl
+    parser = argparse.ArgumentParser(description="Download Instagram reels and their engagement metrics.")
+    parser.add_argument("refs", nargs="+", help="Reel shortcodes or URLs, @profiles or profile URLs, or text files listing them.")
+    parser.add_argument("--output", default="reels.jsonl", help="JSONL manifest of (video path, metrics) for analyze.py --batch.")
+    parser.add_argument("--source", default=FETCH_SOURCE, help="'instagram', or the base URL of a JSON stand-in.")
+    parser.add_argument("--workers", type=int, default=FETCH_WORKERS, help="Reels downloaded at once.")
+    parser.add_argument("--rpm", type=float, default=FETCH_RATE_PER_MINUTE, help="Maximum metadata requests per minute (0 for no limit).")
+    parser.add_argument("--profile-limit", type=int, default=PROFILE_REEL_LIMIT, help="Latest reels taken from each profile.")
+    args = parser.parse_args()
+
+    outcomes = fetch_reels(
+        parse_reel_refs(args.refs, allow_files=True), make_source(args.source), workers=args.workers, rate_per_minute=args.rpm, profile_limit=args.profile_limit,
+        on_progress=lambda done, total, outcome: print(f"[{done}/{total}] {outcome['item']}: " + (f"error: {outcome['error']}" if outcome["error"] else "cached" if outcome["result"].from_cache else f"{outcome['result'].size / 1e6:,.1f} MB")),
+    )
+    for outcome in outcomes:
+        if outcome["item"].startswith("@"):
+            print(f"{outcome['item']}: error: {outcome['error']}")
+    with open(args.output, "w", encoding="utf-8") as out:
+        for outcome in outcomes:
+            if outcome["error"] is None:
+                out.write(json.dumps(outcome["result"].manifest_row()) + "\n")
+    failed = sum(outcome["error"] is not None for outcome in outcomes)
+    print(f"Fetched {len(outcomes) - failed} of {len(outcomes)} reels into {args.output}.")
@@ -0,0 +1,115 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import telemetry
+from upload_cache import CACHE_DIR
+
+# --- Configuration ---
+# Generated reports are small, but a busy team produces a lot of them. Least recently used
+# reports are evicted once the cache grows past this many bytes of report text.
+MAX_CACHE_BYTES = int(os.environ.get("REEL_REPORT_CACHE_BYTES", str(256 * 1024 * 1024)))
+
+
+def normalize_kpis(kpis):
+    """Normalizes a KPI dict so cosmetic differences (case, whitespace, ordering) don't change the cache key."""
+    normalized = {}
+    for name, value in (kpis or {}).items():
+        if isinstance(value, dict):
+            normalized[str(name).strip()] = normalize_kpis(value)
+        else:
+            normalized[str(name).strip().lower()] = str(value).strip()
+    return dict(sorted(normalized.items()))
+
+
+def report_fingerprint(**parts):
+    """Stable SHA-256 fingerprint of everything that determines a report's content."""
+    payload = json.dumps(parts, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ReportCache:
+    """
+    Persistent, SQLite-backed cache of generated reports keyed by a fingerprint of their inputs.
+
+    Safe to share between threads and processes: every call opens its own short-lived
+    connection, and the database runs in WAL mode so readers never block the writer.
+    """
+
+    def __init__(self, db_path=None, max_bytes=MAX_CACHE_BYTES):
+        self.db_path = db_path or os.path.join(CACHE_DIR, "reports.sqlite3")
+        self.max_bytes = max_bytes
+        self._init_lock = threading.Lock()
+        self._initialized = False
+
+    def _connect(self):
+        if not self._initialized:
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        if not self._initialized:
+            with self._init_lock:
+                if not self._initialized:
+                    conn.execute("PRAGMA journal_mode=WAL")
+                    conn.execute("""CREATE TABLE IF NOT EXISTS reports (
+                        key TEXT PRIMARY KEY, report TEXT NOT NULL, size INTEGER NOT NULL,
+                        meta TEXT, created_at REAL NOT NULL, last_used REAL NOT NULL)""")
+                    conn.execute("CREATE INDEX IF NOT EXISTS reports_last_used ON reports(last_used)")
+                    conn.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+                    conn.commit()
+                    self._initialized = True
+        return conn
+
+    def _bump(self, conn, counter):
+        conn.execute("INSERT INTO counters (name, value) VALUES (?, 1) ON CONFLICT(name) DO UPDATE SET value = value + 1", (counter,))
+
+    # --- Public API ---
+    def get(self, key):
+        """Returns the cached report for `key`, or None. Updates the hit/miss counters."""
+        conn = self._connect()
+        try:
+            with conn:
+                row = conn.execute("SELECT report FROM reports WHERE key = ?", (key,)).fetchone()
+                if row:
+                    conn.execute("UPDATE reports SET last_used = ? WHERE key = ?", (time.time(), key))
+                    self._bump(conn, "hits")
+                    telemetry.count("cache_hits", cache="report")
+                    return row[0]
+                self._bump(conn, "misses")
+                telemetry.count("cache_misses", cache="report")
+                return None
+        finally:
+            conn.close()
+
+    def put(self, key, report, meta=None):
+        """Stores `report` under `key`, then evicts least recently used reports past `max_bytes`."""
+        now = time.time()
+        size = len(report.encode("utf-8"))
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO reports (key, report, size, meta, created_at, last_used) VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, report, size, json.dumps(meta or {}, default=str), now, now),
+                )
+                total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM reports").fetchone()[0]
+                if total > self.max_bytes:
+                    for old_key, old_size in conn.execute("SELECT key, size FROM reports WHERE key != ? ORDER BY last_used", (key,)).fetchall():
+                        conn.execute("DELETE FROM reports WHERE key = ?", (old_key,))
+                        self._bump(conn, "evictions")
+                        total -= old_size
+                        if total <= self.max_bytes:
+                            break
+        finally:
+            conn.close()
+
+    def stats(self):
+        """Returns {"hits", "misses", "evictions", "entries", "bytes"}."""
+        conn = self._connect()
+        try:
+            counters = dict(conn.execute("SELECT name, value FROM counters").fetchall())
+            entries, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM reports").fetchone()
+        finally:
+            conn.close()
+        return {"hits": counters.get("hits", 0), "misses": counters.get("misses", 0), "evictions": counters.get("evictions", 0), "entries": entries, "bytes": total}
@@ -0,0 +1,106 @@
+import re
+import json
+from dataclasses import dataclass
+from typing import Optional, Tuple
+import telemetry
+from backends import get_backend
+
+# --- Report Patterns ---
+SCORECARD_PATTERN = re.compile(r"```json\s*\n([\s\S]*?)\n```")
+SCORECARD_RAW_PATTERN = re.compile(r"### 1\..*Scorecard\s*\n*(.*?)(\n###|$)", re.DOTALL | re.IGNORECASE)
+SECTION_PATTERN = re.compile(r"### (2|3|4|5)\. (.*?)\n(.*?)(?=\n### |\Z)", re.DOTALL)
+SECTION_HEADER_PATTERN = re.compile(r"### (2|3|4|5)\. (.*?)\n")
+
+# Small, cheap model used to re-read a finished report and return the scorecard as strict JSON.
+SCORECARD_MODEL = "gemini-1.5-flash"
+
+
+# --- Typed Report ---
+@dataclass(frozen=True)
+class ScorecardRow:
+    rank: int
+    video_name: str
+    justification: str
+
+
+@dataclass(frozen=True)
+class ReportSection:
+    number: str
+    title: str
+    content: str
+
+
+@dataclass(frozen=True)
+class ParsedReport:
+    """A report parsed once into the pieces the UI renders, so reruns never re-parse the text."""
+    scorecard: Tuple[ScorecardRow, ...]
+    sections: Tuple[ReportSection, ...]
+    scorecard_error: Optional[str] = None
+    scorecard_raw: Optional[str] = None
+
+    @property
+    def top_performer(self):
+        return self.scorecard[0].video_name if self.scorecard else None
+
+    def scorecard_records(self):
+        """Scorecard rows as display-ready dicts (what st.dataframe shows)."""
+        return [{"Rank": row.rank, "Video Name": row.video_name, "Ranking Justification": row.justification} for row in self.scorecard]
+
+
+def scorecard_rows(data):
+    """Validates decoded scorecard JSON into ScorecardRow tuples. Raises ValueError on a malformed scorecard."""
+    if not isinstance(data, list) or not data:
+        raise ValueError("The scorecard is not a non-empty JSON array.")
+    try:
+        return tuple(ScorecardRow(rank=int(item["rank"]), video_name=str(item["video_name"]), justification=str(item.get("justification", ""))) for item in data)
+    except (KeyError, TypeError, ValueError) as e:
+        raise ValueError(f"Malformed scorecard entry: {e}") from e
+
+
+def parse_report(report_text, structured_scorecard=None):
+    """
+    Parses a finished report into a ParsedReport. `structured_scorecard` (rows from
+    `extract_scorecard_structured`) takes precedence; the ```json regex path is the fallback.
+    """
+    scorecard, scorecard_error, scorecard_raw = (), None, None
+    try:
+        if structured_scorecard:
+            scorecard = scorecard_rows(structured_scorecard)
+        else:
+            json_match = SCORECARD_PATTERN.search(report_text)
+            if not json_match:
+                raise ValueError("No JSON block found for the scorecard.")
+            scorecard = scorecard_rows(json.loads(json_match.group(1)))
+    except Exception as e:
+        scorecard_error = str(e)
+        raw_match = SCORECARD_RAW_PATTERN.search(report_text)
+        if raw_match:
+            scorecard_raw = raw_match.group(1).strip()
+
+    sections = tuple(ReportSection(number, title.strip(), content.strip()) for number, title, content in SECTION_PATTERN.findall(report_text))
+    return ParsedReport(scorecard=scorecard, sections=sections, scorecard_error=scorecard_error, scorecard_raw=scorecard_raw)
+
+
+def extract_scorecard_structured(report_text):
+    """
+    Asks the model for the report's scorecard in JSON mode (response_mime_type="application/json").
+    Returns the decoded rows, or None if the call or the decoding fails.
+    """
+    prompt = f"""Extract the Campaign Performance Scorecard from the report below.
+    Return a JSON array of objects with exactly these keys: "rank" (integer), "video_name" (string), "justification" (string), ordered by rank.
+
+    **THE REPORT:**
+    ---
+    {report_text}
+    ---
+    """
+    try:
+        with telemetry.span("scorecard_json", model=SCORECARD_MODEL):
+            model = get_backend().model(SCORECARD_MODEL, generation_config={"response_mime_type": "application/json"})
+            response = model.generate_content(prompt)
+            telemetry.add_usage(response, SCORECARD_MODEL)
+            data = json.loads(response.text)
+            scorecard_rows(data)
+        return data
+    except Exception:
+        return None
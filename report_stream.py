@@ -0,0 +1,60 @@
+import json
+# Same patterns parse_report uses on the finished report, so a streamed report
+# renders exactly like a stored one.
+from report_model import SCORECARD_PATTERN, SECTION_HEADER_PATTERN, SECTION_PATTERN
+
+
+class IncrementalReportParser:
+    """
+    Parses a report while it is still streaming in.
+
+    `feed(chunk)` returns the events that became available with that chunk:
+    - {"type": "scorecard", "rows": [...]}: as soon as the ```json fence closes (and parses).
+    - {"type": "section", "number", "title", "content"}: once the next ### header starts.
+    - {"type": "partial", "number", "title", "content"}: the section currently being written.
+    `finish()` flushes the last section. `text` is always the full text received so far.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.scorecard = None
+        self._emitted_sections = set()
+        self._completed_upto = 0
+
+    def feed(self, chunk):
+        self.text += chunk
+        events = []
+        if self.scorecard is None and "```json" in self.text:
+            match = SCORECARD_PATTERN.search(self.text)
+            if match:
+                try:
+                    self.scorecard = json.loads(match.group(1))
+                    events.append({"type": "scorecard", "rows": self.scorecard})
+                except json.JSONDecodeError:
+                    # Leave it for parse_report's fallback on the finished report.
+                    self.scorecard = []
+
+        # Everything before the last "\n### " is complete: no more text can land in those sections.
+        boundary = self.text.rfind("\n### ")
+        if boundary > self._completed_upto:
+            events.extend(self._section_events(self.text[:boundary]))
+            self._completed_upto = boundary
+
+        headers = list(SECTION_HEADER_PATTERN.finditer(self.text, self._completed_upto))
+        if headers:
+            header = headers[-1]
+            if header.group(1) not in self._emitted_sections:
+                events.append({"type": "partial", "number": header.group(1), "title": header.group(2).strip(), "content": self.text[header.end():].strip()})
+        return events
+
+    def finish(self):
+        return self._section_events(self.text)
+
+    def _section_events(self, text):
+        events = []
+        for number, title, content in SECTION_PATTERN.findall(text):
+            if number in self._emitted_sections:
+                continue
+            self._emitted_sections.add(number)
+            events.append({"type": "section", "number": number, "title": title.strip(), "content": content.strip()})
+        return events
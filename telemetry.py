@@ -0,0 +1,193 @@
+import os
+import json
+import time
+import uuid
+import functools
+import threading
+import contextvars
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# --- Configuration ---
+# Every finished span is appended to this JSONL file, shared by the app, the workers and analyze.py.
+# It lives in upload_cache.CACHE_DIR (resolved here directly, since upload_cache reports to this module).
+TELEMETRY_LOG = os.environ.get("REEL_TELEMETRY_LOG", os.path.join(os.environ.get("REEL_CACHE_DIR", ".reel_cache"), "telemetry.jsonl"))
+# The log is rotated to `<name>.1` once it grows past this size.
+MAX_LOG_BYTES = int(os.environ.get("REEL_TELEMETRY_LOG_BYTES", str(50 * 1024 * 1024)))
+# Only the tail of the log is scanned when looking up a run's spans.
+READ_TAIL_BYTES = 4 * 1024 * 1024
+# Set to serve this process's counters in Prometheus text format on http://<host>:<port>/metrics.
+METRICS_PORT = int(os.environ["REEL_METRICS_PORT"]) if os.environ.get("REEL_METRICS_PORT") else None
+
+_current_run = contextvars.ContextVar("reel_telemetry_run", default=None)
+_current_span = contextvars.ContextVar("reel_telemetry_span", default=None)
+
+_lock = threading.Lock()
+_stage_totals = {}  # stage -> {"count", "seconds", "errors"}
+_counters = {}  # (name, sorted labels) -> value
+
+
+# --- Recording ---
+@contextmanager
+def run(run_id=None):
+    """
+    Groups every span recorded inside the block under one run id (a job id, say). Threads started
+    through pipeline.run_many inherit it. Yields the run id.
+    """
+    run_id = run_id or uuid.uuid4().hex
+    token = _current_run.set(run_id)
+    try:
+        yield run_id
+    finally:
+        _current_run.reset(token)
+
+
+def current_run():
+    return _current_run.get()
+
+
+@contextmanager
+def span(stage, **attrs):
+    """
+    Times one stage. Yields the span's record, so the block can attach details (file name, bytes,
+    ...); retries, cache hits and token counts recorded while it is open are added to it too.
+    """
+    record = {"run_id": _current_run.get(), "stage": stage, "start": time.time(), **attrs}
+    token = _current_span.set(record)
+    started = time.perf_counter()
+    try:
+        yield record
+    except BaseException as e:
+        record["error"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current_span.reset(token)
+        record["duration_s"] = time.perf_counter() - started
+        _emit(record)
+
+
+def timed(stage, new_run=False, **attrs):
+    """Decorator form of `span`. With `new_run`, every call is also a run of its own."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if new_run:
+                with run(), span(stage, **attrs):
+                    return fn(*args, **kwargs)
+            with span(stage, **attrs):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def count(name, value=1, **labels):
+    """Adds `value` to the process-wide counter `name` (with `labels`) and to the innermost open span."""
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+    record = _current_span.get()
+    if record is not None:
+        record[name] = record.get(name, 0) + value
+
+
+def add_usage(response, model=None):
+    """Counts prompt/response tokens from a response's usage metadata (for a stream, pass its last chunk)."""
+    usage = getattr(response, "usage_metadata", None)
+    if not usage:
+        return
+    labels = {"model": model} if model else {}
+    prompt_tokens = getattr(usage, "prompt_token_count", 0) or 0
+    response_tokens = getattr(usage, "candidates_token_count", 0) or 0
+    if prompt_tokens:
+        count("prompt_tokens", prompt_tokens, **labels)
+    if response_tokens:
+        count("response_tokens", response_tokens, **labels)
+
+
+def _emit(record):
+    with _lock:
+        totals = _stage_totals.setdefault(record["stage"], {"count": 0, "seconds": 0.0, "errors": 0})
+        totals["count"] += 1
+        totals["seconds"] += record["duration_s"]
+        totals["errors"] += "error" in record
+        try:
+            os.makedirs(os.path.dirname(TELEMETRY_LOG) or ".", exist_ok=True)
+            if os.path.exists(TELEMETRY_LOG) and os.path.getsize(TELEMETRY_LOG) > MAX_LOG_BYTES:
+                os.replace(TELEMETRY_LOG, TELEMETRY_LOG + ".1")
+            with open(TELEMETRY_LOG, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, default=str) + "\n")
+        except OSError:
+            # Telemetry must never break an analysis.
+            pass
+
+
+# --- Reading ---
+def read_spans(run_id):
+    """Spans recorded for `run_id` (by any process), oldest first."""
+    try:
+        with open(TELEMETRY_LOG, "rb") as f:
+            f.seek(max(0, os.path.getsize(TELEMETRY_LOG) - READ_TAIL_BYTES))
+            lines = f.read().decode("utf-8", errors="replace").splitlines()
+    except OSError:
+        return []
+    spans = []
+    for line in lines:
+        if run_id not in line:
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            continue
+        if record.get("run_id") == run_id:
+            spans.append(record)
+    return sorted(spans, key=lambda record: record["start"])
+
+
+# --- Prometheus Endpoint ---
+def _labels(pairs):
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}" if pairs else ""
+
+
+def prometheus_text():
+    """This process's stage timings and counters in the Prometheus text exposition format."""
+    with _lock:
+        stage_totals = {stage: dict(totals) for stage, totals in _stage_totals.items()}
+        counters = dict(_counters)
+    lines = ["# TYPE reel_stage_seconds summary"]
+    for stage, totals in sorted(stage_totals.items()):
+        lines.append(f'reel_stage_seconds_sum{{stage="{stage}"}} {totals["seconds"]:.6f}')
+        lines.append(f'reel_stage_seconds_count{{stage="{stage}"}} {totals["count"]}')
+    lines.append("# TYPE reel_stage_errors_total counter")
+    for stage, totals in sorted(stage_totals.items()):
+        lines.append(f'reel_stage_errors_total{{stage="{stage}"}} {totals["errors"]}')
+    for name in sorted({name for name, _ in counters}):
+        lines.append(f"# TYPE reel_{name}_total counter")
+        for (counter, labels), value in sorted(counters.items()):
+            if counter == name:
+                lines.append(f"reel_{name}_total{_labels(labels)} {value}")
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip("/") not in ("", "/metrics"):
+            self.send_error(404)
+            return
+        body = prometheus_text().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_metrics_server(port=METRICS_PORT, host="0.0.0.0"):
+    """Serves `prometheus_text()` on `port` from a daemon thread. Returns the server, or None without a port."""
+    if port is None:
+        return None
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
@@ -0,0 +1,8 @@
+import os
+import sys
+import tempfile
+
+# The modules under test live at the repository root and read REEL_CACHE_DIR at import time,
+# so both are set up before any test module imports them.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["REEL_CACHE_DIR"] = tempfile.mkdtemp(prefix="reel-tests-")
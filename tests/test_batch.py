@@ -0,0 +1,23 @@
+import pytest
+from batch import percentile
+
+
+@pytest.mark.parametrize("size, pct, expected", [
+    (1, 50, 1),
+    (2, 50, 1),
+    (6, 50, 3),
+    (10, 50, 5),
+    (20, 95, 19),
+    (20, 100, 20),
+    (3, 0, 1),
+])
+def test_percentile_is_nearest_rank(size, pct, expected):
+    assert percentile(list(range(1, size + 1)), pct) == expected
+
+
+def test_percentile_ignores_input_order():
+    assert percentile([5.0, 1.0, 3.0], 50) == 3.0
+
+
+def test_percentile_of_nothing_is_none():
+    assert percentile([], 95) is None
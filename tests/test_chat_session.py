@@ -0,0 +1,49 @@
+import datetime
+import pytest
+from backends import FakeBackend, set_backend
+from chat_session import ReportChat
+
+
+@pytest.fixture
+def backend():
+    return set_backend(FakeBackend(generate_seconds=0, seed=0))
+
+
+def ask(chat, message="Which video should get more budget?"):
+    return "".join(chat.stream_reply(message))
+
+
+def expire(backend, chat):
+    stored = backend.get_cached_content(chat.cached_content.name)
+    stored.expire_time = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(seconds=1)
+    chat.cached_content.expire_time = stored.expire_time
+
+
+def test_a_large_report_uses_a_cached_context(backend):
+    chat = ReportChat("A long report.", cache_min_tokens=0)
+    assert chat.cached_content is not None
+    assert ask(chat)
+    chat.close()
+    assert backend.list_cached_contents() == []
+
+
+def test_a_small_report_uses_a_system_instruction(backend):
+    chat = ReportChat("A short report.")
+    assert chat.cached_content is None
+    assert ask(chat)
+
+
+def test_the_chat_keeps_working_after_the_cached_context_expires(backend):
+    chat = ReportChat("A long report.", cache_min_tokens=0)
+    assert ask(chat)
+    expire(backend, chat)
+    assert ask(chat)
+    assert chat.cached_content is None
+    assert len(chat.turns) == 4
+
+
+def test_the_chat_keeps_working_after_the_cached_context_disappears(backend):
+    chat = ReportChat("A long report.", cache_min_tokens=0)
+    backend.delete_cached_content(chat.cached_content.name)
+    assert ask(chat)
+    assert chat.cached_content is None
@@ -0,0 +1,79 @@
+import threading
+import pytest
+import jobs
+from jobs import JobStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(str(tmp_path / "jobs.sqlite3"))
+
+
+def test_claim_returns_none_when_the_queue_is_empty(store):
+    assert store.claim("w1") is None
+
+
+def test_jobs_are_claimed_oldest_first_and_only_once(store):
+    first = store.submit("batch", {"n": 1})
+    second = store.submit("batch", {"n": 2})
+    job = store.claim("w1")
+    assert (job["id"], job["status"], job["worker_id"], job["attempts"], job["payload"]) == (first, "running", "w1", 1, {"n": 1})
+    assert store.claim("w2")["id"] == second
+    assert store.claim("w3") is None
+
+
+def test_a_job_with_a_live_heartbeat_is_not_reclaimed(store):
+    job_id = store.submit("batch", {})
+    store.claim("w1")
+    store.heartbeat("w1", [job_id])
+    assert store.claim("w2") is None
+
+
+def test_a_job_abandoned_by_a_dead_worker_is_reclaimed(store, monkeypatch):
+    job_id = store.submit("batch", {})
+    store.claim("w1")
+    monkeypatch.setattr(jobs, "STALE_AFTER", -1.0)
+    job = store.claim("w2")
+    assert (job["id"], job["worker_id"], job["attempts"]) == (job_id, "w2", 2)
+
+
+def test_a_job_that_keeps_losing_its_worker_fails(store, monkeypatch):
+    job_id = store.submit("batch", {})
+    monkeypatch.setattr(jobs, "STALE_AFTER", -1.0)
+    for attempt in range(1, jobs.MAX_ATTEMPTS + 1):
+        assert store.claim(f"w{attempt}")["attempts"] == attempt
+    assert store.claim("w-last") is None
+    job = store.get(job_id)
+    assert job["status"] == "failed" and "stopped responding" in job["error"]
+
+
+def test_retry_requeues_a_failed_job_with_a_fresh_attempt_budget(store):
+    job_id = store.submit("batch", {})
+    store.claim("w1")
+    store.fail(job_id, "boom")
+    store.retry(job_id)
+    job = store.get(job_id)
+    assert (job["status"], job["error"], job["attempts"]) == ("queued", None, 0)
+    assert store.claim("w2")["attempts"] == 1
+
+
+def test_concurrent_workers_never_claim_the_same_job(store):
+    submitted = {store.submit("batch", {"n": n}) for n in range(40)}
+    claimed = []
+    lock = threading.Lock()
+
+    def work(worker_id):
+        while True:
+            job = store.claim(worker_id)
+            if job is None:
+                return
+            with lock:
+                claimed.append(job["id"])
+
+    threads = [threading.Thread(target=work, args=(f"w{i}",)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(claimed) == sorted(submitted)
+    assert store.counts()["running"] == 40
@@ -0,0 +1,136 @@
+import io
+import math
+import pandas as pd
+import pytest
+from kpi_engine import add_derived_metrics, format_kpi_value, kpi_frame_from_dict, kpi_records, kpi_table_for_prompt, load_kpi_csv, parse_numeric
+
+
+def csv(text):
+    return io.StringIO(text.strip() + "\n")
+
+
+def test_parse_numeric_handles_currency_percentages_and_negatives():
+    values = parse_numeric(pd.Series(["$1,234.50", "12%", "(30)", "€ 7", "n/a", ""]))
+    assert values[:4].tolist() == [1234.5, 12.0, -30.0, 7.0]
+    assert values[4:].isna().all()
+
+
+def test_load_kpi_csv_keeps_only_uploaded_files_and_matches_without_extension():
+    frame = load_kpi_csv(csv("""
+filename,Spend,Clicks
+a.mp4,100,10
+b,50,5
+other.mp4,999,99
+"""), ["a.mp4", "b.mp4"])
+    assert list(frame.index) == ["a.mp4", "b.mp4"]
+    assert frame.loc["b.mp4", "Spend"] == 50
+
+
+def test_load_kpi_csv_sums_totals_and_averages_ratios_across_rows():
+    frame = load_kpi_csv(csv("""
+filename,Spend,CTR,Status
+a.mp4,100,1%,active
+a.mp4,$20,3%,paused
+"""), ["a.mp4"])
+    assert frame.loc["a.mp4", "Spend"] == 120
+    assert frame.loc["a.mp4", "CTR (%)"] == 2
+    assert frame.loc["a.mp4", "Status"] == "active"
+
+
+def test_load_kpi_csv_leaves_missing_values_empty_instead_of_zero():
+    frame = load_kpi_csv(csv("""
+filename,Spend,Revenue
+a.mp4,100,
+b.mp4,50,80
+"""), ["a.mp4", "b.mp4"])
+    assert math.isnan(frame.loc["a.mp4", "Revenue"])
+
+
+def test_load_kpi_csv_requires_a_filename_column():
+    with pytest.raises(ValueError):
+        load_kpi_csv(csv("name,Spend\na.mp4,1"), ["a.mp4"])
+
+
+def test_identifier_columns_stay_text_and_are_not_summed():
+    frame = load_kpi_csv(csv("""
+filename,Ad ID,campaign_id,Spend
+a.mp4,120212345678901234,42,10
+a.mp4,120212345678901234,42,5
+"""), ["a.mp4"])
+    assert frame.loc["a.mp4", "Ad ID"] == "120212345678901234"
+    assert frame.loc["a.mp4", "campaign_id"] == "42"
+    assert frame.loc["a.mp4", "Spend"] == 15
+    assert kpi_records(frame)["a.mp4"]["Ad ID"] == "120212345678901234"
+
+
+def test_percentages_keep_their_unit():
+    records = kpi_records(kpi_frame_from_dict({"a.mp4": {"Hook rate": "0.8%", "Views": "100"}}))
+    assert records["a.mp4"]["Hook rate (%)"] == "0.8"
+
+
+@pytest.mark.parametrize("value, text", [
+    (0.0234, "0.0234"),
+    (0.8, "0.8"),
+    (2.5, "2.5"),
+    (1 / 3, "0.3333"),
+    (12345.678, "12,345.68"),
+    (1234.0, "1,234"),
+    (None, ""),
+    (float("nan"), ""),
+])
+def test_format_kpi_value_keeps_significant_digits(value, text):
+    assert format_kpi_value(value) == text
+
+
+def test_derived_metrics_are_computed_from_totals():
+    frame = kpi_frame_from_dict({"a.mp4": {"Amount spent": "$100", "Impressions": "10,000", "Link clicks": "200", "Purchases": "4", "Purchase conversion value": "$300"}}, "Conversion")
+    row = frame.loc["a.mp4"]
+    assert row["CTR (%)"] == pytest.approx(2.0)
+    assert row["CPC"] == pytest.approx(0.5)
+    assert row["CPA"] == pytest.approx(25.0)
+    assert row["ROAS"] == pytest.approx(3.0)
+    assert row["CPM"] == pytest.approx(10.0)
+
+
+def test_export_ratios_are_replaced_by_derived_ones():
+    frame = kpi_frame_from_dict({"a.mp4": {"Spend": "100", "Clicks": "50", "CPC (all)": "9.99"}})
+    assert "CPC (all)" not in frame.columns
+    assert frame.loc["a.mp4", "CPC"] == pytest.approx(2.0)
+
+
+def test_two_aliases_of_one_metric_are_merged_before_deriving():
+    frame = load_kpi_csv(csv("""
+filename,Spend,Amount spent,Clicks
+a.mp4,100,,10
+b.mp4,,50,5
+"""), ["a.mp4", "b.mp4"])
+    derived = add_derived_metrics(frame, "Traffic")
+    assert list(derived.columns).count("Spend") == 1
+    assert derived["Spend"].tolist() == [100, 50]
+    assert derived["CPC"].tolist() == pytest.approx([10.0, 10.0])
+    assert "Scale Score" in derived.columns
+
+
+def test_scale_score_weighs_spend_and_stage_efficiency():
+    frame = kpi_frame_from_dict({
+        "big_efficient.mp4": {"Spend": "1000", "Revenue": "5000"},
+        "big_wasteful.mp4": {"Spend": "900", "Revenue": "100"},
+        "small.mp4": {"Spend": "10", "Revenue": "40"},
+    }, "Conversion")
+    ranked = frame.sort_values("Scale Score", ascending=False).index.tolist()
+    assert ranked[0] == "big_efficient.mp4"
+    assert frame["Scale Score"].between(0, 100).all()
+    assert frame["Spend Share (%)"].sum() == pytest.approx(100.0)
+
+
+def test_kpi_records_and_prompt_table():
+    frame = kpi_frame_from_dict({"a.mp4": {"Spend": "1234", "Clicks": "3"}, "b.mp4": {"Spend": "10", "Clicks": ""}})
+    records = kpi_records(frame)
+    assert records["a.mp4"]["Spend"] == "1,234"
+    assert "Clicks" not in records["b.mp4"]
+    assert kpi_records(kpi_frame_from_dict({"a.mp4": {"Spend": "1000", "Clicks": "3"}}))["a.mp4"]["CPC"] == "333.33"
+    assert "0.0234" in kpi_table_for_prompt(kpi_frame_from_dict({"a.mp4": {"Engagement rate": "0.0234"}}))
+    table = kpi_table_for_prompt(frame)
+    assert table.splitlines()[0].startswith("video_file,")
+    assert table.splitlines()[1].startswith("a.mp4,")
+    assert kpi_table_for_prompt(pd.DataFrame()) == "(no metrics provided)"
@@ -0,0 +1,60 @@
+import httplib2
+import pytest
+from google.api_core import exceptions as api_exceptions
+from googleapiclient.errors import HttpError
+import pipeline
+from pipeline import call_with_retries, is_transient
+
+
+def http_error(status):
+    return HttpError(httplib2.Response({"status": status}), b"{}")
+
+
+@pytest.mark.parametrize("error, transient", [
+    (http_error(429), True),
+    (http_error(500), True),
+    (http_error(503), True),
+    (http_error(400), False),
+    (http_error(404), False),
+    (httplib2.ServerNotFoundError("Unable to find the server"), True),
+    (api_exceptions.ServiceUnavailable("down"), True),
+    (ConnectionError("reset"), True),
+    (api_exceptions.InvalidArgument("bad"), False),
+    (ValueError("bad"), False),
+])
+def test_is_transient(error, transient):
+    assert is_transient(error) is transient
+
+
+def failing(errors, result="ok"):
+    calls = []
+
+    def fn():
+        calls.append(1)
+        if len(calls) <= len(errors):
+            raise errors[len(calls) - 1]
+        return result
+    return fn, calls
+
+
+def test_upload_rate_limits_and_server_errors_are_retried(monkeypatch):
+    monkeypatch.setattr(pipeline.time, "sleep", lambda seconds: None)
+    fn, calls = failing([http_error(429), http_error(503), httplib2.ServerNotFoundError("dns")])
+    assert call_with_retries(fn) == "ok"
+    assert len(calls) == 4
+
+
+def test_client_errors_are_not_retried(monkeypatch):
+    monkeypatch.setattr(pipeline.time, "sleep", lambda seconds: None)
+    fn, calls = failing([http_error(400)])
+    with pytest.raises(HttpError):
+        call_with_retries(fn)
+    assert len(calls) == 1
+
+
+def test_the_last_transient_error_is_raised(monkeypatch):
+    monkeypatch.setattr(pipeline.time, "sleep", lambda seconds: None)
+    fn, calls = failing([http_error(500)] * 3)
+    with pytest.raises(HttpError):
+        call_with_retries(fn, retries=2)
+    assert len(calls) == 3
@@ -0,0 +1,51 @@
+import sqlite3
+import pytest
+import poller
+from backends import FakeBackend, set_backend
+from poller import StatusPoller
+
+
+@pytest.fixture
+def backend():
+    return set_backend(FakeBackend(upload_mbps=0, processing_seconds_per_mb=0, seed=0))
+
+
+@pytest.fixture
+def remote_file(backend, tmp_path):
+    path = tmp_path / "video.mp4"
+    path.write_bytes(b"video" * 100)
+    return backend.upload_file(str(path))
+
+
+def tracked(remote_file):
+    return {remote_file.name: {"size": remote_file.size_bytes, "state": "PROCESSING"}}
+
+
+def test_files_become_active(remote_file):
+    changes = []
+    states = StatusPoller(tracked(remote_file), on_change=changes.append).wait(timeout=10)
+    assert states == {remote_file.name: "ACTIVE"}
+    assert changes == [states]
+
+
+def test_a_missing_file_fails_instead_of_polling_forever(backend, remote_file):
+    backend.delete_file(remote_file.name)
+    poller_ = StatusPoller(tracked(remote_file))
+    assert poller_.wait(timeout=10) == {remote_file.name: "FAILED"}
+    assert poller_.done
+
+
+def test_a_failing_callback_does_not_stop_the_poller(remote_file):
+    def on_change(states):
+        raise sqlite3.OperationalError("database is locked")
+
+    poller_ = StatusPoller(tracked(remote_file), on_change=on_change)
+    assert poller_.wait(timeout=10) == {remote_file.name: "ACTIVE"}
+    assert poller_.done
+
+
+def test_wait_returns_even_if_the_polling_thread_crashes(remote_file, monkeypatch):
+    monkeypatch.setattr(poller, "BACKOFF_FACTOR", None)
+    poller_ = StatusPoller(tracked(remote_file))
+    poller_.wait(timeout=10)
+    assert poller_.done
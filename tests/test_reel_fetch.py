@@ -0,0 +1,50 @@
+import pytest
+from reel_fetch import DownloadCache, fetch_reels, parse_reel_refs
+
+
+def test_parse_reel_refs_accepts_every_reference_form():
+    refs = parse_reel_refs([
+        "C9xYz123AbC, https://www.instagram.com/reel/C8aBc456DeF/?igsh=x\n# a comment\n@somebrand",
+        "https://www.instagram.com/otherbrand/reels/ C9xYz123AbC",
+    ])
+    assert refs == [("reel", "C9xYz123AbC"), ("reel", "C8aBc456DeF"), ("profile", "somebrand"), ("profile", "otherbrand")]
+
+
+def test_app_input_naming_a_file_is_not_read(tmp_path):
+    secret = tmp_path / "secrets.txt"
+    secret.write_text("C9xYz123AbC\n")
+    with pytest.raises(ValueError) as error:
+        parse_reel_refs([str(secret)])
+    assert "C9xYz123AbC" not in str(error.value)
+
+
+def test_command_line_files_are_read_but_never_echoed(tmp_path):
+    refs = tmp_path / "refs.txt"
+    refs.write_text("C9xYz123AbC\n@somebrand\n")
+    assert parse_reel_refs([str(refs)], allow_files=True) == [("reel", "C9xYz123AbC"), ("profile", "somebrand")]
+    refs.write_text("password=hunter2\n")
+    with pytest.raises(ValueError) as error:
+        parse_reel_refs([str(refs)], allow_files=True)
+    assert "hunter2" not in str(error.value)
+
+
+class Source:
+    def reel(self, shortcode):
+        return {"shortcode": shortcode, "video_url": "unused", "metrics": {"Views": 10}}
+
+    def profile_reels(self, username, limit):
+        if username == "private":
+            raise PermissionError(f"Profile {username} is private.")
+        return [self.reel(f"{username}1")]
+
+
+class LocalCache(DownloadCache):
+    def download(self, shortcode, video_url):
+        return {"digest": shortcode, "path": str(self.directory), "size": 5}
+
+
+def test_a_profile_that_cannot_be_listed_fails_on_its_own(tmp_path):
+    cache = LocalCache(str(tmp_path / "downloads.sqlite3"), str(tmp_path))
+    outcomes = fetch_reels([("profile", "private"), ("profile", "brand"), ("reel", "C9xYz123AbC")], Source(), rate_per_minute=0, cache=cache)
+    assert [(outcome["item"], outcome["error"] is None) for outcome in outcomes] == [("@private", False), ("brand1", True), ("C9xYz123AbC", True)]
+    assert "private" in str(outcomes[0]["error"])
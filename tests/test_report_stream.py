@@ -0,0 +1,70 @@
+from report_model import parse_report
+from report_stream import IncrementalReportParser
+
+REPORT = """### 1. Campaign Performance Scorecard
+```json
+[{"rank": 1, "video_name": "a.mp4", "justification": "Best ROAS."}, {"rank": 2, "video_name": "b.mp4", "justification": "Cheap reach."}]
+```
+
+### 2. Common Themes in Top Performers
+- Product in frame within a second.
+
+### 3. Actionable Recommendations
+- Move budget to a.mp4.
+
+### 4. New Creative Ideas (Ad Scripts)
+- Open on the problem.
+
+### 5. Suggested Ad Copy
+- "Try it today."
+"""
+
+
+def feed_all(parser, text, chunk_size):
+    events = []
+    for i in range(0, len(text), chunk_size):
+        events.extend(parser.feed(text[i:i + chunk_size]))
+    return events + parser.finish()
+
+
+def completed(events):
+    return [(e["type"], e.get("number")) for e in events if e["type"] != "partial"]
+
+
+def test_every_section_and_the_scorecard_are_emitted_once_in_order():
+    for chunk_size in (1, 7, 64, len(REPORT)):
+        events = feed_all(IncrementalReportParser(), REPORT, chunk_size)
+        assert completed(events) == [("scorecard", None), ("section", "2"), ("section", "3"), ("section", "4"), ("section", "5")]
+
+
+def test_scorecard_is_emitted_as_soon_as_its_fence_closes():
+    parser = IncrementalReportParser()
+    fence_end = REPORT.index("```\n", REPORT.index("```json") + 7) + 4
+    assert not [e for e in parser.feed(REPORT[:fence_end - 5]) if e["type"] == "scorecard"]
+    events = parser.feed(REPORT[fence_end - 5:fence_end])
+    assert [e["rows"][0]["video_name"] for e in events if e["type"] == "scorecard"] == ["a.mp4"]
+
+
+def test_a_section_completes_when_the_next_header_starts():
+    parser = IncrementalReportParser()
+    upto = REPORT.index("### 3.")
+    events = parser.feed(REPORT[:upto])
+    assert ("section", "2") not in completed(events)
+    partial = [e for e in events if e["type"] == "partial"][-1]
+    assert partial["number"] == "2" and "Product in frame" in partial["content"]
+    events = parser.feed(REPORT[upto:upto + 10])
+    assert ("section", "2") in completed(events)
+
+
+def test_a_broken_scorecard_is_left_to_the_final_parse():
+    broken = REPORT.replace('"rank": 1,', '"rank": 1')
+    events = feed_all(IncrementalReportParser(), broken, 32)
+    assert ("scorecard", None) not in completed(events)
+    assert [e["number"] for e in events if e["type"] == "section"] == ["2", "3", "4", "5"]
+
+
+def test_streamed_sections_match_the_finished_report():
+    events = feed_all(IncrementalReportParser(), REPORT, 13)
+    streamed = [(e["number"], e["title"], e["content"]) for e in events if e["type"] == "section"]
+    parsed = parse_report(REPORT)
+    assert streamed == [(s.number, s.title, s.content) for s in parsed.sections]
@@ -0,0 +1,141 @@
+import sqlite3
+import multiprocessing
+import pytest
+from google.api_core import exceptions as api_exceptions
+import upload_cache
+from backends import FakeBackend, set_backend
+from upload_cache import UploadCache
+
+
+@pytest.fixture
+def backend():
+    return set_backend(FakeBackend(upload_mbps=0, processing_seconds_per_mb=0, seed=0))
+
+
+@pytest.fixture
+def videos(tmp_path):
+    paths = []
+    for n in range(4):
+        path = tmp_path / f"video{n}.mp4"
+        path.write_bytes(f"video {n}".encode() * 100)
+        paths.append(str(path))
+    return paths
+
+
+def remote_names(backend):
+    return {remote_file.name for remote_file in backend.list_files()}
+
+
+def retired(cache):
+    with sqlite3.connect(cache.db_path) as conn:
+        return {row[0] for row in conn.execute("SELECT name FROM retired")}
+
+
+def test_the_same_video_is_uploaded_once(backend, videos, tmp_path):
+    cache = UploadCache(str(tmp_path / "uploads.sqlite3"))
+    first = cache.get_or_upload(videos[0])
+    assert cache.get_or_upload(videos[0]).name == first.name
+    assert len(backend.list_files()) == 1
+    assert first.display_name.startswith(cache.display_name_prefix)
+
+
+def test_least_recently_used_handles_are_evicted_but_kept_remotely(backend, videos, tmp_path):
+    cache = UploadCache(str(tmp_path / "uploads.sqlite3"), max_entries=2)
+    first = cache.get_or_upload(videos[0])
+    cache.get_or_upload(videos[1])
+    cache.get_or_upload(videos[0])
+    second_name = cache.get_or_upload(videos[1]).name
+    cache.get_or_upload(videos[2])
+    # videos[0] was used after videos[1] was uploaded, but videos[1] was looked up last.
+    assert cache.lookup(upload_cache.file_sha256(videos[0])) is None
+    assert cache.lookup(upload_cache.file_sha256(videos[1])).name == second_name
+    assert first.name in retired(cache)
+    assert first.name in remote_names(backend)
+
+
+def test_retired_files_are_deleted_only_after_the_in_use_grace_period(backend, videos, tmp_path, monkeypatch):
+    cache = UploadCache(str(tmp_path / "uploads.sqlite3"), max_entries=1)
+    first = cache.get_or_upload(videos[0])
+    cache.get_or_upload(videos[1])
+    assert cache.collect_garbage(force=True) == []
+    assert first.name in remote_names(backend)
+    monkeypatch.setattr(upload_cache, "IN_USE_GRACE_PERIOD", -1.0)
+    assert cache.collect_garbage(force=True) == [first.name]
+    assert first.name not in remote_names(backend) and not retired(cache)
+
+
+def test_expired_handles_are_retired_not_deleted(backend, videos, tmp_path):
+    cache = UploadCache(str(tmp_path / "uploads.sqlite3"), ttl_seconds=-1)
+    remote_file = cache.get_or_upload(videos[0])
+    assert cache.lookup(upload_cache.file_sha256(videos[0])) is None
+    assert cache.collect_garbage(force=True) == []
+    assert remote_file.name in retired(cache) and remote_file.name in remote_names(backend)
+
+
+def test_a_handle_gone_remotely_is_retired(backend, videos, tmp_path):
+    cache = UploadCache(str(tmp_path / "uploads.sqlite3"))
+    remote_file = cache.get_or_upload(videos[0])
+    backend.delete_file(remote_file.name)
+    assert cache.lookup(upload_cache.file_sha256(videos[0])) is None
+    assert remote_file.name in retired(cache)
+
+
+def test_a_transient_lookup_error_keeps_the_handle(backend, videos, tmp_path, monkeypatch):
+    cache = UploadCache(str(tmp_path / "uploads.sqlite3"))
+    remote_file = cache.get_or_upload(videos[0])
+    digest = upload_cache.file_sha256(videos[0])
+
+    def unavailable(name):
+        raise api_exceptions.ServiceUnavailable("Simulated outage.")
+
+    monkeypatch.setattr(backend, "get_file", unavailable)
+    with pytest.raises(api_exceptions.ServiceUnavailable):
+        cache.lookup(digest)
+    monkeypatch.undo()
+    assert cache.lookup(digest).name == remote_file.name
+    assert not retired(cache)
+
+
+def test_orphans_are_swept_only_in_this_index_namespace(backend, videos, tmp_path, monkeypatch):
+    ours = UploadCache(str(tmp_path / "ours" / "uploads.sqlite3"))
+    theirs = UploadCache(str(tmp_path / "theirs" / "uploads.sqlite3"))
+    their_file = theirs.get_or_upload(videos[0])
+    orphan = backend.upload_file(videos[1], display_name=f"{ours.display_name_prefix}{'0' * 32}")
+    unrelated = backend.upload_file(videos[2], display_name="someone-elses-file")
+    assert ours.namespace != theirs.namespace
+
+    assert ours.collect_garbage(force=True) == []
+    monkeypatch.setattr(upload_cache, "ORPHAN_GRACE_PERIOD", -1.0)
+    assert ours.collect_garbage(force=True) == [orphan.name]
+    assert remote_names(backend) == {their_file.name, unrelated.name}
+    assert theirs.lookup(upload_cache.file_sha256(videos[0])).name == their_file.name
+
+
+def test_the_namespace_survives_reopening_the_index(tmp_path):
+    path = str(tmp_path / "uploads.sqlite3")
+    assert UploadCache(path).display_name_prefix == UploadCache(path).display_name_prefix
+
+
+def _upload_from_process(db_path, paths):
+    set_backend(FakeBackend(upload_mbps=0, processing_seconds_per_mb=0))
+    cache = UploadCache(db_path)
+    for path in paths:
+        cache.get_or_upload(path)
+
+
+def test_processes_sharing_the_index_lose_no_entries(tmp_path):
+    paths = []
+    for n in range(100):
+        path = tmp_path / f"clip{n}.mp4"
+        path.write_bytes(f"clip {n}".encode())
+        paths.append(str(path))
+    db_path = str(tmp_path / "uploads.sqlite3")
+    context = multiprocessing.get_context("fork")
+    processes = [context.Process(target=_upload_from_process, args=(db_path, paths[i::4])) for i in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(timeout=60)
+        assert process.exitcode == 0
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM uploads").fetchone()[0] == 100
@@ -0,0 +1,267 @@
+import os
+import time
+import uuid
+import sqlite3
+import hashlib
+import threading
+import telemetry
+from google.api_core import exceptions as api_exceptions
+from backends import get_backend
+
+# --- Configuration ---
+# Everything the app keeps locally (caches, spool files, indexes) lives under this folder.
+CACHE_DIR = os.environ.get("REEL_CACHE_DIR", ".reel_cache")
+
+# Gemini keeps uploaded files for 48 hours. We stop trusting a handle a bit earlier
+# so a file never expires in the middle of an analysis.
+REMOTE_FILE_LIFETIME = 48 * 3600
+EXPIRY_SAFETY_MARGIN = 3600
+
+# Every file we upload gets a display name of this prefix, the namespace of the index that uploaded
+# it and the video's hash. The garbage collector only ever sweeps its own namespace, so indexes in
+# other directories or on other machines sharing the API key never delete each other's files.
+DISPLAY_NAME_PREFIX = "reel-cache-"
+
+# How often the remote file listing is scanned for orphans.
+GC_INTERVAL = 15 * 60
+# Files younger than this are never treated as orphans; another process may still be recording them.
+ORPHAN_GRACE_PERIOD = 10 * 60
+# A handle used this recently may still be part of a running analysis, so when it is evicted or
+# expires its remote file is kept this long after its last use before it is deleted.
+IN_USE_GRACE_PERIOD = 2 * 3600
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def file_sha256(path, chunk_size=HASH_CHUNK_SIZE):
+    """Returns the hex SHA-256 of a file on disk, reading it in fixed-size chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _remote_timestamp(remote_file, attribute):
+    """Returns a datetime attribute of a Gemini file as a unix timestamp, if the API reports one."""
+    value = getattr(remote_file, attribute, None)
+    if value is None:
+        return None
+    try:
+        return value.timestamp()
+    except (AttributeError, OverflowError, OSError, ValueError):
+        return None
+
+
+class UploadCache:
+    """
+    Content-addressed cache of Gemini file handles.
+
+    Maps the SHA-256 of a video's bytes to the remote file it was uploaded as, so the same
+    creative is only uploaded once no matter how many tabs, reruns or sessions analyze it.
+    Like ReportCache, the index is a WAL-mode SQLite database in CACHE_DIR and every call opens its
+    own short-lived connection, so every thread and process on this host can share it.
+
+    Handles that drop out of the index (LRU eviction, expiry, a concurrent upload of the same
+    video) are "retired" rather than deleted right away: their remote files are only deleted once
+    they have gone unused for IN_USE_GRACE_PERIOD, so an analysis still using one is not broken.
+    """
+
+    def __init__(self, db_path=None, ttl_seconds=REMOTE_FILE_LIFETIME - EXPIRY_SAFETY_MARGIN, max_entries=500):
+        self.db_path = db_path or os.path.join(CACHE_DIR, "uploads.sqlite3")
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.namespace = None
+        self._init_lock = threading.Lock()
+        self._initialized = False
+
+    def _connect(self):
+        if not self._initialized:
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        if not self._initialized:
+            with self._init_lock:
+                if not self._initialized:
+                    conn.execute("PRAGMA journal_mode=WAL")
+                    # BEGIN IMMEDIATE, so two processes opening a new index agree on one namespace.
+                    conn.execute("BEGIN IMMEDIATE")
+                    conn.execute("""CREATE TABLE IF NOT EXISTS uploads (
+                        digest TEXT PRIMARY KEY, name TEXT NOT NULL, size INTEGER NOT NULL,
+                        created_at REAL NOT NULL, last_used REAL NOT NULL, expires_at REAL NOT NULL)""")
+                    conn.execute("CREATE INDEX IF NOT EXISTS uploads_last_used ON uploads(last_used)")
+                    conn.execute("CREATE TABLE IF NOT EXISTS retired (name TEXT PRIMARY KEY, last_used REAL NOT NULL)")
+                    conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value REAL NOT NULL)")
+                    conn.execute("CREATE TABLE IF NOT EXISTS namespace (id TEXT NOT NULL)")
+                    if conn.execute("SELECT id FROM namespace").fetchone() is None:
+                        conn.execute("INSERT INTO namespace (id) VALUES (?)", (uuid.uuid4().hex[:12],))
+                    conn.commit()
+                    self.namespace = conn.execute("SELECT id FROM namespace").fetchone()[0]
+                    self._initialized = True
+        return conn
+
+    @property
+    def display_name_prefix(self):
+        """Display name prefix of every file uploaded through this index."""
+        if self.namespace is None:
+            self._connect().close()
+        return f"{DISPLAY_NAME_PREFIX}{self.namespace}-"
+
+    @staticmethod
+    def _retire(conn, name, last_used):
+        conn.execute("INSERT INTO retired (name, last_used) VALUES (?, ?) ON CONFLICT(name) DO UPDATE SET last_used = MAX(last_used, excluded.last_used)", (name, last_used))
+
+    # --- Public API ---
+    def lookup(self, digest):
+        """Returns the live remote file cached for `digest`, or None if it must be uploaded."""
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT name, expires_at FROM uploads WHERE digest = ?", (digest,)).fetchone()
+        finally:
+            conn.close()
+        if row is None or row[1] <= time.time():
+            # Expired handles are left to collect_garbage, which waits until they are no longer in use.
+            return None
+        try:
+            remote_file = get_backend().get_file(name=row[0])
+        except (api_exceptions.NotFound, api_exceptions.PermissionDenied):
+            # The handle is gone (deleted or expired remotely). Another job may still hold it, so it is
+            # retired rather than dropped; any other error (e.g. a network hiccup) propagates to the caller's retries.
+            self._retire_entry(digest)
+            return None
+        if remote_file.state.name not in ("ACTIVE", "PROCESSING"):
+            self.invalidate(digest)
+            return None
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute("UPDATE uploads SET last_used = ? WHERE digest = ? AND name = ?", (time.time(), digest, row[0]))
+        finally:
+            conn.close()
+        return remote_file
+
+    def get_or_upload(self, path, digest=None):
+        """Returns a remote file for the video at `path`, uploading it only on a cache miss."""
+        digest = digest or file_sha256(path)
+        remote_file = self.lookup(digest)
+        if remote_file is not None:
+            telemetry.count("cache_hits", cache="upload")
+            return remote_file
+
+        telemetry.count("cache_misses", cache="upload")
+        remote_file = get_backend().upload_file(path=path, display_name=f"{self.display_name_prefix}{digest[:32]}")
+        now = time.time()
+        expires_at = now + self.ttl_seconds
+        remote_expiry = _remote_timestamp(remote_file, "expiration_time")
+        if remote_expiry is not None:
+            expires_at = min(expires_at, remote_expiry - EXPIRY_SAFETY_MARGIN)
+        size = os.path.getsize(path)
+
+        conn = self._connect()
+        try:
+            with conn:
+                # Another process may have uploaded the same video meanwhile; its handle may be in use.
+                previous = conn.execute("SELECT name, last_used FROM uploads WHERE digest = ?", (digest,)).fetchone()
+                if previous is not None and previous[0] != remote_file.name:
+                    self._retire(conn, *previous)
+                conn.execute(
+                    "INSERT OR REPLACE INTO uploads (digest, name, size, created_at, last_used, expires_at) VALUES (?, ?, ?, ?, ?, ?)",
+                    (digest, remote_file.name, size, now, now, expires_at),
+                )
+                # LRU eviction once the index grows past its cap.
+                overflow = conn.execute("SELECT COUNT(*) FROM uploads").fetchone()[0] - self.max_entries
+                if overflow > 0:
+                    for old_digest, old_name, old_last_used in conn.execute("SELECT digest, name, last_used FROM uploads ORDER BY last_used LIMIT ?", (overflow,)).fetchall():
+                        conn.execute("DELETE FROM uploads WHERE digest = ?", (old_digest,))
+                        self._retire(conn, old_name, old_last_used)
+        finally:
+            conn.close()
+        telemetry.count("bytes_uploaded", size)
+        return remote_file
+
+    def invalidate(self, digest):
+        """Drops `digest` from the cache and deletes its remote file (e.g. after processing FAILED)."""
+        name = self._drop(digest)
+        if name:
+            self._delete_remote(name)
+
+    def collect_garbage(self, force=False):
+        """
+        Deletes remote files that were retired (evicted or expired) and have not been used for
+        IN_USE_GRACE_PERIOD, and orphans (uploaded through this index but never recorded, e.g. because
+        a run crashed mid-way). Runs at most once per GC_INTERVAL unless forced.
+        Returns the names of the remote files that were deleted.
+        """
+        now = time.time()
+        conn = self._connect()
+        conn.isolation_level = None
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                last_gc = conn.execute("SELECT value FROM meta WHERE key = 'last_gc'").fetchone()
+                if not force and last_gc and now - last_gc[0] < GC_INTERVAL:
+                    conn.execute("ROLLBACK")
+                    return []
+                for name, last_used in conn.execute("SELECT name, last_used FROM uploads WHERE expires_at <= ?", (now,)).fetchall():
+                    self._retire(conn, name, last_used)
+                conn.execute("DELETE FROM uploads WHERE expires_at <= ?", (now,))
+                retired_names = [row[0] for row in conn.execute("SELECT name FROM retired WHERE last_used < ?", (now - IN_USE_GRACE_PERIOD,))]
+                conn.execute("DELETE FROM retired WHERE last_used < ?", (now - IN_USE_GRACE_PERIOD,))
+                known_names = {row[0] for row in conn.execute("SELECT name FROM uploads UNION SELECT name FROM retired")}
+                conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('last_gc', ?)", (now,))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        finally:
+            conn.close()
+
+        prefix = self.display_name_prefix
+        deleted = []
+        for name in retired_names:
+            if self._delete_remote(name):
+                deleted.append(name)
+        try:
+            remote_files = list(get_backend().list_files())
+        except Exception:
+            remote_files = []
+        for remote_file in remote_files:
+            display_name = getattr(remote_file, "display_name", "") or ""
+            if not display_name.startswith(prefix) or remote_file.name in known_names or remote_file.name in retired_names:
+                continue
+            created_at = _remote_timestamp(remote_file, "create_time")
+            if created_at is None or now - created_at > ORPHAN_GRACE_PERIOD:
+                if self._delete_remote(remote_file.name):
+                    deleted.append(remote_file.name)
+        return deleted
+
+    # --- Internals ---
+    def _drop(self, digest):
+        """Removes `digest` from the index; returns the remote name it pointed at, if any."""
+        conn = self._connect()
+        try:
+            with conn:
+                row = conn.execute("SELECT name FROM uploads WHERE digest = ?", (digest,)).fetchone()
+                conn.execute("DELETE FROM uploads WHERE digest = ?", (digest,))
+        finally:
+            conn.close()
+        return row[0] if row else None
+
+    def _retire_entry(self, digest):
+        """Removes `digest` from the index and retires its remote file, so GC deletes it once unused."""
+        conn = self._connect()
+        try:
+            with conn:
+                row = conn.execute("SELECT name, last_used FROM uploads WHERE digest = ?", (digest,)).fetchone()
+                if row is not None:
+                    conn.execute("DELETE FROM uploads WHERE digest = ?", (digest,))
+                    self._retire(conn, *row)
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _delete_remote(name):
+        try:
+            get_backend().delete_file(name=name)
+            return True
+        except Exception:
+            return False
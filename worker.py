@@ -0,0 +1,253 @@
+import os
+import time
+import uuid
+import socket
+import sqlite3
+import argparse
+import threading
+import multiprocessing
+import telemetry
+from backends import get_backend
+from upload_cache import UploadCache
+from report_cache import ReportCache
+from pipeline import upload_one, upload_many
+from poller import StatusPoller
+from preprocess import collect_media, preprocess_video
+from campaign_analysis import REPORT_MODEL, campaign_report_key, generate_campaign_report
+from jobs import HEARTBEAT_INTERVAL, JobStore, collect_spool
+
+# --- Configuration ---
+# Jobs one worker process runs at once. A job spends most of its time waiting on the network,
+# so a few per process is cheap; the upload, map and poll stages have their own thread pools.
+WORKER_CONCURRENCY = int(os.environ.get("REEL_WORKER_CONCURRENCY", "2"))
+WORKER_PROCESSES = int(os.environ.get("REEL_WORKER_PROCESSES", "2"))
+# How long an idle worker waits before asking the queue for work again.
+IDLE_POLL_INTERVAL = 1.0
+# The report written so far is saved at most this often while it streams in.
+PARTIAL_REPORT_INTERVAL = 1.0
+# How often each worker prunes old jobs and spooled videos.
+MAINTENANCE_INTERVAL = 15 * 60
+
+
+# --- Campaign Stages ---
+def upload_campaign_file(path, digest, upload_cache, preprocess=False, hook_clip=False, map_reduce=False):
+    """
+    Pushes one spooled video through the upload pipeline, optionally transcoding it to a small proxy
+    (plus, for map-reduce runs, whose map step is the only one that uses it, a hook clip) with ffmpeg
+    first. Returns {"digest", "remote_file", "upload_key", "bytes_saved"} and "hook_file" when a hook
+    clip was uploaded.
+    """
+    hook_clip = hook_clip and map_reduce
+    if not preprocess:
+        result = upload_one(path, upload_cache, digest=digest)
+        result.update(upload_key=digest, bytes_saved=0)
+        return result
+    media = preprocess_video(path, digest, make_hook=hook_clip)
+    result = upload_one(media["proxy_path"], upload_cache, digest=media["proxy_key"])
+    result.update(digest=digest, upload_key=media["proxy_key"], bytes_saved=media["bytes_saved"])
+    if media["hook_path"]:
+        result["hook_file"] = upload_one(media["hook_path"], upload_cache, digest=media["hook_key"])["remote_file"]
+    return result
+
+
+def run_campaign_job(job_id, payload, store, upload_cache=None, report_cache=None):
+    """
+    Runs a whole campaign analysis: upload -> remote processing -> report, reporting progress to
+    `store` as it goes. `payload` is what the app submitted: {"funnel_stage", "files": [{"name",
+    "path", "digest"}], "kpis", "map_reduce", "force_refresh", "preprocess", "hook_clip", "media"}.
+    Returns {"report", "report_key", "warnings"}.
+    """
+    upload_cache = upload_cache or UploadCache()
+    report_cache = report_cache or ReportCache()
+    funnel_stage, media = payload["funnel_stage"], payload.get("media", "original")
+    progress = {"stage": "uploading", "files": {f["name"]: "queued" for f in payload["files"]}, "bytes_saved": 0, "warnings": []}
+    store.update_progress(job_id, progress)
+
+    # Stage 1: upload (or reuse) every video.
+    with telemetry.span("upload_cache_gc"):
+        upload_cache.collect_garbage()
+    def on_upload(done, total, outcome):
+        name = outcome["item"]["name"]
+        if outcome["error"] is not None:
+            progress["files"][name] = "failed"
+            progress["warnings"].append(f"'{name}' was left out of the report: upload failed ({outcome['error']})")
+        else:
+            progress["files"][name] = "processing"
+            progress["bytes_saved"] += outcome["result"]["bytes_saved"]
+        store.update_progress(job_id, progress)
+    outcomes = upload_many(payload["files"], lambda f: upload_campaign_file(f["path"], f["digest"], upload_cache, payload.get("preprocess"), payload.get("hook_clip"), payload.get("map_reduce", False)), on_progress=on_upload)
+
+    files_info = []
+    for outcome in outcomes:
+        if outcome["error"] is None:
+            result = outcome["result"]
+            remote_file, hook_file = result["remote_file"], result.get("hook_file")
+            files_info.append({"original_filename": outcome["item"]["name"], "api_file_name": remote_file.name, "digest": result["digest"], "upload_key": result["upload_key"], "media": media,
+                               "size": getattr(remote_file, "size_bytes", 0), "remote_state": remote_file.state.name,
+                               "hook_api_file_name": hook_file.name if hook_file else None, "hook_remote_state": hook_file.state.name if hook_file else None})
+    if not files_info:
+        raise RuntimeError("None of the videos could be uploaded.")
+
+    # Stage 2: wait for Gemini to finish processing every file.
+    progress["stage"] = "processing"
+    store.update_progress(job_id, progress)
+    def on_change(states):
+        for info in files_info:
+            if states.get(info["api_file_name"]) == "ACTIVE": progress["files"][info["original_filename"]] = "ready"
+        store.update_progress(job_id, progress)
+    tracked = {f["api_file_name"]: {"size": f["size"], "state": f["remote_state"]} for f in files_info}
+    tracked.update({f["hook_api_file_name"]: {"state": f["hook_remote_state"]} for f in files_info if f["hook_api_file_name"]})
+    with telemetry.span("remote_processing", files=len(tracked)) as record:
+        poller = StatusPoller(tracked, on_change=on_change)
+        states = poller.wait()
+        record["polls"] = poller.api_calls
+
+    active_files_info = []
+    for info in files_info:
+        if info["hook_api_file_name"] and states.get(info["hook_api_file_name"]) != "ACTIVE":
+            info["hook_api_file_name"] = None
+        if states.get(info["api_file_name"]) == "ACTIVE":
+            progress["files"][info["original_filename"]] = "ready"
+            active_files_info.append(info)
+        else:
+            progress["files"][info["original_filename"]] = "failed"
+            progress["warnings"].append(f"'{info['original_filename']}' was left out of the report: processing failed.")
+            upload_cache.invalidate(info["upload_key"])
+    if not active_files_info:
+        raise RuntimeError("Processing failed for every video.")
+
+    # Stage 3: write the report, saving the text so far so the app can show it while it streams.
+    progress["stage"] = "writing"
+    store.update_progress(job_id, progress)
+    last_saved = 0.0
+    def on_text(text):
+        nonlocal last_saved
+        if time.monotonic() - last_saved >= PARTIAL_REPORT_INTERVAL:
+            store.update_progress(job_id, partial_report=text)
+            last_saved = time.monotonic()
+    report_text, covered, warnings = generate_campaign_report(
+        active_files_info, payload["kpis"], funnel_stage, payload.get("map_reduce", False), report_cache, payload.get("force_refresh", False), on_text=on_text,
+    )
+    report_key = campaign_report_key({info["original_filename"]: info["digest"] for info in covered}, payload["kpis"], funnel_stage, payload.get("map_reduce", False), media)
+    report_cache.put(report_key, report_text, meta={"funnel_stage": funnel_stage, "model": REPORT_MODEL, "map_reduce": payload.get("map_reduce", False)})
+    # Remote files stay in the upload cache for reuse; the cache's GC deletes them once they expire.
+    return {"report": report_text, "report_key": report_key, "warnings": progress["warnings"] + warnings}
+
+
+JOB_HANDLERS = {
+    "campaign": run_campaign_job,
+}
+
+
+# --- Worker ---
+class Worker:
+    """
+    Claims jobs from the JobStore and runs them on `concurrency` threads, with a heartbeat thread
+    that keeps the worker and its running jobs marked alive. A job whose worker dies is picked up
+    again by another worker once its heartbeat goes stale.
+    """
+
+    def __init__(self, store=None, concurrency=WORKER_CONCURRENCY, worker_id=None):
+        self.store = store or JobStore()
+        self.concurrency = max(1, concurrency)
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self._running = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        if not self._threads:
+            self.store.heartbeat(self.worker_id)
+            self._threads.append(threading.Thread(target=self._heartbeat_loop, name="job-heartbeat", daemon=True))
+            self._threads += [threading.Thread(target=self._job_loop, name=f"job-worker-{i}", daemon=True) for i in range(self.concurrency)]
+            for thread in self._threads:
+                thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def wait(self):
+        """Blocks until `stop()` is called."""
+        while not self._stop.wait(1.0):
+            pass
+
+    def run_job(self, job):
+        with self._lock:
+            self._running.add(job["id"])
+        try:
+            # The job id doubles as the telemetry run id, so the app can show this job's waterfall.
+            with telemetry.run(job["id"]), telemetry.span("job", kind=job["kind"], attempt=job["attempts"], queue_wait_s=job["started_at"] - job["created_at"]):
+                result = JOB_HANDLERS[job["kind"]](job["id"], job["payload"], self.store)
+            self.store.complete(job["id"], result)
+        except Exception as e:
+            self.store.fail(job["id"], f"{type(e).__name__}: {e}")
+        finally:
+            with self._lock:
+                self._running.discard(job["id"])
+
+    def _job_loop(self):
+        while not self._stop.is_set():
+            try:
+                job = self.store.claim(self.worker_id)
+            except sqlite3.OperationalError:
+                # Database busy; another worker is claiming. Try again shortly.
+                job = None
+            if job is None:
+                self._stop.wait(IDLE_POLL_INTERVAL)
+                continue
+            self.run_job(job)
+
+    def _heartbeat_loop(self):
+        last_maintenance = 0.0
+        while not self._stop.wait(HEARTBEAT_INTERVAL):
+            with self._lock:
+                running = list(self._running)
+            try:
+                self.store.heartbeat(self.worker_id, running)
+                if time.monotonic() - last_maintenance >= MAINTENANCE_INTERVAL:
+                    self.store.prune()
+                    collect_spool()
+                    collect_media()
+                    last_maintenance = time.monotonic()
+            except sqlite3.Error:
+                pass
+
+
+def _worker_process(concurrency, metrics_port=None):
+    """Entry point of one worker process."""
+    if get_backend().requires_api_key:
+        get_backend().configure(api_key=os.environ["GOOGLE_API_KEY"])
+    telemetry.start_metrics_server(metrics_port)
+    worker = Worker(concurrency=concurrency).start()
+    try:
+        worker.wait()
+    except KeyboardInterrupt:
+        worker.stop()
+
+
+if __name__ == "__main__":
+    # Runs analysis jobs queued by app.py. Start it on the app's host with the same REEL_CACHE_DIR (the
+    # SQLite job queue needs a local filesystem, see jobs.py): export GOOGLE_API_KEY=... && python worker.py
+    parser = argparse.ArgumentParser(description="Run queued campaign analyses.")
+    parser.add_argument("--processes", type=int, default=WORKER_PROCESSES, help="Number of worker processes.")
+    parser.add_argument("--concurrency", type=int, default=WORKER_CONCURRENCY, help="Jobs each process runs at once.")
+    parser.add_argument("--metrics-port", type=int, default=telemetry.METRICS_PORT, help="Serve Prometheus metrics here (process i uses port + i).")
+    args = parser.parse_args()
+
+    if args.processes <= 1:
+        _worker_process(args.concurrency, args.metrics_port)
+    else:
+        # "spawn" rather than fork: each process sets up its own gRPC channels.
+        context = multiprocessing.get_context("spawn")
+        processes = [context.Process(target=_worker_process, args=(args.concurrency, args.metrics_port + i if args.metrics_port else None), name=f"reel-worker-{i}") for i in range(args.processes)]
+        for process in processes:
+            process.start()
+        print(f"Started {args.processes} worker processes x {args.concurrency} jobs each. Press Ctrl+C to stop.")
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            for process in processes:
+                process.terminate()